@@ -0,0 +1,25 @@
+"""
+Liveness / readiness controller logic.
+"""
+
+from app.roles import SERVICE_ROLES, has_role, get_import_report
+from app.ml.executor import get_stats
+from app.ml.warmup import get_readiness, get_uptime_seconds
+
+
+def get_health() -> dict:
+    """Liveness: the process is up and the event loop is responsive."""
+    return {
+        "status": "ok",
+        "uptime_seconds": get_uptime_seconds(),
+        "inference": get_stats(),
+        "roles": SERVICE_ROLES,
+        "import_ms": get_import_report(),
+    }
+
+
+def get_ready() -> dict:
+    """Readiness: all models are loaded and warmed up (ready at once without the ml role)."""
+    if not has_role("ml"):
+        return {"ready": True, "models": {}, "warmup_ms": None, "error": None}
+    return get_readiness()
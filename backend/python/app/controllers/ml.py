@@ -2,41 +2,40 @@
 ML-related controller logic (classifier, NER retraining, etc).
 """
 
+import sys
 import json
-import csv
 import logging
 import subprocess
 from pathlib import Path
-from typing import List
+from typing import AsyncIterator, Callable, List, Optional
 from threading import Thread
 
-from app.ml.classifier import classify_email_func, reload_classifier_model
-from app.ml.type_classifier import classify_transaction_type, reload_type_classifier_model
+from app.ml.classifier import classify_email_func
+from app.ml.type_classifier import classify_transaction_type
+from app.ml.joint_classifier import classify_joint
 from app.ml.ner import extract_entities
+from app.ml.registry import registry, MODEL_SPECS, MODELS_DIR
+from app.ml.preprocess import normalize_text
+from app.ml import metrics, templates, domain_prior, bulk, resources, jobs, store
 from app.schemas import NerTrainingSample, ClassifierTrainingSample, TypeClassifierTrainingSample
 from app.utils import get_next_model_dir
 
 logger = logging.getLogger(__name__)
 
-DATA_DIR = Path("app/ml/data")
-JSONL_PATH = DATA_DIR / "ner_spacy.jsonl"
-CLASSIFIER_CSV_PATH = DATA_DIR / "classifier_data.csv"
-TYPE_CLASSIFIER_CSV_PATH = DATA_DIR / "type_classifier_data.csv"
-MODELS_DIR = Path("app/models")
-LOCK_FILE = Path("app/ml/.retrain.lock")
-CLASSIFIER_LOCK_FILE = Path("app/ml/.retrain_classifier.lock")
-TYPE_CLASSIFIER_LOCK_FILE = Path("app/ml/.retrain_type_classifier.lock")
+CLASSIFIER_MODEL_PATH = MODELS_DIR / "email_classifier.joblib"
+TYPE_CLASSIFIER_MODEL_PATH = MODELS_DIR / "type_classifier.joblib"
+JOINT_CLASSIFIER_MODEL_PATH = MODELS_DIR / "joint_classifier.joblib"
 
 
 # ==========================================================
 # CLASSIFICATION
 # ==========================================================
 
-def classify_email(email_body: str) -> dict:
+def classify_email(email_body: str, from_email: Optional[str] = None) -> dict:
     if not email_body or not email_body.strip():
         raise ValueError("email_body cannot be empty")
 
-    result = classify_email_func(email_body)
+    result = classify_email_func(email_body, from_email)
 
     if result.get("error"):
         logger.error(f"Classification error: {result['error']}")
@@ -45,11 +44,11 @@ def classify_email(email_body: str) -> dict:
     return result
 
 
-def classify_txn_type(email_body: str) -> dict:
+def classify_txn_type(email_body: str, from_email: Optional[str] = None) -> dict:
     if not email_body or not email_body.strip():
         raise ValueError("email_body cannot be empty")
 
-    result = classify_transaction_type(email_body)
+    result = classify_transaction_type(email_body, from_email)
 
     if result.get("error"):
         logger.error(f"Txn type classification error: {result['error']}")
@@ -58,11 +57,33 @@ def classify_txn_type(email_body: str) -> dict:
     return result
 
 
-def extract_ner_entities(email_body: str) -> dict:
+def classify_joint_email(email_body: str, from_email: Optional[str] = None) -> dict:
     if not email_body or not email_body.strip():
         raise ValueError("email_body cannot be empty")
 
-    result = extract_entities(email_body)
+    result = classify_joint(email_body, from_email)
+
+    if result.get("error"):
+        logger.error(f"Joint classification error: {result['error']}")
+        raise RuntimeError(result["error"])
+
+    return result
+
+
+def process_email_stream(chunks: AsyncIterator[bytes], lean: bool = False) -> AsyncIterator[bytes]:
+    """NDJSON emails in, NDJSON results out (see app/ml/bulk.py)."""
+    return bulk.stream_results(chunks, lean)
+
+
+def extract_ner_entities(
+    email_body: str,
+    labels: Optional[List[str]] = None,
+    from_email: Optional[str] = None,
+) -> dict:
+    if not email_body or not email_body.strip():
+        raise ValueError("email_body cannot be empty")
+
+    result = extract_entities(email_body, labels, from_email)
 
     if result.get("error"):
         logger.error(f"NER extraction error: {result['error']}")
@@ -72,270 +93,448 @@ def extract_ner_entities(email_body: str) -> dict:
 
 
 # ==========================================================
-# NER RETRAINING (ASYNC)
+# NER RETRAINING (QUEUED)
 # ==========================================================
 
 def retrain_ner_model(samples: List[NerTrainingSample]) -> dict:
     """
     Public entrypoint.
-    Starts retraining in background thread.
+    Appends the samples to the training data and queues a fine-tune
+    (coalesced with any retrain still waiting to run).
     """
 
     if not samples:
         raise ValueError("No training samples provided")
 
-    # Atomic lock creation
-    try:
-        LOCK_FILE.open("x").close()
-    except FileExistsError:
-        return {
-            "success": False,
-            "samples_added": 0,
-            "message": "Retraining already in progress",
-        }
-
-    # Start background training
-    thread = Thread(target=_run_retraining_pipeline, args=(samples,))
-    thread.daemon = True
-    thread.start()
+    samples = _append_ner_samples(samples)
+    if not samples:
+        return _no_new_samples()
+    job = jobs.enqueue("ner", samples=len(samples))
 
     return {
         "success": True,
         "samples_added": len(samples),
-        "message": "NER retraining started in background",
+        "job_id": job["id"],
+        "message": f"NER retraining queued as job {job['id']}",
     }
 
 
-def _run_retraining_pipeline(samples: List[NerTrainingSample]) -> None:
+def rebuild_ner_model() -> dict:
     """
-    Actual retraining pipeline (runs in background thread).
+    Full from-scratch NER training on the whole corpus, for a scheduled job.
+    Regular retrains fine-tune the active model instead.
     """
+    job = jobs.enqueue("ner", mode="full")
 
-    logger.info("🚀 NER retraining started")
+    return {
+        "success": True,
+        "samples_added": 0,
+        "job_id": job["id"],
+        "message": f"Full NER rebuild queued as job {job['id']}",
+    }
 
-    try:
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
-
-        # --------------------------------------------------
-        # 1️⃣ Append to JSONL (with flush for integrity)
-        # --------------------------------------------------
-        with open(JSONL_PATH, "a", encoding="utf-8") as f:
-            for sample in samples:
-
-                # Validate entity spans
-                for start, end, label in sample.entities:
-                    if start < 0 or end > len(sample.text) or start >= end:
-                        raise ValueError(
-                            f"Invalid entity span: {(start, end, label)}"
-                        )
-
-                record = {
-                    "text": sample.text,
-                    "entities": sample.entities,
-                }
-
-                json.dump(record, f, ensure_ascii=False)
-                f.write("\n")
-                f.flush()  # ensures disk write integrity
-
-        logger.info(f"✅ Appended {len(samples)} samples to JSONL")
-
-        # --------------------------------------------------
-        # 2️⃣ Create DocBin
-        # --------------------------------------------------
-        _run_subprocess([
-            "uv", "run",
-            "scripts/create_docbin_from_jsonl.py",
-            str(JSONL_PATH),
-            "app/ml/data/ner.spacy",
-        ])
-
-        # --------------------------------------------------
-        # 3️⃣ Split train/dev
-        # --------------------------------------------------
-        _run_subprocess([
-            "uv", "run",
-            "app/ml/split.py",
-        ])
 
-        # --------------------------------------------------
-        # 4️⃣ Train spaCy (versioned model)
-        # --------------------------------------------------
-        model_output_dir = get_next_model_dir()
+def _run_ner_job(job: dict, report_progress: Callable[[dict], None]) -> str:
+    """
+    NER queue handler (runs on a job thread). Trains on everything in the
+    JSONL, so it covers all requests coalesced into the job.
+    """
+
+    logger.info(f"🚀 NER retraining started ({job['mode'] or 'default'} mode, {job['samples']} new samples)")
+
+    # Templates only need the JSONL, refresh them before training
+    templates.rebuild_index(store.training_source("ner"))
+
+    # --------------------------------------------------
+    # JSONL → Docs → train/dev → spaCy train (versioned model)
+    # --------------------------------------------------
+    model_output_dir = get_next_model_dir()
+    _train_ner(model_output_dir, job["mode"], report_progress)
+
+    registry.publish("ner", model_output_dir.name)
+
+    logger.info(f"🎯 Training complete → {model_output_dir.name}")
+    return model_output_dir.name
+
+
+def _train_ner(
+    output_dir: Path,
+    mode: Optional[str] = None,
+    report_progress: Optional[Callable[[dict], None]] = None,
+) -> None:
+    """
+    Train in one child process (see app/ml/ner_training.py) whose progress
+    events are read from its stdout, or on this thread when
+    ML_NER_TRAIN_ISOLATION=thread. `mode` defaults to ML_NER_TRAIN_MODE
+    (fine-tune the active model).
+    """
+    from app.ml import ner_training
+
+    mode = mode or ner_training.ML_NER_TRAIN_MODE
+
+    def on_progress(event: dict) -> None:
+        _log_ner_progress(event)
+        if report_progress is not None:
+            report_progress(event)
+
+    if ner_training.ML_NER_TRAIN_ISOLATION != "thread":
+        def on_output(line: str) -> None:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.info(line)
+                return
+            on_progress(event)
 
         _run_subprocess([
-            "uv", "run",
-            "spacy", "train",
-            "app/config.cfg",
-            "--output", str(model_output_dir),
-            "--paths.train", "app/ml/data/train.spacy",
-            "--paths.dev", "app/ml/data/dev.spacy",
-        ])
+            sys.executable, "-m", "app.ml.ner_training",
+            str(store.training_source("ner")),
+            str(output_dir),
+            mode,
+        ], on_output=on_output)
+        return
 
-        logger.info(f"🎯 Training complete → {model_output_dir.name}")
+    with resources.training_slot() as slot:
+        logger.info(f"Training NER in-process (training slot {slot}, {mode}) → {output_dir.name}")
+        resources.apply_thread_training_policy()
+        ner_training.train_ner(store.training_source("ner"), output_dir, on_progress=on_progress, mode=mode)
 
-    except Exception as e:
-        logger.exception(f"❌ Retraining failed: {e}")
 
-    finally:
-        # Always remove lock
-        if LOCK_FILE.exists():
-            LOCK_FILE.unlink()
-        logger.info("🔓 Retraining lock released")
+def _log_ner_progress(event: dict) -> None:
+    logger.info(f"📈 NER training: {json.dumps(event)}")
+
+
+def _no_new_samples() -> dict:
+    return {
+        "success": True,
+        "samples_added": 0,
+        "message": "All samples are already in the training data, nothing to retrain",
+    }
 
 
 # ==========================================================
-# CLASSIFIER RETRAINING (ASYNC)
+# CLASSIFIER RETRAINING (QUEUED)
 # ==========================================================
 
 def retrain_classifier_model(samples: List[ClassifierTrainingSample]) -> dict:
     if not samples:
         raise ValueError("No training samples provided")
 
-    try:
-        CLASSIFIER_LOCK_FILE.open("x").close()
-    except FileExistsError:
+    samples = _append_classifier_samples(samples)
+    if not samples:
+        return _no_new_samples()
+
+    if _use_online_update("classifier", samples):
+        version = _apply_online_update("classifier", samples)
+        if version is not None:
+            return {
+                "success": True,
+                "samples_added": len(samples),
+                "message": f"Classifier updated online → {version}",
+            }
+        # Enough online updates since the last refit: refit on the whole CSV
+        job = jobs.enqueue("classifier", samples=len(samples))
         return {
-            "success": False,
-            "samples_added": 0,
-            "message": "Classifier retraining already in progress",
+            "success": True,
+            "samples_added": len(samples),
+            "job_id": job["id"],
+            "message": f"Classifier updated online, full refit queued as job {job['id']}",
         }
 
-    thread = Thread(target=_run_classifier_retraining_pipeline, args=(samples,))
-    thread.daemon = True
-    thread.start()
+    job = jobs.enqueue("classifier", samples=len(samples))
 
     return {
         "success": True,
         "samples_added": len(samples),
-        "message": "Classifier retraining started in background",
+        "job_id": job["id"],
+        "message": f"Classifier retraining queued as job {job['id']}",
     }
 
 
-def _run_classifier_retraining_pipeline(samples: List[ClassifierTrainingSample]) -> None:
-    logger.info("🚀 Classifier retraining started")
-    try:
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
-        _append_classifier_samples_to_csv(samples)
+def _run_classifier_job(job: dict, report_progress: Callable[[dict], None]) -> str:
+    logger.info(f"🚀 Classifier retraining started ({job['samples']} new samples)")
+    domain_prior.rebuild("classifier")
 
-        _run_subprocess([
-            "uv", "run",
-            "app/ml/train_classifier.py",
-            str(CLASSIFIER_CSV_PATH),
-        ])
+    version = _train_classifier("classifier", "app/ml/train_classifier.py", CLASSIFIER_MODEL_PATH)
+    logger.info(f"🎯 Classifier training complete → {version}")
 
-        reload_classifier_model()
-        logger.info("🎯 Classifier training complete")
-    except Exception as e:
-        logger.exception(f"❌ Classifier retraining failed: {e}")
-    finally:
-        if CLASSIFIER_LOCK_FILE.exists():
-            CLASSIFIER_LOCK_FILE.unlink()
-        logger.info("🔓 Classifier retraining lock released")
+    _queue_joint_classifier()
+    return version
 
 
 # ==========================================================
-# TYPE CLASSIFIER RETRAINING (ASYNC)
+# TYPE CLASSIFIER RETRAINING (QUEUED)
 # ==========================================================
 
 def retrain_type_classifier_model(samples: List[TypeClassifierTrainingSample]) -> dict:
     if not samples:
         raise ValueError("No training samples provided")
 
-    try:
-        TYPE_CLASSIFIER_LOCK_FILE.open("x").close()
-    except FileExistsError:
+    samples = _append_type_classifier_samples(samples)
+    if not samples:
+        return _no_new_samples()
+
+    if _use_online_update("type_classifier", samples):
+        version = _apply_online_update("type_classifier", samples)
+        if version is not None:
+            return {
+                "success": True,
+                "samples_added": len(samples),
+                "message": f"Type classifier updated online → {version}",
+            }
+        # Enough online updates since the last refit: refit on the whole CSV
+        job = jobs.enqueue("type_classifier", samples=len(samples))
         return {
-            "success": False,
-            "samples_added": 0,
-            "message": "Type classifier retraining already in progress",
+            "success": True,
+            "samples_added": len(samples),
+            "job_id": job["id"],
+            "message": f"Type classifier updated online, full refit queued as job {job['id']}",
         }
 
-    thread = Thread(target=_run_type_classifier_retraining_pipeline, args=(samples,))
-    thread.daemon = True
-    thread.start()
+    job = jobs.enqueue("type_classifier", samples=len(samples))
 
     return {
         "success": True,
         "samples_added": len(samples),
-        "message": "Type classifier retraining started in background",
+        "job_id": job["id"],
+        "message": f"Type classifier retraining queued as job {job['id']}",
     }
 
 
-def _run_type_classifier_retraining_pipeline(samples: List[TypeClassifierTrainingSample]) -> None:
-    logger.info("🚀 Type classifier retraining started")
-    try:
-        DATA_DIR.mkdir(parents=True, exist_ok=True)
-        _append_type_classifier_samples_to_csv(samples)
+def _run_type_classifier_job(job: dict, report_progress: Callable[[dict], None]) -> str:
+    logger.info(f"🚀 Type classifier retraining started ({job['samples']} new samples)")
+    domain_prior.rebuild("type_classifier")
 
-        _run_subprocess([
-            "uv", "run",
-            "app/ml/train_type_classifier.py",
-            str(TYPE_CLASSIFIER_CSV_PATH),
-        ])
+    version = _train_classifier("type_classifier", "app/ml/train_type_classifier.py", TYPE_CLASSIFIER_MODEL_PATH)
+    logger.info(f"🎯 Type classifier training complete → {version}")
 
-        reload_type_classifier_model()
-        logger.info("🎯 Type classifier training complete")
-    except Exception as e:
-        logger.exception(f"❌ Type classifier retraining failed: {e}")
-    finally:
-        if TYPE_CLASSIFIER_LOCK_FILE.exists():
-            TYPE_CLASSIFIER_LOCK_FILE.unlink()
-        logger.info("🔓 Type classifier retraining lock released")
+    _queue_joint_classifier()
+    return version
+
+
+def _train_classifier(name: str, script: str, model_path: Path) -> str:
+    """Full training of `name` on its training data in the configured model family, then promote."""
+    from app.ml import online
+
+    source = str(store.training_source(name))
+    if online.ML_CLASSIFIER_FAMILY == "online":
+        _run_subprocess([sys.executable, "-m", "app.ml.online", "refit", name, source])
+        model_path = online.checkpoint_path(name)
+    else:
+        _run_subprocess(["uv", "run", script, source])
+
+    version = registry.register_artifact(name, model_path)
+    registry.promote(name, version)
+    return version
 
 
 # ==========================================================
-# SUBPROCESS HELPER (WITH DEBUGGING)
+# ONLINE CLASSIFIER UPDATES (SYNC)
 # ==========================================================
 
-def _run_subprocess(command: List[str]) -> None:
+def _use_online_update(name: str, samples: list) -> bool:
+    from app.ml import online
+
+    return (
+        online.ML_CLASSIFIER_FAMILY == "online"
+        and len(samples) <= online.ML_ONLINE_SYNC_MAX_SAMPLES
+        and online.has_checkpoint(name)
+    )
+
+
+def _apply_online_update(name: str, samples: list) -> Optional[str]:
     """
-    Runs subprocess with stdout/stderr capture + logging.
+    Fold already appended samples into the online model with
+    `partial_fit`, in the request. Returns the promoted version, or None
+    when a full refit is due.
     """
+    from app.ml import online
 
-    logger.info(f"Running command: {' '.join(command)}")
+    domain_prior.add(name, [s.model_dump() for s in samples])
 
-    result = subprocess.run(
-        command,
-        capture_output=True,
-        text=True,
-    )
+    online.update(name, [normalize_text(s.text) for s in samples], [s.label for s in samples])
+    version = registry.register_artifact(name, online.checkpoint_path(name))
+    registry.promote(name, version)
+    logger.info(f"⚡ {name} updated online → {version}")
+
+    if online.needs_refit(name):
+        logger.info(f"🔁 {name}: {online.ML_ONLINE_REFIT_EVERY} online updates since last refit, refitting")
+        return None
+    return version
+
+
+# ==========================================================
+# JOINT CLASSIFIER RETRAINING (QUEUED)
+# ==========================================================
+
+def _queue_joint_classifier() -> None:
+    """
+    Keep the joint classifier in step with the classifier CSVs. Only once
+    a joint model has been trained and registered; runs after both
+    classifier jobs coalesce into one joint job.
+    """
+    if registry.get_model("joint_classifier") is not None:
+        jobs.enqueue("joint_classifier")
+
+
+def _run_joint_classifier_job(job: dict, report_progress: Callable[[dict], None]) -> str:
+    logger.info("🚀 Joint classifier retraining started")
+    _run_subprocess([
+        "uv", "run",
+        "app/ml/train_joint_classifier.py",
+        str(store.training_source("classifier")),
+        str(store.training_source("type_classifier")),
+    ])
+
+    version = registry.register_artifact("joint_classifier", JOINT_CLASSIFIER_MODEL_PATH)
+    registry.promote("joint_classifier", version)
+    logger.info(f"🎯 Joint classifier training complete → {version}")
+    return version
+
+
+jobs.register_handler("ner", _run_ner_job)
+jobs.register_handler("classifier", _run_classifier_job)
+jobs.register_handler("type_classifier", _run_type_classifier_job)
+jobs.register_handler("joint_classifier", _run_joint_classifier_job)
+
+
+# ==========================================================
+# RETRAINING JOBS
+# ==========================================================
+
+def get_job_status(job_id: int) -> dict:
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise ValueError(f"Unknown job: {job_id}")
+    return job
+
+
+def list_retraining_jobs(queue: Optional[str] = None, limit: int = 20) -> dict:
+    if queue is not None and queue not in MODEL_SPECS:
+        raise ValueError(f"Unknown model: {queue}")
+    return {"jobs": jobs.list_jobs(queue, limit)}
+
+
+def get_metrics() -> dict:
+    return {
+        "counters": metrics.snapshot(),
+        "templates": templates.get_stats(),
+        "domain_prior": domain_prior.get_stats(),
+    }
+
+
+# ==========================================================
+# MODEL REGISTRY
+# ==========================================================
+
+def get_model_status() -> dict:
+    return {"models": registry.status()}
+
+
+def rollback_model(name: str) -> dict:
+    """
+    Re-activates the previous version of a model. Loading runs in a
+    background thread; the swap happens once the old version is loaded.
+    """
+    if name not in MODEL_SPECS:
+        raise ValueError(f"Unknown model: {name}")
+
+    history = registry.status()[name]["history"]
+    if len(history) < 2:
+        raise ValueError(f"No previous {name} version to roll back to")
+
+    thread = Thread(target=_run_rollback, args=(name,))
+    thread.daemon = True
+    thread.start()
+
+    return {
+        "success": True,
+        "model": name,
+        "target_version": history[-2],
+        "message": f"Rolling back {name} to {history[-2]} in background",
+    }
 
-    if result.stdout:
-        logger.info(result.stdout)
 
-    if result.stderr:
-        logger.error(result.stderr)
+def _run_rollback(name: str) -> None:
+    try:
+        registry.rollback(name)
+    except Exception as e:
+        logger.exception(f"❌ Rollback of {name} failed: {e}")
 
-    if result.returncode != 0:
+
+# ==========================================================
+# SUBPROCESS HELPER (WITH DEBUGGING)
+# ==========================================================
+
+def _run_subprocess(command: List[str], on_output: Optional[Callable[[str], None]] = None) -> None:
+    """
+    Runs subprocess with stdout/stderr capture + logging, under the
+    training resource policy (thread caps, reserved cores, nice, job slots).
+    With `on_output`, stdout and stderr are merged and handed to it line by
+    line while the command runs.
+    """
+
+    with resources.training_slot() as slot:
+        logger.info(f"Running command (training slot {slot}): {' '.join(command)}")
+
+        if on_output is not None:
+            with subprocess.Popen(
+                resources.training_command(command),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                env=resources.training_env(),
+            ) as process:
+                for line in process.stdout:
+                    if line.strip():
+                        on_output(line.rstrip("\n"))
+            returncode = process.returncode
+        else:
+            result = subprocess.run(
+                resources.training_command(command),
+                capture_output=True,
+                text=True,
+                env=resources.training_env(),
+            )
+            returncode = result.returncode
+
+            if result.stdout:
+                logger.info(result.stdout)
+
+            if result.stderr:
+                logger.error(result.stderr)
+
+    if returncode != 0:
         raise RuntimeError(
-            f"Command failed with exit code {result.returncode}"
+            f"Command failed with exit code {returncode}"
         )
 
 
 # ==========================================================
-# CSV APPEND HELPERS
+# TRAINING DATA APPEND HELPERS
 # ==========================================================
 
-def _append_classifier_samples_to_csv(samples: List[ClassifierTrainingSample]) -> None:
-    file_has_header = CLASSIFIER_CSV_PATH.exists() and CLASSIFIER_CSV_PATH.stat().st_size > 0
+def _append_ner_samples(samples: List[NerTrainingSample]) -> List[NerTrainingSample]:
+    """Appends the samples not already in the training data; returns them."""
+    # Validate every entity span before writing anything
+    for sample in samples:
+        for start, end, label in sample.entities:
+            if start < 0 or end > len(sample.text) or start >= end:
+                raise ValueError(
+                    f"Invalid entity span: {(start, end, label)}"
+                )
+
+    keep = store.append("ner", [sample.model_dump() for sample in samples])
+    added = [sample for sample, new in zip(samples, keep) if new]
+    logger.info(f"✅ Appended {len(added)} NER samples ({len(samples) - len(added)} duplicates skipped)")
+    return added
 
-    with open(CLASSIFIER_CSV_PATH, "a", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f)
-        if not file_has_header:
-            writer.writerow(["text", "label", "source_domain"])
-        for sample in samples:
-            writer.writerow([sample.text, sample.label, sample.source_domain])
-            f.flush()
 
+def _append_classifier_samples(samples: List[ClassifierTrainingSample]) -> List[ClassifierTrainingSample]:
+    keep = store.append("classifier", [sample.model_dump() for sample in samples])
+    return [sample for sample, new in zip(samples, keep) if new]
 
-def _append_type_classifier_samples_to_csv(samples: List[TypeClassifierTrainingSample]) -> None:
-    file_has_header = TYPE_CLASSIFIER_CSV_PATH.exists() and TYPE_CLASSIFIER_CSV_PATH.stat().st_size > 0
 
-    with open(TYPE_CLASSIFIER_CSV_PATH, "a", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f)
-        if not file_has_header:
-            writer.writerow(["text", "label", "source_domain", "type"])
-        for sample in samples:
-            writer.writerow([sample.text, sample.label, sample.source_domain, sample.type])
-            f.flush()
+def _append_type_classifier_samples(samples: List[TypeClassifierTrainingSample]) -> List[TypeClassifierTrainingSample]:
+    keep = store.append("type_classifier", [sample.model_dump() for sample in samples])
+    return [sample for sample, new in zip(samples, keep) if new]
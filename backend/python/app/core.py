@@ -1,6 +1,4 @@
 # core.py
-import yfinance as yf
-from pypfopt import EfficientFrontier, expected_returns, risk_models
 
 
 def run_ultimate_portfolio(
@@ -9,6 +7,11 @@ def run_ultimate_portfolio(
     risk_free_rate=0.03,
     min_coverage=0.9,
 ):
+    # Imported here: yfinance/pypfopt (pandas, scipy, cvxpy) take seconds to
+    # import and are not needed by ML-only workers or before the first request
+    import yfinance as yf
+    from pypfopt import EfficientFrontier, expected_returns, risk_models
+
     prices = yf.download(
         tickers,
         period=period,
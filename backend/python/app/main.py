@@ -1,24 +1,78 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
-from starlette.status import HTTP_400_BAD_REQUEST, HTTP_500_INTERNAL_SERVER_ERROR
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.status import (
+	HTTP_400_BAD_REQUEST,
+	HTTP_500_INTERNAL_SERVER_ERROR,
+	HTTP_503_SERVICE_UNAVAILABLE,
+	HTTP_504_GATEWAY_TIMEOUT,
+)
+
+# Thread caps / CPU affinity must be in place before numpy and spaCy load
+from app.ml.resources import apply_serving_limits
+apply_serving_limits()
 
-from app.routers import optimize as optimize_router
-from app.routers import ml as ml_router
+from app.routers import health as health_router
+from app.roles import has_role, load_routers
+from app.ml.executor import (
+	InferenceOverloadedError,
+	InferenceTimeoutError,
+	start_executor,
+	shutdown_executor,
+)
+from app.ml.warmup import preload_and_warm
+from app.ml.jobs import start_dispatcher
+from app.responses import ML_GZIP_LEVEL, ML_GZIP_MIN_BYTES
 
 
 def _value_error_handler(request: Request, exc: ValueError):
 	return JSONResponse(status_code=HTTP_400_BAD_REQUEST, content={"error": str(exc)})
 
 
+def _overloaded_handler(request: Request, exc: InferenceOverloadedError):
+	return JSONResponse(status_code=HTTP_503_SERVICE_UNAVAILABLE, content={"error": str(exc)})
+
+
+def _timeout_handler(request: Request, exc: InferenceTimeoutError):
+	return JSONResponse(status_code=HTTP_504_GATEWAY_TIMEOUT, content={"error": str(exc)})
+
+
 def _generic_exception_handler(request: Request, exc: Exception):
 	return JSONResponse(status_code=HTTP_500_INTERNAL_SERVER_ERROR, content={"error": "Internal server error"})
 
 
-app = FastAPI(title="Ultimate Portfolio Optimizer")
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+	if not has_role("ml"):
+		yield
+		return
+
+	# Preload + warm up on the worker pool so /health answers during loading
+	executor = start_executor()
+	asyncio.get_running_loop().run_in_executor(executor, preload_and_warm)
+	# Picks up retraining jobs queued before a restart or by other workers
+	start_dispatcher()
+	yield
+	shutdown_executor()
+
+
+app = FastAPI(title="Ultimate Portfolio Optimizer", lifespan=_lifespan)
 
 # Register global exception handlers so endpoints do not need manual try/except
 app.add_exception_handler(ValueError, _value_error_handler)
+app.add_exception_handler(InferenceOverloadedError, _overloaded_handler)
+app.add_exception_handler(InferenceTimeoutError, _timeout_handler)
 app.add_exception_handler(Exception, _generic_exception_handler)
 
-app.include_router(optimize_router.router)
-app.include_router(ml_router.router)
+# Batch / NDJSON results are large and repetitive; compress them for clients that accept gzip
+if ML_GZIP_LEVEL:
+	app.add_middleware(GZipMiddleware, minimum_size=ML_GZIP_MIN_BYTES, compresslevel=ML_GZIP_LEVEL)
+
+app.include_router(health_router.router)
+
+# Only the enabled SERVICE_ROLES are imported and mounted
+for router in load_routers():
+	app.include_router(router)
@@ -0,0 +1,228 @@
+"""
+Streaming bulk processing for mailbox backfills.
+
+`POST /ml/process-stream` takes newline-delimited JSON emails and streams
+one NDJSON result per email back, in input order, while the upload is
+still arriving. Emails are grouped into batches; each batch is one job on
+the inference pool running the full cascade per email:
+
+    classify (joint model when trained, else classifier + type classifier)
+    → NER for transactions
+
+At most ML_STREAM_CONCURRENCY batches are in flight per connection. The
+next input line is only read once a batch slot frees up, and a batch slot
+only frees up once its results have been written to the client, so a slow
+reader or a slow writer throttles the other side instead of the whole
+mailbox being buffered in memory.
+
+Environment:
+    ML_STREAM_BATCH_SIZE      Emails per inference job (default: 16)
+    ML_STREAM_CONCURRENCY     Batches in flight per connection (default: 2)
+    ML_STREAM_MAX_LINE_BYTES  Longest accepted input line (default: 1048576)
+"""
+
+import os
+import json
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from pydantic_core import to_json
+
+from app.ml import metrics
+from app.ml.registry import registry
+from app.ml.executor import (
+    ML_TIMEOUT_SECONDS,
+    InferenceOverloadedError,
+    InferenceTimeoutError,
+    run_inference,
+)
+
+logger = logging.getLogger(__name__)
+
+ML_STREAM_BATCH_SIZE = max(1, int(os.getenv("ML_STREAM_BATCH_SIZE", "16")))
+ML_STREAM_CONCURRENCY = max(1, int(os.getenv("ML_STREAM_CONCURRENCY", "2")))
+ML_STREAM_MAX_LINE_BYTES = int(os.getenv("ML_STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+
+# Wait before retrying a batch the inference pool rejected as full
+_OVERLOAD_BACKOFF_SECONDS = 0.05
+
+
+class LineTooLongError(ValueError):
+    """Raised when an input line exceeds ML_STREAM_MAX_LINE_BYTES."""
+
+
+# ==========================================================
+# CASCADE (RUNS ON THE INFERENCE POOL)
+# ==========================================================
+
+def process_email(email_body: str, from_email: Optional[str] = None, labels: Optional[List[str]] = None) -> dict:
+    """classify → type → NER for one email, same answers as the single endpoints."""
+    from app.ml.classifier import classify_email_func
+    from app.ml.type_classifier import classify_transaction_type
+    from app.ml.joint_classifier import classify_joint
+    from app.ml.ner import extract_entities
+
+    result = {"classification": None, "type": None, "entities": None, "path": None, "model_version": None}
+
+    joint = classify_joint(email_body, from_email) if registry.get_model("joint_classifier") else None
+    if joint and not joint.get("error"):
+        classification, txn_type = joint["transaction"], joint["type"]
+    else:
+        classification = classify_email_func(email_body, from_email)
+        txn_type = None
+
+    if classification.get("error"):
+        result["error"] = classification["error"]
+        return result
+    result["classification"] = classification
+    if not classification["is_transaction"]:
+        return result
+
+    result["type"] = txn_type or classify_transaction_type(email_body, from_email)
+
+    entities = extract_entities(email_body, labels, from_email)
+    result["entities"] = entities["entities"]
+    result["path"] = entities.get("path")
+    result["model_version"] = entities.get("model_version")
+    if entities.get("error"):
+        result["error"] = entities["error"]
+    return result
+
+
+def process_batch(records: List[dict]) -> List[dict]:
+    results = []
+    for record in records:
+        try:
+            output = process_email(record["email_body"], record.get("from_email"), record.get("labels"))
+        except Exception as e:
+            logger.error(f"Bulk processing failed for record {record['index']}: {e}")
+            output = {"error": str(e)}
+        results.append({"index": record["index"], "id": record.get("id"), **output})
+    metrics.increment("bulk.emails", len(records))
+    return results
+
+
+# ==========================================================
+# NDJSON IN
+# ==========================================================
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > ML_STREAM_MAX_LINE_BYTES:
+            raise LineTooLongError(f"Input line longer than {ML_STREAM_MAX_LINE_BYTES} bytes")
+    if buffer:
+        yield buffer
+
+
+def _parse_record(line: bytes, index: int) -> Dict[str, Any]:
+    """Input record, or an error result for lines that cannot be processed."""
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return {"index": index, "id": None, "error": f"Invalid JSON: {e}"}
+
+    if not isinstance(record, dict):
+        return {"index": index, "id": None, "error": "Each line must be a JSON object"}
+    email_body = record.get("email_body")
+    if not isinstance(email_body, str) or not email_body.strip():
+        return {"index": index, "id": record.get("id"), "error": "email_body cannot be empty"}
+
+    return {
+        "index": index,
+        "id": record.get("id"),
+        "email_body": email_body,
+        "from_email": record.get("from_email"),
+        "labels": record.get("labels"),
+    }
+
+
+async def _iter_batches(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[dict]]:
+    """
+    Batches of parsed records. Lines that failed to parse travel in the
+    batch as ready-made error results so output order is preserved.
+    """
+    batch: List[dict] = []
+    index = 0
+    async for line in _iter_lines(chunks):
+        if not line.strip():
+            continue
+        batch.append(_parse_record(line, index))
+        index += 1
+        if len(batch) >= ML_STREAM_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ==========================================================
+# NDJSON OUT
+# ==========================================================
+
+async def _run_batch(batch: List[dict]) -> List[dict]:
+    todo = [r for r in batch if "error" not in r]
+    done: Dict[int, dict] = {r["index"]: r for r in batch if "error" in r}
+
+    while todo:
+        try:
+            # The pool deadline is per request; scale it to the batch
+            results = await run_inference(process_batch, todo, timeout=ML_TIMEOUT_SECONDS * len(todo))
+        except InferenceOverloadedError:
+            await asyncio.sleep(_OVERLOAD_BACKOFF_SECONDS)
+            continue
+        except InferenceTimeoutError as e:
+            results = [{"index": r["index"], "id": r.get("id"), "error": str(e)} for r in todo]
+        done.update((r["index"], r) for r in results)
+        break
+
+    return [done[r["index"]] for r in batch]
+
+
+def _lean(value: Any) -> Any:
+    """Lean mode: no per-class probabilities, no null fields."""
+    if isinstance(value, dict):
+        return {k: _lean(v) for k, v in value.items() if v is not None and k != "probabilities"}
+    if isinstance(value, list):
+        return [_lean(v) for v in value]
+    return value
+
+
+def _encode(result: dict, lean: bool = False) -> bytes:
+    return to_json(_lean(result) if lean else result) + b"\n"
+
+
+async def stream_results(chunks: AsyncIterator[bytes], lean: bool = False) -> AsyncIterator[bytes]:
+    """NDJSON result lines for an NDJSON request body, in input order."""
+    pending: Deque[asyncio.Task] = deque()
+    batches = _iter_batches(chunks)
+
+    try:
+        try:
+            async for batch in batches:
+                pending.append(asyncio.ensure_future(_run_batch(batch)))
+                # Stop reading input until the oldest batch has been written out
+                while len(pending) >= ML_STREAM_CONCURRENCY:
+                    for result in await pending.popleft():
+                        yield _encode(result, lean)
+        except LineTooLongError as e:
+            # Oversized line: flush what we have, then report and stop reading
+            while pending:
+                for result in await pending.popleft():
+                    yield _encode(result, lean)
+            yield _encode({"index": None, "id": None, "error": str(e)}, lean)
+            return
+
+        while pending:
+            for result in await pending.popleft():
+                yield _encode(result, lean)
+    finally:
+        # Client went away: do not leave batches running for nobody
+        for task in pending:
+            task.cancel()
@@ -2,63 +2,57 @@
 Classifier utility to load and use the trained email classifier model.
 """
 
-import joblib
-from pathlib import Path
 import logging
+from typing import Optional
 
-logger = logging.getLogger(__name__)
+from app.ml import domain_prior
+from app.ml.registry import registry
+from app.ml.preprocess import normalize_text
 
-# Singleton model instance
-_classifier_model = None
-_model_loaded = False
+logger = logging.getLogger(__name__)
 
 
 def load_classifier_model():
-    """Load the trained classifier model. Cached after first load."""
-    global _classifier_model, _model_loaded
-    
-    if _model_loaded:
-        return _classifier_model
-    
-    model_path = Path(__file__).parent / 'models' / 'email_classifier.joblib'
-    
-    if not model_path.exists():
-        logger.warning(f"Classifier model not found at {model_path}")
-        return None
-    
-    try:
-        _classifier_model = joblib.load(model_path)
-        _model_loaded = True
-        logger.info(f"Classifier model loaded from {model_path}")
-        return _classifier_model
-    except Exception as e:
-        logger.error(f"Error loading classifier model: {e}")
-        return None
+    """Return the active classifier model from the registry."""
+    loaded = registry.get_model("classifier")
+    return loaded.model if loaded else None
 
 
-def reload_classifier_model():
-    """Force reload the trained classifier model."""
-    global _classifier_model, _model_loaded
-    _classifier_model = None
-    _model_loaded = False
-    return load_classifier_model()
+def _build_result(label: int, proba, source: str) -> dict:
+    return {
+        'label': label,
+        'is_transaction': label == 1,
+        'confidence': float(max(proba)),
+        'probabilities': {
+            'non_transaction': float(proba[0]),
+            'transaction': float(proba[1])
+        },
+        'source': source,
+    }
 
 
-def classify_email_func(email_body: str) -> dict:
+def classify_email_func(email_body: str, from_email: Optional[str] = None) -> dict:
     """
     Classify an email as transaction (1) or non-transaction (0).
     
     Args:
         email_body: Raw email text to classify
+        from_email: Optional sender; enables the sender-domain prior
     
     Returns:
         {
             'label': 0 or 1,
             'is_transaction': bool,
             'confidence': float (0.0-1.0),
-            'probabilities': {'non_transaction': float, 'transaction': float}
+            'probabilities': {'non_transaction': float, 'transaction': float},
+            'source': 'model', 'domain_prior' or 'model+prior'
         }
     """
+    # Senders that only ever produced one label skip the model
+    prior = domain_prior.shortcut("classifier", from_email)
+    if prior is not None:
+        return _build_result(prior[0], prior[1], 'domain_prior')
+
     model = load_classifier_model()
     if model is None:
         return {
@@ -70,20 +64,13 @@ def classify_email_func(email_body: str) -> dict:
         }
     
     try:
-        # Predict label and probabilities
-        label = int(model.predict([email_body])[0])
-        proba = model.predict_proba([email_body])[0]
-        confidence = float(max(proba))
+        # Predict probabilities on the normalized body, biased for sparse senders
+        text = normalize_text(email_body)
+        proba = [float(p) for p in model.predict_proba([text])[0]]
+        proba, biased = domain_prior.bias("classifier", from_email, proba)
+        label = int(proba[1] > proba[0])
         
-        return {
-            'label': label,
-            'is_transaction': label == 1,
-            'confidence': confidence,
-            'probabilities': {
-                'non_transaction': float(proba[0]),
-                'transaction': float(proba[1])
-            }
-        }
+        return _build_result(label, proba, 'model+prior' if biased else 'model')
     except Exception as e:
         logger.error(f"Error classifying email: {e}")
         return {
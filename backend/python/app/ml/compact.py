@@ -0,0 +1,218 @@
+"""
+Compact NumPy scorer for the TF-IDF + LogisticRegression pipelines.
+
+`export_compact` turns a fitted sklearn Pipeline into a small `.npz`:
+sorted vocabulary array, idf vector, coefficient matrix and intercept as
+float32, plus the vectorizer settings. `CompactScorer` reproduces the
+pipeline's `predict_proba` with a sorted-array vocabulary lookup and a
+sparse dot product, without importing sklearn, and loads in milliseconds.
+The archive is stored uncompressed, so `CompactScorer.load(path, mmap=True)`
+maps the arrays straight from the file and worker processes share the pages.
+
+Usage (export an existing model):
+    python -m app.ml.compact app/ml/models/email_classifier.joblib app/ml/models/email_classifier.npz
+"""
+
+import os
+import re
+import sys
+import json
+import struct
+import zipfile
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+
+# Max allowed |p_compact - p_sklearn| when verifying an export
+PARITY_TOLERANCE = 1e-4
+
+
+# ==========================================================
+# EXPORT
+# ==========================================================
+
+def export_compact(pipeline, path: Path) -> Path:
+    """Write the fitted `tfidf` + `classifier` pipeline to `path` (.npz)."""
+    vectorizer = pipeline.named_steps["tfidf"]
+    classifier = pipeline.named_steps["classifier"]
+
+    if vectorizer.analyzer != "word" or vectorizer.strip_accents is not None:
+        raise ValueError("Only word analyzers without accent stripping can be exported")
+
+    terms = sorted(vectorizer.vocabulary_)
+    columns = np.array([vectorizer.vocabulary_[t] for t in terms])
+    stop_words = vectorizer.get_stop_words() or []
+
+    config = {
+        "lowercase": vectorizer.lowercase,
+        "token_pattern": vectorizer.token_pattern,
+        "ngram_range": list(vectorizer.ngram_range),
+        "norm": vectorizer.norm,
+        "use_idf": vectorizer.use_idf,
+        "sublinear_tf": vectorizer.sublinear_tf,
+        "multi_class": getattr(classifier, "multi_class", "auto"),
+    }
+
+    idf = vectorizer.idf_[columns] if vectorizer.use_idf else np.ones(len(terms))
+
+    # Write to a temp file and rename so readers never see a partial export
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            terms=np.array(terms, dtype=str),
+            idf=idf.astype(np.float32),
+            coef=classifier.coef_[:, columns].astype(np.float32),
+            intercept=classifier.intercept_.astype(np.float32),
+            classes=np.asarray(classifier.classes_),
+            stop_words=np.array(sorted(stop_words), dtype=str),
+            config=np.array(json.dumps(config)),
+        )
+    os.replace(tmp_path, path)
+    return path
+
+
+def verify_parity(pipeline, scorer: "CompactScorer", texts: Iterable[str]) -> float:
+    """Max absolute probability difference between pipeline and scorer."""
+    texts = list(texts)
+    if not texts:
+        return 0.0
+    return float(np.max(np.abs(pipeline.predict_proba(texts) - scorer.predict_proba(texts))))
+
+
+def _mmap_npz(path: Path) -> dict:
+    """Memory-map every array of an uncompressed `.npz` (np.load ignores mmap_mode for archives)."""
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            key = info.filename[:-len(".npy")]
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} member {key} is compressed and cannot be mapped")
+
+            # Local file header: 30 fixed bytes, then the file name and extra field
+            f.seek(info.header_offset)
+            name_len, extra_len = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+            if dtype.hasobject:
+                raise ValueError(f"{path} member {key} holds objects and cannot be mapped")
+            if not shape or 0 in shape:
+                # Scalars / empty arrays: nothing worth sharing
+                with archive.open(info) as member:
+                    arrays[key] = np.lib.format.read_array(member)
+                continue
+
+            arrays[key] = np.memmap(
+                path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                order="F" if fortran_order else "C",
+            )
+    return arrays
+
+
+# ==========================================================
+# SCORER
+# ==========================================================
+
+class CompactScorer:
+    """Drop-in for the pipeline's `predict` / `predict_proba`."""
+
+    def __init__(self, arrays):
+        config = json.loads(str(arrays["config"]))
+        self.terms = arrays["terms"]
+        self.idf = arrays["idf"]
+        self.coef = arrays["coef"]
+        self.intercept = arrays["intercept"]
+        self.classes_ = arrays["classes"]
+        self.stop_words = frozenset(arrays["stop_words"].tolist())
+
+        self.lowercase = config["lowercase"]
+        self.token_pattern = re.compile(config["token_pattern"])
+        self.min_n, self.max_n = config["ngram_range"]
+        self.norm = config["norm"]
+        self.sublinear_tf = config["sublinear_tf"]
+        self.ovr = config["multi_class"] == "ovr"
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = False) -> "CompactScorer":
+        if mmap:
+            return cls(_mmap_npz(path))
+        with np.load(path) as arrays:
+            return cls({key: arrays[key] for key in arrays.files})
+
+    def _analyze(self, doc: str) -> List[str]:
+        """Same tokens and n-grams as sklearn's word analyzer."""
+        if self.lowercase:
+            doc = doc.lower()
+        tokens = [t for t in self.token_pattern.findall(doc) if t not in self.stop_words]
+
+        grams = list(tokens) if self.min_n == 1 else []
+        for n in range(max(self.min_n, 2), min(self.max_n, len(tokens)) + 1):
+            grams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return grams
+
+    def _decision(self, doc: str) -> np.ndarray:
+        grams = self._analyze(doc)
+        if not grams:
+            return self.intercept.astype(np.float64)
+
+        # Sorted-array vocabulary lookup
+        grams = np.array(grams, dtype=str)
+        positions = np.searchsorted(self.terms, grams)
+        in_range = positions < len(self.terms)
+        positions, grams = positions[in_range], grams[in_range]
+        columns = positions[self.terms[positions] == grams]
+        if not len(columns):
+            return self.intercept.astype(np.float64)
+
+        # tf-idf weights of the non-zero columns only
+        columns, counts = np.unique(columns, return_counts=True)
+        weights = counts.astype(np.float32)
+        if self.sublinear_tf:
+            weights = 1 + np.log(weights)
+        weights *= self.idf[columns]
+        if self.norm == "l2":
+            weights /= np.sqrt(np.dot(weights, weights))
+        elif self.norm == "l1":
+            weights /= np.abs(weights).sum()
+
+        return (self.coef[:, columns] @ weights + self.intercept).astype(np.float64)
+
+    def predict_proba(self, texts: Iterable[str]) -> np.ndarray:
+        scores = np.vstack([self._decision(text) for text in texts])
+
+        if scores.shape[1] == 1:
+            positive = 1 / (1 + np.exp(-scores[:, 0]))
+            return np.column_stack([1 - positive, positive])
+        if self.ovr:
+            proba = 1 / (1 + np.exp(-scores))
+            return proba / proba.sum(axis=1, keepdims=True)
+
+        scores -= scores.max(axis=1, keepdims=True)
+        proba = np.exp(scores)
+        return proba / proba.sum(axis=1, keepdims=True)
+
+    def predict(self, texts: Iterable[str]) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(texts), axis=1)]
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    import joblib
+
+    pipeline = joblib.load(sys.argv[1])
+    path = export_compact(pipeline, Path(sys.argv[2]))
+    print(f"✓ Compact model saved to {path} ({path.stat().st_size / 1024:.1f} KB)")
+
+
+if __name__ == "__main__":
+    main()
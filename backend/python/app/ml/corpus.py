@@ -0,0 +1,388 @@
+"""
+Incremental, sharded NER corpus built from `ner_spacy.jsonl` (or from the
+training store, see `app/ml/store.py`).
+
+The JSONL only ever grows, so converting it is incremental: the manifest
+records how many bytes have been converted (for the store: the last row
+id), and `sync()` turns only the lines appended since then into a new
+DocBin shard. Many small shards (one
+per feedback batch) are merged by `compact()`, which also runs
+automatically once there are more than ML_CORPUS_MAX_SHARDS of them.
+
+Layout:
+    data/ner_corpus/manifest.json
+    data/ner_corpus/shard-00001.spacy
+    data/ner_corpus/shard-00002.spacy
+    ...
+
+If the JSONL was rewritten rather than appended to (replaced by another
+file, as `python -m app.ml.dedup compact` does; shorter than the converted
+offset; or its first or last converted bytes changed), the corpus is rebuilt.
+
+Training reads the shards lazily, one at a time, through the
+`regmar.ShardedCorpus.v1` reader, which assigns each doc to train or dev by
+the hash of its text (`app/ml/split.py`) and skips a doc when a later doc
+has the same text (a corrected sample). A training job holds a shared lock on the
+corpus while `sync()`/`compact()` take it exclusively, so shards are never
+replaced under a running job.
+
+Usage:
+    python -m app.ml.corpus sync <input.jsonl|training.sqlite3>
+    python -m app.ml.corpus compact
+
+Environment:
+    ML_CORPUS_SHARD_DOCS  Docs per shard written by compaction (default: 5000)
+    ML_CORPUS_MAX_SHARDS  Shard count that triggers compaction on sync (default: 32)
+"""
+
+import os
+import sys
+import json
+import fcntl
+import random
+import hashlib
+import logging
+import itertools
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import spacy
+from spacy.language import Language
+from spacy.tokens import Doc, DocBin
+from spacy.training import Example
+from spacy.vocab import Vocab
+
+from app.ml.dedup import sample_key
+from app.ml.docbin import record_to_doc
+from app.ml.split import is_dev
+from app.ml.store import get_store, is_store
+
+logger = logging.getLogger(__name__)
+
+CORPUS_DIR = Path(__file__).parent / "data" / "ner_corpus"
+ML_CORPUS_SHARD_DOCS = max(1, int(os.getenv("ML_CORPUS_SHARD_DOCS", "5000")))
+ML_CORPUS_MAX_SHARDS = max(2, int(os.getenv("ML_CORPUS_MAX_SHARDS", "32")))
+
+# Bytes of the JSONL hashed to notice that it was rewritten
+_FINGERPRINT_BYTES = 4096
+
+
+class ShardedCorpus:
+    def __init__(self, root: Path = CORPUS_DIR, lang: str = "en"):
+        self.root = Path(root)
+        self.lang = lang
+
+    # ==========================================================
+    # MANIFEST / LOCKING
+    # ==========================================================
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.root / "manifest.json"
+
+    def read_manifest(self) -> Dict[str, Any]:
+        if not self.manifest_path.exists():
+            return {"generation": 0, "offset": 0, "fingerprint": None, "misaligned": 0, "next_shard": 1, "shards": []}
+        return json.loads(self.manifest_path.read_text(encoding="utf-8"))
+
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        tmp = self.manifest_path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+        tmp.replace(self.manifest_path)
+
+    @contextmanager
+    def lock(self, exclusive: bool = False) -> Iterator[None]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / "corpus.lock", "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_shard(self, manifest: Dict[str, Any], docs: List[Doc], **info) -> Dict[str, Any]:
+        name = f"shard-{manifest['next_shard']:05d}.spacy"
+        manifest["next_shard"] += 1
+        DocBin(docs=docs).to_disk(self.root / name)
+        return {"file": name, "docs": len(docs), **info}
+
+    # ==========================================================
+    # SYNC / COMPACTION
+    # ==========================================================
+
+    def sync(self, source: Path) -> Dict[str, Any]:
+        """
+        Convert the samples added to `source` (the JSONL, or the training
+        store) since the last sync into a new shard. Returns
+        {"generation", "added", "docs", "shards", "misaligned"}; `generation`
+        changes whenever the corpus is rebuilt, i.e. whenever doc ordinals
+        stop meaning what they meant before.
+        """
+        with self.lock(exclusive=True):
+            manifest = self.read_manifest()
+            read = self._read_store if is_store(source) else self._read_jsonl
+            manifest, records, end, fingerprint = read(manifest, Path(source))
+
+            nlp = spacy.blank(self.lang)
+            docs: List[Doc] = []
+            misaligned = 0
+            for record in records:
+                doc, bad = record_to_doc(nlp, record)
+                docs.append(doc)
+                misaligned += bad
+
+            if docs:
+                manifest["shards"].append(self._write_shard(
+                    manifest, docs, start=manifest["offset"], end=end,
+                ))
+            manifest["offset"] = end
+            manifest["misaligned"] = manifest.get("misaligned", 0) + misaligned
+            manifest["fingerprint"] = fingerprint
+            self._write_manifest(manifest)
+
+            if len(manifest["shards"]) > ML_CORPUS_MAX_SHARDS:
+                manifest = self._compact(manifest)
+
+        logger.info(f"NER corpus: +{len(docs)} docs, {len(manifest['shards'])} shards")
+        return {
+            "generation": manifest.get("generation", 0),
+            "added": len(docs),
+            "docs": sum(shard["docs"] for shard in manifest["shards"]),
+            "shards": len(manifest["shards"]),
+            "misaligned": manifest["misaligned"],
+        }
+
+    def _read_jsonl(self, manifest: Dict[str, Any], jsonl_path: Path) -> Tuple[Dict[str, Any], List[Dict[str, Any]], int, str]:
+        """Records appended after the converted byte offset."""
+        with open(jsonl_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            fingerprint = self._fingerprint(f, manifest["offset"])
+
+            # Replaced (dedup compaction, store export: new inode), shortened,
+            # or changed at the start or just before the offset
+            file_id = [stat.st_dev, stat.st_ino]
+            replaced = manifest.get("file_id") not in (None, file_id)
+            if manifest["offset"] and (replaced or size < manifest["offset"] or fingerprint != manifest["fingerprint"]):
+                logger.warning(f"{jsonl_path} was rewritten, rebuilding the NER corpus")
+                manifest = self._reset(manifest)
+            manifest["file_id"] = file_id
+
+            f.seek(manifest["offset"])
+            chunk = f.read()
+
+            # Only whole lines; a line still being written is picked up next time
+            end = chunk.rfind(b"\n") + 1
+            offset = manifest["offset"] + end
+            fingerprint = self._fingerprint(f, offset)
+
+        records = [json.loads(line) for line in chunk[:end].splitlines() if line.strip()]
+        return manifest, records, offset, fingerprint
+
+    @staticmethod
+    def _fingerprint(f, offset: int) -> str:
+        """Hash of the first and the last converted bytes (up to `offset`)."""
+        f.seek(0)
+        head = f.read(min(offset, _FINGERPRINT_BYTES))
+        tail_start = max(len(head), offset - _FINGERPRINT_BYTES)
+        f.seek(tail_start)
+        tail = f.read(offset - tail_start)
+        return hashlib.blake2b(head + b"|" + tail, digest_size=16).hexdigest()
+
+    def _read_store(self, manifest: Dict[str, Any], db_path: Path) -> Tuple[Dict[str, Any], List[Dict[str, Any]], int, str]:
+        """Rows inserted after the converted row id."""
+        store = get_store(db_path)
+        fingerprint = f"store:{store.generation('ner')}"
+        if manifest["offset"] and manifest["fingerprint"] != fingerprint:
+            logger.warning(f"{db_path} rows were deleted or replaced, rebuilding the NER corpus")
+            manifest = self._reset(manifest)
+
+        records = [record for chunk in store.iter_chunks("ner", after_id=manifest["offset"]) for record in chunk]
+        end = records[-1]["id"] if records else manifest["offset"]
+        return manifest, records, end, fingerprint
+
+    def _reset(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        for shard in manifest["shards"]:
+            (self.root / shard["file"]).unlink(missing_ok=True)
+        manifest = {
+            **manifest,
+            "generation": manifest.get("generation", 0) + 1,
+            "offset": 0, "fingerprint": None, "file_id": None, "misaligned": 0, "shards": [],
+        }
+        self._write_manifest(manifest)
+        return manifest
+
+    def compact(self) -> Dict[str, Any]:
+        """Merge small shards into shards of up to ML_CORPUS_SHARD_DOCS docs."""
+        with self.lock(exclusive=True):
+            manifest = self._compact(self.read_manifest())
+        return {
+            "docs": sum(shard["docs"] for shard in manifest["shards"]),
+            "shards": len(manifest["shards"]),
+        }
+
+    def _compact(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """Full shards are kept as they are; runs of small ones are merged."""
+        old = manifest["shards"]
+        vocab = Vocab()
+        merged: List[Dict[str, Any]] = []
+        replaced: List[Dict[str, Any]] = []
+        batch: List[Doc] = []
+        start = end = 0
+
+        def flush():
+            nonlocal batch
+            if batch:
+                merged.append(self._write_shard(manifest, batch, start=start, end=end))
+                batch = []
+
+        for shard in old:
+            if shard["docs"] >= ML_CORPUS_SHARD_DOCS:
+                flush()
+                merged.append(shard)
+                continue
+            replaced.append(shard)
+            for doc in DocBin().from_disk(self.root / shard["file"]).get_docs(vocab):
+                if not batch:
+                    start = shard["start"]
+                batch.append(doc)
+                end = shard["end"]
+                if len(batch) >= ML_CORPUS_SHARD_DOCS:
+                    flush()
+        flush()
+
+        # New shards are complete before the manifest points at them
+        manifest["shards"] = merged
+        self._write_manifest(manifest)
+        for shard in replaced:
+            (self.root / shard["file"]).unlink(missing_ok=True)
+
+        logger.info(f"NER corpus compacted: {len(old)} → {len(merged)} shards")
+        return manifest
+
+    # ==========================================================
+    # READING
+    # ==========================================================
+
+    def iter_docs(self, vocab: Vocab, rng: Optional[random.Random] = None) -> Iterator[Tuple[int, Doc]]:
+        """
+        (ordinal, doc) for every doc, one shard in memory at a time. The
+        ordinal is the doc's position in the corpus; with `rng` shards and
+        the docs within each shard come in shuffled order.
+        """
+        shards = []
+        first = 0
+        for shard in self.read_manifest()["shards"]:
+            shards.append((first, shard))
+            first += shard["docs"]
+        if rng is not None:
+            rng.shuffle(shards)
+
+        for first, shard in shards:
+            docs = list(enumerate(DocBin().from_disk(self.root / shard["file"]).get_docs(vocab), first))
+            if rng is not None:
+                rng.shuffle(docs)
+            yield from docs
+
+    def superseded(self, vocab: Vocab) -> Set[int]:
+        """
+        Ordinals of docs followed by a later doc with the same text: the
+        old labels of a corrected sample, which training skips.
+        """
+        last: Dict[bytes, int] = {}
+        superseded: Set[int] = set()
+        for ordinal, doc in self.iter_docs(vocab):
+            key = sample_key(doc.text)
+            if key in last:
+                superseded.add(last[key])
+            last[key] = ordinal
+        return superseded
+
+    def count_train(self, vocab: Vocab, new_from: int = 0) -> int:
+        """Train-split docs with an ordinal of at least `new_from`, corrected docs excluded."""
+        skip = self.superseded(vocab)
+        return sum(
+            1 for ordinal, doc in self.iter_docs(vocab)
+            if ordinal >= new_from and ordinal not in skip and not is_dev(doc.text)
+        )
+
+
+@spacy.registry.readers("regmar.ShardedCorpus.v1")
+def create_sharded_corpus(
+    path: str,
+    split: str,
+    new_from: int = 0,
+    replay: int = 0,
+    seed: int = 0,
+) -> Callable[[Language], Iterator[Example]]:
+    """
+    Streaming corpus reader over the shards of a `ShardedCorpus`. Train
+    docs are reshuffled every epoch (each call is one epoch).
+
+    For fine-tuning, `new_from` is the first ordinal not seen by the base
+    model: the train split is then those new docs plus a fresh sample of
+    `replay` older ones per epoch, so the model does not forget them.
+    """
+    corpus = ShardedCorpus(Path(path))
+    epochs = itertools.count()
+    # Found on the first call; the corpus cannot change under a training job
+    skip: Optional[Set[int]] = None
+
+    def read(nlp: Language) -> Iterator[Example]:
+        nonlocal skip
+        if skip is None:
+            skip = corpus.superseded(nlp.vocab)
+
+        if split == "dev":
+            for ordinal, reference in corpus.iter_docs(nlp.vocab):
+                if ordinal not in skip and is_dev(reference.text):
+                    yield Example(nlp.make_doc(reference.text), reference)
+            return
+
+        rng = random.Random(seed + next(epochs))
+        if not new_from:
+            for ordinal, reference in corpus.iter_docs(nlp.vocab, rng):
+                if ordinal not in skip and not is_dev(reference.text):
+                    yield Example(nlp.make_doc(reference.text), reference)
+            return
+
+        # New docs + a reservoir sample of the old ones, shuffled together
+        new: List[Doc] = []
+        old: List[Doc] = []
+        seen = 0
+        for ordinal, reference in corpus.iter_docs(nlp.vocab):
+            if ordinal in skip or is_dev(reference.text):
+                continue
+            if ordinal >= new_from:
+                new.append(reference)
+                continue
+            seen += 1
+            if len(old) < replay:
+                old.append(reference)
+            else:
+                slot = rng.randrange(seen)
+                if slot < replay:
+                    old[slot] = reference
+
+        picked = new + old
+        rng.shuffle(picked)
+        for reference in picked:
+            yield Example(nlp.make_doc(reference.text), reference)
+
+    return read
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ("sync", "compact") or (sys.argv[1] == "sync" and len(sys.argv) < 3):
+        print(__doc__)
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    corpus = ShardedCorpus()
+    result = corpus.sync(Path(sys.argv[2])) if sys.argv[1] == "sync" else corpus.compact()
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
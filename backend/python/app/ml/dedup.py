@@ -0,0 +1,278 @@
+"""
+Content-hash dedup index for the training data files.
+
+The Node side resubmits the same corrected emails, so without a check the
+training files grow with every submission and every retrain slows down.
+The index maps a hash of each sample's normalized text (whitespace
+collapsed, case folded) to a hash of its labels, per dataset:
+
+- same text, same labels → the sample is skipped
+- same text, new labels  → the corrected sample is appended; readers skip
+  the row it supersedes (`read_records`) and compaction later drops it
+- new text               → appended
+
+`admit()` checks and records a batch in one SQLite transaction and holds
+it while the caller appends, so concurrent requests (and workers) cannot
+both append the same sample. The index remembers the size of each file it
+has seen; a file changed behind its back (edited, replaced, restored) is
+re-indexed on the next append.
+
+Compaction rewrites a file with one row per text (the last one, so
+corrections win) and rebuilds its index:
+
+Usage:
+    python -m app.ml.dedup compact [ner|classifier|type_classifier ...]
+
+Environment:
+    ML_DEDUP_DB  Index database (default: app/ml/data/dedup.sqlite3)
+"""
+
+import os
+import re
+import sys
+import csv
+import json
+import sqlite3
+import itertools
+import hashlib
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path("app/ml/data")
+ML_DEDUP_DB = Path(os.getenv("ML_DEDUP_DB", str(DATA_DIR / "dedup.sqlite3")))
+
+_WHITESPACE = re.compile(r"\s+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    dataset TEXT NOT NULL,
+    key     BLOB NOT NULL,
+    content BLOB NOT NULL,
+    PRIMARY KEY (dataset, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    dataset TEXT PRIMARY KEY,
+    size    INTEGER NOT NULL
+);
+"""
+
+
+class Dataset(NamedTuple):
+    path: Path
+    format: str  # "jsonl" or "csv"
+    content: Callable[[Dict[str, Any]], str]  # labels of a record, as a string
+
+
+DATASETS: Dict[str, Dataset] = {
+    "ner": Dataset(
+        DATA_DIR / "ner_spacy.jsonl", "jsonl",
+        lambda record: json.dumps([list(ent) for ent in record.get("entities", [])]),
+    ),
+    "classifier": Dataset(
+        DATA_DIR / "classifier_data.csv", "csv",
+        lambda record: str(record["label"]),
+    ),
+    "type_classifier": Dataset(
+        DATA_DIR / "type_classifier_data.csv", "csv",
+        lambda record: f"{record['label']}:{record.get('type', '')}",
+    ),
+}
+
+
+def sample_key(text: str) -> bytes:
+    normalized = _WHITESPACE.sub(" ", text).strip().casefold()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+
+
+def content_hash(dataset: str, record: Dict[str, Any]) -> bytes:
+    return hashlib.blake2b(DATASETS[dataset].content(record).encode("utf-8"), digest_size=8).digest()
+
+
+def _file_size(path: Path) -> int:
+    return path.stat().st_size if path.exists() else 0
+
+
+@contextmanager
+def _transaction() -> Iterator[sqlite3.Connection]:
+    ML_DEDUP_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(ML_DEDUP_DB, timeout=30, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        # Write lock up front: check, append and record happen as one step
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+# ==========================================================
+# READING THE DATA FILES
+# ==========================================================
+
+def read_records(dataset: str, path: Optional[Path] = None, latest: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Records of a data file (default: the dataset's file), streamed. With
+    `latest`, a row superseded by a later row with the same text is
+    skipped, so a correction replaces the sample it corrects. That takes
+    a first pass which keeps one key per distinct text in memory.
+    """
+    spec = DATASETS[dataset]
+    path = Path(path or spec.path)
+    if not path.exists():
+        return
+    if not latest:
+        yield from _read_rows(spec, path)
+        return
+
+    last: Dict[bytes, int] = {}
+    count = 0
+    for record in _read_rows(spec, path):
+        last[sample_key(record["text"])] = count
+        count += 1
+    # Rows appended after the first pass are left for the next read
+    for i, record in enumerate(itertools.islice(_read_rows(spec, path), count)):
+        if last[sample_key(record["text"])] == i:
+            yield record
+
+
+def _read_rows(spec: Dataset, path: Path) -> Iterator[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if spec.format == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def _reindex(conn: sqlite3.Connection, dataset: str) -> int:
+    """Index the whole file; later rows win, as in compaction."""
+    conn.execute("DELETE FROM samples WHERE dataset = ?", (dataset,))
+    entries: Dict[bytes, bytes] = {}
+    for record in read_records(dataset):
+        entries[sample_key(record["text"])] = content_hash(dataset, record)
+    conn.executemany(
+        "INSERT INTO samples (dataset, key, content) VALUES (?, ?, ?)",
+        ((dataset, key, content) for key, content in entries.items()),
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO files (dataset, size) VALUES (?, ?)",
+        (dataset, _file_size(DATASETS[dataset].path)),
+    )
+    logger.info(f"Dedup index for {dataset}: {len(entries)} unique samples")
+    return len(entries)
+
+
+# ==========================================================
+# APPENDS
+# ==========================================================
+
+@contextmanager
+def admit(dataset: str, records: List[Dict[str, Any]]) -> Iterator[List[bool]]:
+    """
+    Yields, for each record, whether it should be appended (new text, or
+    known text with different labels). The caller appends those inside
+    the `with` block; the index is updated when the block exits cleanly.
+    """
+    path = DATASETS[dataset].path
+    with _transaction() as conn:
+        row = conn.execute("SELECT size FROM files WHERE dataset = ?", (dataset,)).fetchone()
+        if row is None or row[0] != _file_size(path):
+            _reindex(conn, dataset)
+
+        keep: List[bool] = []
+        batch: Dict[bytes, bytes] = {}
+        for record in records:
+            key = sample_key(record["text"])
+            content = content_hash(dataset, record)
+            if key in batch:
+                known = batch[key]
+            else:
+                found = conn.execute(
+                    "SELECT content FROM samples WHERE dataset = ? AND key = ?", (dataset, key)
+                ).fetchone()
+                known = found[0] if found else None
+            keep.append(known != content)
+            batch[key] = content
+
+        yield keep
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO samples (dataset, key, content) VALUES (?, ?, ?)",
+            ((dataset, key, content) for key, content in batch.items()),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO files (dataset, size) VALUES (?, ?)",
+            (dataset, _file_size(path)),
+        )
+
+
+# ==========================================================
+# COMPACTION
+# ==========================================================
+
+def compact(dataset: str) -> Dict[str, int]:
+    """
+    Rewrite a data file with one row per normalized text (the last one).
+    Returns {"before", "after"} row counts.
+    """
+    spec = DATASETS[dataset]
+    if not spec.path.exists():
+        return {"before": 0, "after": 0}
+
+    with _transaction() as conn:
+        with open(spec.path, "r", encoding="utf-8", newline="") as f:
+            if spec.format == "jsonl":
+                header: List[str] = []
+                rows: List[Tuple[bytes, Any]] = [
+                    (sample_key(json.loads(line)["text"]), line.rstrip("\n"))
+                    for line in f if line.strip()
+                ]
+            else:
+                reader = csv.reader(f)
+                header = next(reader, [])
+                text_column = header.index("text")
+                rows = [(sample_key(row[text_column]), row) for row in reader if row]
+
+        last = {key: i for i, (key, _) in enumerate(rows)}
+        unique = [row for i, (key, row) in enumerate(rows) if last[key] == i]
+
+        tmp = spec.path.with_suffix(spec.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            if spec.format == "jsonl":
+                for line in unique:
+                    f.write(line + "\n")
+            else:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(unique)
+        tmp.replace(spec.path)
+
+        _reindex(conn, dataset)
+
+    logger.info(f"Compacted {spec.path}: {len(rows)} → {len(unique)} rows")
+    return {"before": len(rows), "after": len(unique)}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "compact" or any(name not in DATASETS for name in sys.argv[2:]):
+        print(__doc__)
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    for dataset in sys.argv[2:] or DATASETS:
+        print(json.dumps({"dataset": dataset, **compact(dataset)}))
+
+
+if __name__ == "__main__":
+    main()
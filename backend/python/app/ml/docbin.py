@@ -0,0 +1,150 @@
+"""
+NER training data: JSONL records → spaCy Docs.
+
+Same conversion as `scripts/create_docbin_from_jsonl.py`, as functions, for
+the incremental corpus (`app/ml/corpus.py`) and the script's parallel mode.
+
+Each JSONL line is:
+    {"text": "...", "entities": [[start, end, label], ...], "source_domain": "..."}
+
+`convert_jsonl()` converts a large file on all cores: the JSONL is read in
+chunks of `shard_docs` lines, and each chunk goes to a worker process that
+tokenizes it with `nlp.pipe`, aligns the entity spans and writes its own
+DocBin shard. Only raw lines and small reports pass between processes, and
+at most two chunks per worker are in flight, so memory stays bounded. Each
+shard gets an entry in `report.json` listing its misaligned spans.
+"""
+
+import os
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import spacy
+from spacy.language import Language
+from spacy.tokens import Doc, DocBin
+
+# Misaligned spans listed per shard in the report; the count is always exact
+REPORT_MAX_SPANS = 100
+
+_nlp: Optional[Language] = None
+
+
+def _align(doc: Doc, record: Dict[str, Any]) -> List[List[Any]]:
+    """
+    Set the record's entities on `doc`; returns the [start, end, label]
+    entities that could not be aligned to token boundaries (those are dropped).
+    """
+    spans = []
+    misaligned = []
+    for ent in record.get("entities", []):
+        if len(ent) < 3:
+            continue
+        start, end, label = ent[0], ent[1], ent[2]
+        span = doc.char_span(start, end, label=label, alignment_mode="contract")
+        if span is None:
+            span = doc.char_span(start, end, label=label, alignment_mode="expand")
+        if span is None:
+            misaligned.append([start, end, label])
+        else:
+            spans.append(span)
+    if spans:
+        doc.ents = tuple(spans)
+    return misaligned
+
+
+def record_to_doc(nlp: Language, record: Dict[str, Any]) -> Tuple[Doc, int]:
+    """
+    Doc with gold entities for one record, and the number of entity spans
+    that could not be aligned to token boundaries (those are dropped).
+    """
+    doc = nlp.make_doc(record.get("text", ""))
+    return doc, len(_align(doc, record))
+
+
+# ==========================================================
+# PARALLEL CONVERSION
+# ==========================================================
+
+def _init_worker(lang: str) -> None:
+    global _nlp
+    _nlp = spacy.blank(lang)
+
+
+def _convert_chunk(lines: List[str], first_line: int, out_path: Path) -> Dict[str, Any]:
+    """Worker: one chunk of JSONL lines → one DocBin shard, and its report."""
+    records = [json.loads(line) for line in lines]
+    docbin = DocBin()
+    misaligned = 0
+    spans: List[Dict[str, Any]] = []
+    texts = (record.get("text", "") for record in records)
+    for i, (record, doc) in enumerate(zip(records, _nlp.pipe(texts, batch_size=256))):
+        bad = _align(doc, record)
+        misaligned += len(bad)
+        for start, end, label in bad:
+            if len(spans) < REPORT_MAX_SPANS:
+                spans.append({
+                    "line": first_line + i, "start": start, "end": end, "label": label,
+                    "text": doc.text[start:end],
+                })
+        docbin.add(doc)
+    docbin.to_disk(out_path)
+    return {"file": out_path.name, "docs": len(records), "first_line": first_line, "misaligned": misaligned, "spans": spans}
+
+
+def _chunks(path: Path, size: int) -> Iterator[Tuple[int, List[str]]]:
+    """(first line number, non-empty lines) in chunks of `size` lines; line numbers are 1-based."""
+    chunk: List[str] = []
+    first = 1
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            if not chunk:
+                first = number
+            chunk.append(line)
+            if len(chunk) >= size:
+                yield first, chunk
+                chunk = []
+    if chunk:
+        yield first, chunk
+
+
+def convert_jsonl(
+    in_path: Path,
+    out_dir: Path,
+    workers: int = os.cpu_count() or 1,
+    shard_docs: int = 5000,
+    lang: str = "en",
+) -> Dict[str, Any]:
+    """
+    Convert a JSONL into `out_dir/shard-NNNNN.spacy` files on `workers`
+    processes and write `out_dir/report.json`. Returns the report:
+    {"docs", "misaligned", "shards": [{"file", "docs", "first_line", "misaligned", "spans"}]}.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for old in out_dir.glob("shard-*.spacy"):
+        old.unlink()
+    shards: List[Dict[str, Any]] = []
+    pending: Deque = deque()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(lang,)) as pool:
+        for index, (first_line, lines) in enumerate(_chunks(Path(in_path), shard_docs), 1):
+            # Bound the lines held in memory: wait for the oldest chunk first
+            if len(pending) >= 2 * workers:
+                shards.append(pending.popleft().result())
+            pending.append(pool.submit(_convert_chunk, lines, first_line, out_dir / f"shard-{index:05d}.spacy"))
+        shards.extend(future.result() for future in pending)
+
+    report = {
+        "docs": sum(shard["docs"] for shard in shards),
+        "misaligned": sum(shard["misaligned"] for shard in shards),
+        "shards": shards,
+    }
+    tmp = out_dir / "report.json.tmp"
+    tmp.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    tmp.replace(out_dir / "report.json")
+    return report
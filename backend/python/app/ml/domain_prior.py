@@ -0,0 +1,150 @@
+"""
+Sender-domain prior index for the email and type classifiers.
+
+Built from the classifier training data (`source_domain` column): per sender domain
+label counts. At inference, when the caller passes `from_email`:
+
+- senders with an overwhelming history (enough samples and a smoothed
+  majority above the threshold) are answered from the index without
+  running the model
+- sparse senders (fewer samples than needed to short-circuit) get the
+  model probabilities blended with their label history
+
+Environment:
+    ML_DOMAIN_PRIOR               Set to 0 to disable (default: 1)
+    ML_DOMAIN_PRIOR_THRESHOLD     Smoothed majority needed to skip the model (default: 0.98)
+    ML_DOMAIN_PRIOR_MIN_SAMPLES   Samples needed to skip the model (default: 30)
+    ML_DOMAIN_PRIOR_STRENGTH      Weight of the model, in pseudo-samples, when blending (default: 20)
+"""
+
+import os
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.ml import metrics, store
+from app.ml.preprocess import sender_domain
+
+logger = logging.getLogger(__name__)
+
+ML_DOMAIN_PRIOR = os.getenv("ML_DOMAIN_PRIOR", "1") == "1"
+ML_DOMAIN_PRIOR_THRESHOLD = float(os.getenv("ML_DOMAIN_PRIOR_THRESHOLD", "0.98"))
+ML_DOMAIN_PRIOR_MIN_SAMPLES = int(os.getenv("ML_DOMAIN_PRIOR_MIN_SAMPLES", "30"))
+ML_DOMAIN_PRIOR_STRENGTH = float(os.getenv("ML_DOMAIN_PRIOR_STRENGTH", "20"))
+
+DATASETS = ("classifier", "type_classifier")
+NUM_CLASSES = 2
+
+# name → sender domain → label counts
+_indexes: Dict[str, Dict[str, Counter]] = {}
+
+
+# ==========================================================
+# BUILD
+# ==========================================================
+
+def _count(index: Dict[str, Counter], row: Dict[str, Any]) -> None:
+    domain = sender_domain(row.get("source_domain"))
+    if not domain:
+        return
+    try:
+        label = int(row["label"])
+    except (KeyError, TypeError, ValueError):
+        return
+    index.setdefault(domain, Counter())[label] += 1
+
+
+def build_index(name: str, source: Path) -> Dict[str, Counter]:
+    index: Dict[str, Counter] = {}
+    for row in store.iter_records(source, name):
+        _count(index, row)
+    return index
+
+
+def rebuild(name: str, source: Optional[Path] = None) -> int:
+    """(Re)build one index from its training data and swap it in. Returns #senders."""
+    source = source or store.training_source(name)
+    if not ML_DOMAIN_PRIOR or not source.exists():
+        return 0
+
+    index = build_index(name, source)
+    _indexes[name] = index
+    logger.info(f"Domain prior for {name}: {len(index)} senders")
+    return len(index)
+
+
+def add(name: str, rows: List[Dict[str, Any]]) -> None:
+    """
+    Count newly appended samples into a built index, without re-reading
+    the training data. The full `rebuild()` runs with the next retraining
+    job.
+    """
+    index = _indexes.get(name)
+    if not ML_DOMAIN_PRIOR or index is None:
+        return
+    for row in rows:
+        _count(index, row)
+
+
+def rebuild_all() -> None:
+    for name in DATASETS:
+        rebuild(name)
+
+
+# ==========================================================
+# LOOKUP
+# ==========================================================
+
+def _smoothed(counts: Counter) -> Tuple[List[float], int]:
+    """Laplace-smoothed label distribution and sample count."""
+    total = sum(counts.values())
+    return [(counts.get(label, 0) + 1) / (total + NUM_CLASSES) for label in range(NUM_CLASSES)], total
+
+
+def _counts(name: str, from_email: Optional[str]) -> Optional[Counter]:
+    if not ML_DOMAIN_PRIOR or not from_email:
+        return None
+    domain = sender_domain(from_email)
+    return _indexes.get(name, {}).get(domain) if domain else None
+
+
+def shortcut(name: str, from_email: Optional[str]) -> Optional[Tuple[int, List[float]]]:
+    """
+    (label, probabilities) when the sender's history is overwhelming,
+    else None and the model has to run.
+    """
+    counts = _counts(name, from_email)
+    if not counts:
+        return None
+
+    proba, total = _smoothed(counts)
+    label = max(range(NUM_CLASSES), key=lambda i: proba[i])
+    if total < ML_DOMAIN_PRIOR_MIN_SAMPLES or proba[label] < ML_DOMAIN_PRIOR_THRESHOLD:
+        return None
+
+    metrics.increment(f"{name}.domain_prior.shortcut")
+    return label, proba
+
+
+def bias(name: str, from_email: Optional[str], proba: List[float]) -> Tuple[List[float], bool]:
+    """
+    Blend model probabilities with a sparse sender's label history:
+        p = (S * p_model + n * p_sender) / (S + n)
+    Returns (probabilities, whether they were changed).
+    """
+    counts = _counts(name, from_email)
+    if not counts:
+        return proba, False
+
+    prior, total = _smoothed(counts)
+    if total >= ML_DOMAIN_PRIOR_MIN_SAMPLES:
+        return proba, False
+
+    metrics.increment(f"{name}.domain_prior.bias")
+    weight = ML_DOMAIN_PRIOR_STRENGTH
+    return [(weight * p + total * q) / (weight + total) for p, q in zip(proba, prior)], True
+
+
+def get_stats() -> Dict[str, int]:
+    return {name: len(index) for name, index in _indexes.items()}
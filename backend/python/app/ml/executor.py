@@ -0,0 +1,138 @@
+"""
+Bounded worker pool for ML inference.
+
+spaCy and sklearn calls are synchronous, so running them directly inside
+`async def` endpoints blocks the event loop. Endpoints hand their work to
+`run_inference`, which dispatches it to a dedicated thread pool sized to the
+available cores, bounds the number of queued requests and enforces a
+per-request deadline.
+
+Environment:
+    ML_WORKERS          Worker threads (default: CPUs available to serving)
+    ML_MAX_QUEUE        Max in-flight + queued requests (default: 8 x workers)
+    ML_TIMEOUT_SECONDS  Per-request deadline in seconds (default: 10)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.ml.resources import serving_cpu_count
+
+logger = logging.getLogger(__name__)
+
+ML_WORKERS = int(os.getenv("ML_WORKERS", serving_cpu_count()))
+ML_MAX_QUEUE = int(os.getenv("ML_MAX_QUEUE", ML_WORKERS * 8))
+ML_TIMEOUT_SECONDS = float(os.getenv("ML_TIMEOUT_SECONDS", "10"))
+
+# Singleton pool + in-flight counter (only touched from the event loop thread)
+_executor: Optional[ThreadPoolExecutor] = None
+_in_flight = 0
+
+
+class InferenceOverloadedError(Exception):
+    """Raised when the inference queue is full."""
+
+
+class InferenceTimeoutError(Exception):
+    """Raised when a request misses its deadline."""
+
+
+# ==========================================================
+# POOL LIFECYCLE
+# ==========================================================
+
+def _preload_models() -> None:
+    """
+    Thread initializer: make sure every model is loaded before the
+    worker accepts its first request.
+    """
+    from app.ml.classifier import load_classifier_model
+    from app.ml.type_classifier import load_type_classifier_model
+    from app.ml.joint_classifier import load_joint_classifier_model
+    from app.ml.ner import load_ner_model
+
+    load_classifier_model()
+    load_type_classifier_model()
+    load_joint_classifier_model()
+    load_ner_model()
+
+
+def start_executor() -> ThreadPoolExecutor:
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=ML_WORKERS,
+            thread_name_prefix="ml-worker",
+            initializer=_preload_models,
+        )
+        logger.info(
+            f"ML worker pool started (workers={ML_WORKERS}, "
+            f"max_queue={ML_MAX_QUEUE}, timeout={ML_TIMEOUT_SECONDS}s)"
+        )
+
+    return _executor
+
+
+def shutdown_executor() -> None:
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        logger.info("ML worker pool stopped")
+
+
+def get_stats() -> dict:
+    return {
+        "workers": ML_WORKERS,
+        "max_queue": ML_MAX_QUEUE,
+        "in_flight": _in_flight,
+        "timeout_seconds": ML_TIMEOUT_SECONDS,
+    }
+
+
+# ==========================================================
+# DISPATCH
+# ==========================================================
+
+def _run_before_deadline(deadline: float, func: Callable, *args) -> Any:
+    """
+    Skips work whose caller has already given up while it sat in the queue.
+    """
+    if time.monotonic() > deadline:
+        raise InferenceTimeoutError("ML inference deadline exceeded before start")
+    return func(*args)
+
+
+async def run_inference(func: Callable, *args, timeout: Optional[float] = None) -> Any:
+    """
+    Run a synchronous inference function on the worker pool.
+
+    Raises:
+        InferenceOverloadedError: queue is full, request rejected immediately
+        InferenceTimeoutError: result not ready before the deadline
+    """
+    global _in_flight
+
+    if _in_flight >= ML_MAX_QUEUE:
+        raise InferenceOverloadedError("ML inference queue is full, retry later")
+
+    timeout = ML_TIMEOUT_SECONDS if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    loop = asyncio.get_running_loop()
+
+    _in_flight += 1
+    try:
+        future = loop.run_in_executor(
+            start_executor(), _run_before_deadline, deadline, func, *args
+        )
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        raise InferenceTimeoutError(f"ML inference timed out after {timeout}s")
+    finally:
+        _in_flight -= 1
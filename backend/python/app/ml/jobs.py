@@ -0,0 +1,347 @@
+"""
+Durable retraining job queue (SQLite).
+
+Retrain endpoints append their samples to the training data in the request
+and then `enqueue()` a job for the model's queue. Requests that arrive
+while a job of the same queue is still waiting coalesce into it (its
+request and sample counts grow), so a burst of feedback causes one
+training run, not one per request. A request arriving while a job is
+running queues exactly one follow-up run, which picks up everything
+appended in the meantime.
+
+Every process serving the `ml` role runs one dispatcher thread. It claims
+queued jobs (one running job per queue, across all workers sharing the
+database), runs each on its own thread through the handler registered
+for the queue, and refreshes the job's heartbeat while it runs. A job
+whose heartbeat is older than ML_JOB_STALE_SECONDS belonged to a worker
+that died; it goes back to the queue instead of blocking retraining.
+
+Job statuses: queued → running → succeeded | failed.
+
+Environment:
+    ML_JOBS_DB             Queue database (default: app/ml/data/jobs.sqlite3)
+    ML_JOB_POLL_SECONDS    How often the dispatcher looks for queued jobs (default: 5)
+    ML_JOB_STALE_SECONDS   Heartbeat age after which a running job is requeued (default: 120)
+    ML_JOB_HISTORY         Finished jobs kept per queue (default: 50)
+"""
+
+import os
+import json
+import sqlite3
+import socket
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ML_JOBS_DB = Path(os.getenv("ML_JOBS_DB", "app/ml/data/jobs.sqlite3"))
+ML_JOB_POLL_SECONDS = float(os.getenv("ML_JOB_POLL_SECONDS", "5"))
+ML_JOB_STALE_SECONDS = float(os.getenv("ML_JOB_STALE_SECONDS", "120"))
+ML_JOB_HISTORY = int(os.getenv("ML_JOB_HISTORY", "50"))
+
+# Modes a waiting job can be asked for; a coalesced job runs the strongest
+_MODE_RANK = {None: 0, "finetune": 0, "full": 1}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue        TEXT    NOT NULL,
+    mode         TEXT,
+    status       TEXT    NOT NULL,
+    requests     INTEGER NOT NULL DEFAULT 1,
+    samples      INTEGER NOT NULL DEFAULT 0,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    owner        TEXT,
+    created_at   TEXT    NOT NULL,
+    started_at   TEXT,
+    heartbeat_at TEXT,
+    finished_at  TEXT,
+    version      TEXT,
+    error        TEXT,
+    progress     TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_queue_status ON jobs (queue, status);
+"""
+
+# handler(job, report_progress) → promoted version (or None)
+JobHandler = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]], Optional[str]]
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+    del job["owner"]
+    return job
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    ML_JOBS_DB.parent.mkdir(parents=True, exist_ok=True)
+    # Autocommit mode; write paths open BEGIN IMMEDIATE themselves
+    conn = sqlite3.connect(ML_JOBS_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        yield conn
+    finally:
+        conn.close()
+
+
+@contextmanager
+def _transaction() -> Iterator[sqlite3.Connection]:
+    """Write transaction; takes the database write lock up front."""
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+# ==========================================================
+# QUEUE OPERATIONS
+# ==========================================================
+
+def enqueue(queue: str, samples: int = 0, mode: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Queue a run for `queue`, or coalesce into the job already waiting for
+    it. Returns the job the request belongs to.
+    """
+    now = _now().isoformat()
+    with _transaction() as conn:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE queue = ? AND status = 'queued' ORDER BY id LIMIT 1",
+            (queue,),
+        ).fetchone()
+
+        if row is None:
+            job_id = conn.execute(
+                "INSERT INTO jobs (queue, mode, status, samples, created_at) VALUES (?, ?, 'queued', ?, ?)",
+                (queue, mode, samples, now),
+            ).lastrowid
+        else:
+            job_id = row["id"]
+            if _MODE_RANK.get(mode, 0) > _MODE_RANK.get(row["mode"], 0):
+                conn.execute("UPDATE jobs SET mode = ? WHERE id = ?", (mode, job_id))
+            conn.execute(
+                "UPDATE jobs SET requests = requests + 1, samples = samples + ? WHERE id = ?",
+                (samples, job_id),
+            )
+
+        job = _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    logger.info(
+        f"Job {job['id']} ({queue}) {'queued' if job['requests'] == 1 else 'coalesced'}: "
+        f"{job['requests']} requests, {job['samples']} samples"
+    )
+    _dispatcher.wake()
+    return job
+
+
+def _requeue_stale(conn: sqlite3.Connection) -> None:
+    cutoff = (_now() - timedelta(seconds=ML_JOB_STALE_SECONDS)).isoformat()
+    stale = conn.execute(
+        "SELECT * FROM jobs WHERE status = 'running' AND heartbeat_at < ?", (cutoff,)
+    ).fetchall()
+
+    for row in stale:
+        waiting = conn.execute(
+            "SELECT id FROM jobs WHERE queue = ? AND status = 'queued' ORDER BY id LIMIT 1",
+            (row["queue"],),
+        ).fetchone()
+        if waiting is None:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, progress = NULL WHERE id = ?",
+                (row["id"],),
+            )
+            logger.warning(f"Job {row['id']} ({row['queue']}) lost its worker, requeued")
+            continue
+
+        # A newer job will train on the same data; fold this one into it
+        conn.execute(
+            "UPDATE jobs SET requests = requests + ?, samples = samples + ? WHERE id = ?",
+            (row["requests"], row["samples"], waiting["id"]),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+            (_now().isoformat(), f"Worker lost, coalesced into job {waiting['id']}", row["id"]),
+        )
+        logger.warning(f"Job {row['id']} ({row['queue']}) lost its worker, coalesced into job {waiting['id']}")
+
+
+def claim(queue: str) -> Optional[Dict[str, Any]]:
+    """Start the oldest queued job of `queue` unless one is already running."""
+    now = _now().isoformat()
+    with _transaction() as conn:
+        _requeue_stale(conn)
+
+        running = conn.execute(
+            "SELECT 1 FROM jobs WHERE queue = ? AND status = 'running'", (queue,)
+        ).fetchone()
+        if running is not None:
+            return None
+
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE queue = ? AND status = 'queued' ORDER BY id LIMIT 1",
+            (queue,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        conn.execute(
+            "UPDATE jobs SET status = 'running', owner = ?, attempts = attempts + 1, "
+            "started_at = ?, heartbeat_at = ? WHERE id = ?",
+            (_OWNER, now, now, row["id"]),
+        )
+        return _row_to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+
+def heartbeat(job_ids: List[int]) -> None:
+    if not job_ids:
+        return
+    placeholders = ",".join("?" * len(job_ids))
+    with _transaction() as conn:
+        conn.execute(
+            f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND owner = ? AND id IN ({placeholders})",
+            (_now().isoformat(), _OWNER, *job_ids),
+        )
+
+
+def report_progress(job_id: int, event: Dict[str, Any]) -> None:
+    with _transaction() as conn:
+        conn.execute(
+            "UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ? AND owner = ?",
+            (json.dumps(event), _now().isoformat(), job_id, _OWNER),
+        )
+
+
+def finish(job_id: int, version: Optional[str] = None, error: Optional[str] = None) -> None:
+    with _transaction() as conn:
+        row = conn.execute("SELECT queue FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, version = ?, error = ? WHERE id = ? AND owner = ?",
+            ("failed" if error else "succeeded", _now().isoformat(), version, error, job_id, _OWNER),
+        )
+        # Bounded history per queue
+        conn.execute(
+            "DELETE FROM jobs WHERE queue = ? AND status IN ('succeeded', 'failed') AND id NOT IN ("
+            "SELECT id FROM jobs WHERE queue = ? AND status IN ('succeeded', 'failed') ORDER BY id DESC LIMIT ?)",
+            (row["queue"], row["queue"], ML_JOB_HISTORY),
+        )
+
+
+def get_job(job_id: int) -> Optional[Dict[str, Any]]:
+    with _connect() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row) if row is not None else None
+
+
+def list_jobs(queue: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """Most recent jobs first."""
+    with _connect() as conn:
+        if queue is None:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE queue = ? ORDER BY id DESC LIMIT ?", (queue, limit)
+            ).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+
+# ==========================================================
+# DISPATCHER
+# ==========================================================
+
+class _Dispatcher:
+    def __init__(self):
+        self._handlers: Dict[str, JobHandler] = {}
+        self._running: Dict[str, int] = {}  # queue → job id run by this process
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, queue: str, handler: JobHandler) -> None:
+        self._handlers[queue] = handler
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="ml-jobs", daemon=True)
+            self._thread.start()
+        logger.info(f"Job dispatcher started ({', '.join(self._handlers) or 'no queues'})")
+
+    def wake(self) -> None:
+        self.start()
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while True:
+            try:
+                self._tick()
+            except Exception as e:
+                logger.exception(f"Job dispatcher error: {e}")
+            self._wake.wait(ML_JOB_POLL_SECONDS)
+            self._wake.clear()
+
+    def _tick(self) -> None:
+        with self._lock:
+            heartbeat(list(self._running.values()))
+            idle = [queue for queue in self._handlers if queue not in self._running]
+
+        for queue in idle:
+            job = claim(queue)
+            if job is None:
+                continue
+            with self._lock:
+                self._running[queue] = job["id"]
+            thread = threading.Thread(target=self._run, args=(job,), name=f"ml-job-{job['id']}", daemon=True)
+            thread.start()
+
+    @staticmethod
+    def _report(job_id: int, event: Dict[str, Any]) -> None:
+        # Progress is best effort, it must never fail the training itself
+        try:
+            report_progress(job_id, event)
+        except Exception as e:
+            logger.warning(f"Could not record progress of job {job_id}: {e}")
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        queue = job["queue"]
+        logger.info(f"Job {job['id']} ({queue}) started: {job['requests']} requests, {job['samples']} samples")
+        try:
+            version = self._handlers[queue](job, lambda event: self._report(job["id"], event))
+            finish(job["id"], version=version)
+            logger.info(f"Job {job['id']} ({queue}) succeeded{f' → {version}' if version else ''}")
+        except Exception as e:
+            logger.exception(f"Job {job['id']} ({queue}) failed: {e}")
+            finish(job["id"], error=str(e) or type(e).__name__)
+        finally:
+            with self._lock:
+                self._running.pop(queue, None)
+            # Requests that arrived meanwhile are already queued
+            self.wake()
+
+
+_dispatcher = _Dispatcher()
+
+
+def register_handler(queue: str, handler: JobHandler) -> None:
+    _dispatcher.register(queue, handler)
+
+
+def start_dispatcher() -> None:
+    _dispatcher.start()
@@ -0,0 +1,85 @@
+"""
+Joint classifier utility: transaction-or-not and debit-or-credit from a
+single model call. The model predicts non_transaction / credit / debit;
+both answers are derived from those three probabilities.
+"""
+
+import logging
+from typing import Optional
+
+from app.ml import domain_prior
+from app.ml.registry import registry
+from app.ml.preprocess import normalize_text
+from app.ml.classifier import _build_result as _build_transaction_result
+from app.ml.type_classifier import _build_result as _build_type_result
+
+logger = logging.getLogger(__name__)
+
+
+def load_joint_classifier_model():
+    """Return the active joint classifier model from the registry."""
+    loaded = registry.get_model("joint_classifier")
+    return loaded.model if loaded else None
+
+
+def classify_joint(email_body: str, from_email: Optional[str] = None) -> dict:
+    """
+    Classify an email as transaction or not, and as debit or credit, in one pass.
+
+    Args:
+        email_body: Raw email text to classify
+        from_email: Optional sender; enables the sender-domain prior
+
+    Returns:
+        {
+            'transaction': same shape as classify_email_func,
+            'type': same shape as classify_transaction_type
+                    (probabilities conditional on being a transaction),
+            'model_version': str, or None when the domain prior answered both
+        }
+    """
+    # Senders with an overwhelming history answer a head without the model
+    txn_prior = domain_prior.shortcut("classifier", from_email)
+    type_prior = domain_prior.shortcut("type_classifier", from_email)
+    if txn_prior is not None and type_prior is not None:
+        return {
+            'transaction': _build_transaction_result(txn_prior[0], txn_prior[1], 'domain_prior'),
+            'type': _build_type_result(type_prior[0], type_prior[1], 'domain_prior'),
+            'model_version': None,
+        }
+
+    loaded = registry.get_model("joint_classifier")
+    if loaded is None:
+        return {'error': 'Joint classifier model not loaded'}
+
+    try:
+        text = normalize_text(email_body)
+        non_txn, credit, debit = (float(p) for p in loaded.model.predict_proba([text])[0])
+        txn = credit + debit
+
+        if txn_prior is not None:
+            transaction = _build_transaction_result(txn_prior[0], txn_prior[1], 'domain_prior')
+        else:
+            # Biased for sparse senders exactly like the separate classifiers
+            proba, biased = domain_prior.bias("classifier", from_email, [non_txn, txn])
+            transaction = _build_transaction_result(
+                int(proba[1] > proba[0]), proba, 'model+prior' if biased else 'model'
+            )
+
+        if type_prior is not None:
+            txn_type = _build_type_result(type_prior[0], type_prior[1], 'domain_prior')
+        else:
+            proba = [credit / txn, debit / txn] if txn > 0 else [0.5, 0.5]
+            proba, biased = domain_prior.bias("type_classifier", from_email, proba)
+            txn_type = _build_type_result(
+                int(proba[1] > proba[0]), proba, 'model+prior' if biased else 'model'
+            )
+
+        return {
+            'transaction': transaction,
+            'type': txn_type,
+            'model_version': loaded.version,
+        }
+    except Exception as e:
+        logger.error(f"Error running joint classifier: {e}")
+        return {'error': str(e)}
@@ -0,0 +1,21 @@
+"""
+In-process counters for the ML serving paths (rule/model/template hits,
+fallbacks, ...). Exposed via `GET /ml/metrics`.
+"""
+
+import threading
+from collections import Counter
+from typing import Dict
+
+_lock = threading.Lock()
+_counters: Counter = Counter()
+
+
+def increment(name: str, value: int = 1) -> None:
+    with _lock:
+        _counters[name] += value
+
+
+def snapshot() -> Dict[str, int]:
+    with _lock:
+        return dict(_counters)
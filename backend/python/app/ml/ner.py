@@ -1,114 +1,195 @@
-import spacy
-from pathlib import Path
+import os
 import logging
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
+
+from app.ml import metrics
+from app.ml.registry import registry
+from app.ml.preprocess import prepare_input
+from app.ml.rules import AMOUNT_LABEL, find_transaction_amount, parse_amount
+from app.ml.templates import ML_NER_TEMPLATES, match_template
 
 logger = logging.getLogger(__name__)
 
-MODELS_DIR = Path("app/ml/models")
+# Inputs longer than this are split into overlapping windows
+ML_NER_WINDOW_CHARS = int(os.getenv("ML_NER_WINDOW_CHARS", "1000"))
+ML_NER_WINDOW_OVERLAP = int(os.getenv("ML_NER_WINDOW_OVERLAP", "200"))
+ML_NER_BATCH_SIZE = int(os.getenv("ML_NER_BATCH_SIZE", "4"))
+
+# off: model only | augment: model, rules fill a missing AMOUNT |
+# fast: rules alone when they cover every required label. The rules only
+# find AMOUNT, so with the default required labels fast mode applies to
+# requests that pass labels=["AMOUNT"]
+ML_NER_RULES_MODE = os.getenv("ML_NER_RULES_MODE", "augment")
+ML_NER_REQUIRED_LABELS = os.getenv("ML_NER_REQUIRED_LABELS", "AMOUNT,MERCHANT").split(",")
 
-# Singleton cache
-_ner_model = None
-_loaded_version = None
+# (start_char, end_char, label)
+Span = Tuple[int, int, str]
 
 
 # ==========================================================
-# MODEL DISCOVERY
+# MODEL LOADER (REGISTRY-BACKED)
 # ==========================================================
 
-def _get_latest_model_path() -> Optional[Path]:
+def load_ner_model():
     """
-    Finds the highest ner_vX directory.
+    Returns the active NER model. Versions are switched by the registry
+    once training has completely finished, never on the request path.
     """
-
-    versions = []
-
-    for p in MODELS_DIR.glob("ner_v*"):
-        try:
-            v = int(p.name.split("_v")[-1])
-            versions.append((v, p))
-        except ValueError:
-            continue
-
-    if not versions:
-        return None
-
-    latest_version, latest_dir = max(versions, key=lambda x: x[0])
-    return latest_dir / "model-best"
+    loaded = registry.get_model("ner")
+    return loaded.model if loaded else None
 
 
 # ==========================================================
-# MODEL LOADER (AUTO RELOAD)
+# WINDOWED EXTRACTION
 # ==========================================================
 
-def load_ner_model():
+def _window_bounds(text: str, size: int, overlap: int) -> Iterator[Tuple[int, int]]:
     """
-    Loads latest NER model if not loaded or outdated.
+    Yields overlapping [start, end) windows. Window ends are pulled back to
+    a line / sentence / word boundary in their second half so entities are
+    rarely cut; the overlap covers the ones that are.
     """
+    length = len(text)
+    start = 0
 
-    global _ner_model, _loaded_version
-
-    model_path = _get_latest_model_path()
-
-    if model_path is None or not model_path.exists():
-        logger.warning("No trained NER model found")
-        return None
-
-    current_version = model_path.parent.name
+    while True:
+        end = min(start + size, length)
+        if end < length:
+            for boundary in ("\n", ". ", " "):
+                cut = text.rfind(boundary, start + size // 2, end)
+                if cut != -1:
+                    end = cut + len(boundary)
+                    break
 
-    # Already loaded newest version
-    if _ner_model and _loaded_version == current_version:
-        return _ner_model
+        yield start, end
+        if end >= length:
+            return
 
-    try:
-        logger.info(f"Loading NER model → {current_version}")
-
-        _ner_model = spacy.load(model_path)
-        _loaded_version = current_version
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
 
-        logger.info("NER model loaded successfully")
 
-        return _ner_model
-
-    except Exception as e:
-        logger.error(f"Failed loading NER model: {e}")
-        return None
-
-
-def extract_entities(email_body: str) -> dict:
+def _dedupe_spans(spans: List[Span]) -> List[Span]:
+    """
+    Entities found twice in an overlap (or cut at a window edge in one
+    window and whole in the next) collapse to the longest span.
+    """
+    kept: List[Span] = []
+    for span in sorted(spans, key=lambda s: (s[0], -(s[1] - s[0]))):
+        if kept and span[0] < kept[-1][1]:
+            if span[1] - span[0] > kept[-1][1] - kept[-1][0]:
+                kept[-1] = span
+            continue
+        kept.append(span)
+    return kept
+
+
+def _extract_spans(model, text: str) -> List[Span]:
+    if len(text) <= ML_NER_WINDOW_CHARS:
+        return [(ent.start_char, ent.end_char, ent.label_) for ent in model(text).ents]
+
+    bounds = list(_window_bounds(text, ML_NER_WINDOW_CHARS, ML_NER_WINDOW_OVERLAP))
+    docs = model.pipe((text[s:e] for s, e in bounds), batch_size=ML_NER_BATCH_SIZE)
+
+    spans: List[Span] = []
+    for (offset, _), doc in zip(bounds, docs):
+        spans.extend(
+            (ent.start_char + offset, ent.end_char + offset, ent.label_) for ent in doc.ents
+        )
+    return _dedupe_spans(spans)
+
+
+def _to_entity(email_body: str, normalized, span: Span) -> dict:
+    start, end = normalized.to_original_span(span[0], span[1])
+    text = email_body[start:end]
+    return {
+        'text': text,
+        'label': span[2],
+        'start': start,
+        'end': end,
+        'value': parse_amount(text) if span[2] == AMOUNT_LABEL else None,
+    }
+
+
+def extract_entities(
+    email_body: str,
+    labels: Optional[List[str]] = None,
+    from_email: Optional[str] = None,
+) -> dict:
+    """
+    Extract AMOUNT / MERCHANT entities.
+
+    Cascade: sender template match (needs `from_email`; used when its
+    slots cover every required label) → amount rules → spaCy. `labels`
+    lists the entities the caller needs (default: all, with
+    ML_NER_REQUIRED_LABELS as the required ones). With
+    ML_NER_RULES_MODE=fast, requests that only need AMOUNT are answered by
+    the amount rules without running the statistical model.
+    """
     if not email_body or not isinstance(email_body, str):
         return {
             'text': email_body,
             'entities': [],
             'error': 'Invalid input: email_body must be a non-empty string'
         }
-    
-    model = load_ner_model()
-    if model is None:
-        return {
-            'text': email_body,
-            'entities': [],
-            'error': 'NER model not loaded'
-        }
-    
+
+    required = set(labels or ML_NER_REQUIRED_LABELS)
+
+    # Snapshot model + version together so a concurrent swap cannot mix them
+    loaded = registry.get_model("ner")
+    model_version = loaded.version if loaded else None
+
     try:
-        # Process text with spaCy
-        doc = model(email_body)
-        
-        # Extract entities
-        entities = []
-        for ent in doc.ents:
-            entities.append({
-                'text': ent.text,
-                'label': ent.label_,
-                'start': ent.start_char,
-                'end': ent.end_char
-            })
-        
+        # Strip markup/boilerplate, then process the shorter text
+        normalized = prepare_input(email_body)
+
+        template_spans = None
+        if ML_NER_TEMPLATES and from_email:
+            template_spans = match_template(normalized.text, from_email)
+        template_covers = template_spans is not None and required <= {label for _, _, label in template_spans}
+
+        rule_amount = None
+        if not template_covers and ML_NER_RULES_MODE != "off":
+            rule_amount = find_transaction_amount(normalized.text)
+        rules_cover = rule_amount is not None and required <= {AMOUNT_LABEL}
+
+        # `path` names the source of the spans; model_version stays the
+        # registry version, which the Node side stores with the transaction
+        if template_covers:
+            path = "template"
+            spans = template_spans
+        elif rules_cover and (ML_NER_RULES_MODE == "fast" or loaded is None):
+            path = "rules"
+            spans = [(rule_amount[0], rule_amount[1], AMOUNT_LABEL)]
+        elif loaded is None:
+            return {
+                'text': email_body,
+                'entities': [],
+                'error': 'NER model not loaded'
+            }
+        else:
+            # Long inputs are processed in overlapping windows
+            path = "model"
+            spans = _extract_spans(loaded.model, normalized.text)
+            if rule_amount is not None and not any(label == AMOUNT_LABEL for _, _, label in spans):
+                path = "model+rules"
+                spans.append((rule_amount[0], rule_amount[1], AMOUNT_LABEL))
+
+        metrics.increment(f"ner.path.{path}")
+
+        # Map spans back into the original body
+        entities = [
+            _to_entity(email_body, normalized, span)
+            for span in sorted(spans)
+            if labels is None or span[2] in required
+        ]
+
         return {
             'text': email_body,
             'entities': entities,
-            'model_version': _loaded_version,
+            'model_version': model_version,
+            'path': path,
             'error': None
         }
     except Exception as e:
@@ -116,6 +197,6 @@ def extract_entities(email_body: str) -> dict:
         return {
             'text': email_body,
             'entities': [],
-            'model_version': _loaded_version,
+            'model_version': model_version,
             'error': str(e)
         }
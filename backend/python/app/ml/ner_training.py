@@ -0,0 +1,266 @@
+"""
+NER training in one process: JSONL (or training store) → incremental corpus → `spacy train`.
+
+The whole pipeline runs in one Python process with one spaCy import. Only
+samples appended since the last run are converted (see `app/ml/corpus.py`);
+spaCy streams the train/dev docs from the corpus shards through the
+`regmar.ShardedCorpus.v1` reader, and training progress is reported as
+structured events through the `regmar.ProgressLogger.v1` logger instead of
+the console table.
+
+Progress events are dicts with a `stage` key:
+    {"stage": "corpus", "generation": 0, "added": 3, "docs": 120, "shards": 2, "misaligned": 0}
+    {"stage": "initialize", "mode": "finetune", "base": "ner_v3"}
+    {"stage": "train", "epoch": 3, "step": 200, "score": 0.91, "losses": {"ner": 12.4}}
+    {"stage": "done", "output": "app/ml/models/ner_v4", "score": 0.93, "seconds": 41.2}
+
+Two modes:
+
+- finetune (default): start from the active `ner_vN/model-best` and train
+  on the docs it has not seen plus ML_NER_REPLAY_DOCS older ones (a new
+  sample every epoch), for at most ML_NER_FINETUNE_STEPS steps with early
+  stopping (ML_NER_FINETUNE_PATIENCE) on the stable dev set. A handful of
+  feedback samples reach the serving model in well under a minute.
+- full: from random initialization on the whole corpus with the step
+  budget of config.cfg. Used automatically when there is no base to
+  fine-tune from (no active model, a model trained outside this pipeline,
+  or a rebuilt corpus), and by the scheduled `POST /ml/rebuild-ner`.
+
+Each output directory records what it was trained on (`training_state.json`),
+which is what the next fine-tune starts from. The file is written last and
+is what tells the registry that the version is complete.
+
+The retraining pipeline runs this module as a single child process, which
+keeps training off the serving process's GIL and memory at the cost of one
+interpreter start-up and spaCy import; the child prints its progress events
+as JSON lines. ML_NER_TRAIN_ISOLATION=thread calls `train_ner()` on the
+job thread instead, for a deployment whose `ml` role only trains.
+
+Usage:
+    python -m app.ml.ner_training <input.jsonl|training.sqlite3> <output_dir> [finetune|full]
+
+Environment:
+    ML_NER_TRAIN_ISOLATION     "process" (default) or "thread"
+    ML_NER_TRAIN_MODE          "finetune" (default) or "full"
+    ML_NER_FINETUNE_STEPS      Step budget of a fine-tune (default: 600)
+    ML_NER_FINETUNE_PATIENCE   Steps without dev improvement before a fine-tune stops (default: 200)
+    ML_NER_REPLAY_DOCS         Older train docs replayed per fine-tune epoch (default: 200)
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import spacy
+from spacy.language import Language
+from spacy.training.initialize import init_nlp
+from spacy.training.loop import train
+from spacy.util import load_config
+
+from app.ml.corpus import ShardedCorpus
+from app.ml.registry import NER_COMPLETE_MARKER as TRAINING_STATE_FILE
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = Path(__file__).resolve().parents[1] / "config.cfg"
+ML_NER_TRAIN_ISOLATION = os.getenv("ML_NER_TRAIN_ISOLATION", "process")
+ML_NER_TRAIN_MODE = os.getenv("ML_NER_TRAIN_MODE", "finetune")
+ML_NER_FINETUNE_STEPS = int(os.getenv("ML_NER_FINETUNE_STEPS", "600"))
+ML_NER_FINETUNE_PATIENCE = int(os.getenv("ML_NER_FINETUNE_PATIENCE", "200"))
+ML_NER_REPLAY_DOCS = int(os.getenv("ML_NER_REPLAY_DOCS", "200"))
+# Fine-tunes are short, evaluate often enough for early stopping to matter
+_FINETUNE_EVAL_FREQUENCY = 50
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+# Progress callback of the training running on this thread
+_local = threading.local()
+
+
+# ==========================================================
+# SPACY REGISTRY HOOKS
+# ==========================================================
+
+@spacy.registry.loggers("regmar.ProgressLogger.v1")
+def create_progress_logger():
+    """Training logger that emits a progress event per evaluation."""
+
+    def setup(nlp: Language, stdout=sys.stdout, stderr=sys.stderr):
+        def log_step(info: Optional[Dict[str, Any]]) -> None:
+            if info is None:
+                return
+            _emit({
+                "stage": "train",
+                "epoch": info["epoch"],
+                "step": info["step"],
+                "score": round(float(info["score"]), 4),
+                "losses": {name: round(float(loss), 4) for name, loss in info["losses"].items()},
+            })
+
+        def finalize() -> None:
+            pass
+
+        return log_step, finalize
+
+    return setup
+
+
+def _emit(event: Dict[str, Any]) -> None:
+    callback = getattr(_local, "on_progress", None)
+    if callback is not None:
+        callback(event)
+
+
+def _restore_config(model_dir: Path, original) -> None:
+    """Saved pipelines must not reference the corpus shards or progress logger."""
+    config_path = model_dir / "config.cfg"
+    if not config_path.exists():
+        return
+    config = load_config(config_path, interpolate=False)
+    config["corpora"] = original["corpora"]
+    config["training"]["logger"] = original["training"]["logger"]
+    config.to_disk(config_path)
+
+
+def _finetune_base(generation: int) -> Optional[Dict[str, Any]]:
+    """
+    Training state of the active NER version if it can be fine-tuned on
+    this corpus generation, else None.
+    """
+    from app.ml.registry import registry, MODELS_DIR
+
+    version = registry.status()["ner"]["active"]
+    if not version:
+        return None
+    state_path = MODELS_DIR / version / TRAINING_STATE_FILE
+    if not state_path.exists():
+        return None
+    state = json.loads(state_path.read_text(encoding="utf-8"))
+    if state.get("generation") != generation:
+        return None
+    return {**state, "version": version, "path": str(MODELS_DIR / version / "model-best")}
+
+
+# ==========================================================
+# PIPELINE
+# ==========================================================
+
+def train_ner(
+    data_path: Path,
+    output_dir: Path,
+    on_progress: Optional[ProgressCallback] = None,
+    overrides: Optional[Dict[str, Any]] = None,
+    mode: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Train a NER pipeline from a JSONL file or the training store into `output_dir`
+    (model-best/, model-last/). `mode` is "finetune" or "full" (default:
+    ML_NER_TRAIN_MODE). `overrides` are dotted config overrides, e.g.
+    {"training.max_steps": 2000}. Returns the final "done" event.
+    """
+    mode = mode or ML_NER_TRAIN_MODE
+    if mode not in ("finetune", "full"):
+        raise ValueError(f"Unknown NER training mode: {mode}")
+
+    start = time.perf_counter()
+    _local.on_progress = on_progress
+
+    try:
+        original = load_config(CONFIG_PATH, overrides=overrides or {}, interpolate=False)
+        corpus = ShardedCorpus(lang=original["nlp"]["lang"])
+
+        stats = corpus.sync(data_path)
+        if not stats["docs"]:
+            raise ValueError(f"No training documents in {data_path}")
+        _emit({"stage": "corpus", **stats})
+
+        base = _finetune_base(stats["generation"]) if mode == "finetune" else None
+        if mode == "finetune" and base is None:
+            logger.info("No fine-tunable NER model for this corpus, training from scratch")
+            mode = "full"
+
+        config = original.copy()
+        reader = {"@readers": "regmar.ShardedCorpus.v1", "path": str(corpus.root)}
+        config["corpora"] = {
+            "train": {**reader, "split": "train", "seed": config["system"]["seed"]},
+            "dev": {**reader, "split": "dev"},
+        }
+        config["training"]["logger"] = {"@loggers": "regmar.ProgressLogger.v1"}
+        # Stream the corpus, one call of the reader per epoch
+        config["training"]["max_epochs"] = -1
+
+        if base is not None:
+            config["corpora"]["train"].update(new_from=base["docs"], replay=ML_NER_REPLAY_DOCS)
+            for name in config["nlp"]["pipeline"]:
+                config["components"][name] = {"source": base["path"]}
+            config["training"].update(
+                max_steps=ML_NER_FINETUNE_STEPS,
+                patience=ML_NER_FINETUNE_PATIENCE,
+                eval_frequency=_FINETUNE_EVAL_FREQUENCY,
+            )
+
+        # Shards must not be compacted away while spaCy streams them
+        with corpus.lock():
+            # With max_epochs=-1 an empty train split would never end
+            new_from = base["docs"] if base is not None else 0
+            if not corpus.count_train(spacy.blank(original["nlp"]["lang"]).vocab, new_from=new_from):
+                if base is not None:
+                    raise ValueError(f"Nothing to fine-tune: no new train documents since {base['version']}")
+                raise ValueError(f"No train documents in {data_path}, every sample falls in the dev split")
+
+            output_dir = Path(output_dir)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            _emit({"stage": "initialize", "mode": mode, "base": base and base["version"]})
+            nlp = init_nlp(config)
+            quiet = io.StringIO()
+            train(nlp, output_dir, stdout=quiet, stderr=quiet)
+
+        for model_dir in ("model-best", "model-last"):
+            _restore_config(output_dir / model_dir, original)
+
+        # Last step: the state file is the registry's completion marker
+        state = {
+            "mode": mode,
+            "base": base and base["version"],
+            "generation": stats["generation"],
+            "docs": stats["docs"],
+        }
+        state_tmp = output_dir / f"{TRAINING_STATE_FILE}.tmp"
+        state_tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+        os.replace(state_tmp, output_dir / TRAINING_STATE_FILE)
+
+        best_meta = json.loads((output_dir / "model-best" / "meta.json").read_text(encoding="utf-8"))
+        done = {
+            "stage": "done",
+            "mode": mode,
+            "output": str(output_dir),
+            "score": best_meta.get("performance", {}).get("ents_f"),
+            "seconds": round(time.perf_counter() - start, 1),
+        }
+        _emit(done)
+        return done
+    finally:
+        _local.on_progress = None
+
+
+def _print_event(event: Dict[str, Any]) -> None:
+    print(json.dumps(event), flush=True)
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    mode = sys.argv[3] if len(sys.argv) > 3 else None
+    train_ner(Path(sys.argv[1]), Path(sys.argv[2]), on_progress=_print_event, mode=mode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Online-updatable email and type classifiers.
+
+Alternative model family for `classifier` and `type_classifier`
+(ML_CLASSIFIER_FAMILY=online): a stateless HashingVectorizer feeding an
+SGD logistic-regression model. Nothing in the featurizer depends on the
+training data, so new samples can be folded in with `partial_fit` in
+milliseconds instead of refitting TF-IDF + LogisticRegression on the whole
+CSV.
+
+The current weights live in a checkpoint (`models/online/<artifact>.joblib`).
+`update()` loads it, applies `partial_fit` to the new samples only and
+writes it back; the caller then registers the checkpoint as a new registry
+version, which serving loads like any other joblib classifier. Because
+many small SGD steps drift, a full refit from the CSV (`refit()`) runs
+after every ML_ONLINE_REFIT_EVERY updates. Samples appended while a refit
+is fitting are folded into the refit model before it replaces the
+checkpoint.
+
+Usage (the full refit, run by the retraining pipeline):
+    python -m app.ml.online refit <classifier|type_classifier> <data.csv|training.sqlite3>
+
+Environment:
+    ML_CLASSIFIER_FAMILY         "tfidf" (default) or "online"
+    ML_ONLINE_FEATURES           Hashing space size (default: 262144)
+    ML_ONLINE_SYNC_MAX_SAMPLES   Largest batch applied synchronously by the retrain endpoints (default: 50)
+    ML_ONLINE_REFIT_EVERY        Online updates between full refits (default: 20)
+"""
+
+import os
+import sys
+import json
+import fcntl
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import joblib
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
+
+from app.ml.registry import MODELS_DIR, MODEL_SPECS
+
+logger = logging.getLogger(__name__)
+
+ML_CLASSIFIER_FAMILY = os.getenv("ML_CLASSIFIER_FAMILY", "tfidf")
+ML_ONLINE_FEATURES = int(os.getenv("ML_ONLINE_FEATURES", str(2 ** 18)))
+ML_ONLINE_SYNC_MAX_SAMPLES = int(os.getenv("ML_ONLINE_SYNC_MAX_SAMPLES", "50"))
+ML_ONLINE_REFIT_EVERY = max(1, int(os.getenv("ML_ONLINE_REFIT_EVERY", "20")))
+
+ONLINE_DIR = MODELS_DIR / "online"
+ONLINE_MODELS = ("classifier", "type_classifier")
+CLASSES = [0, 1]
+
+
+def build_pipeline() -> Pipeline:
+    return Pipeline([
+        ('features', HashingVectorizer(
+            n_features=ML_ONLINE_FEATURES,
+            ngram_range=(1, 2),
+            stop_words='english',
+            alternate_sign=False,
+            norm='l2',
+        )),
+        ('classifier', SGDClassifier(
+            loss='log_loss',  # predict_proba for confidence / probabilities
+            alpha=1e-5,
+            random_state=42,
+        )),
+    ])
+
+
+def checkpoint_path(name: str) -> Path:
+    return ONLINE_DIR / MODEL_SPECS[name].artifact
+
+
+def _state_path(name: str) -> Path:
+    return ONLINE_DIR / f"{name}_state.json"
+
+
+def read_state(name: str) -> Dict[str, Any]:
+    path = _state_path(name)
+    if not path.exists():
+        return {"samples": 0, "updates_since_refit": 0}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def has_checkpoint(name: str) -> bool:
+    return checkpoint_path(name).exists()
+
+
+@contextmanager
+def _locked(name: str) -> Iterator[None]:
+    """One writer per checkpoint, across worker processes."""
+    ONLINE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(ONLINE_DIR / f"{name}.lock", "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _save(name: str, pipeline: Pipeline, state: Dict[str, Any]) -> None:
+    # Temp file + rename so the registry never copies a partial checkpoint
+    path = checkpoint_path(name)
+    tmp = path.with_suffix(".joblib.tmp")
+    joblib.dump(pipeline, tmp)
+    tmp.replace(path)
+
+    state_tmp = _state_path(name).with_suffix(".json.tmp")
+    state_tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    state_tmp.replace(_state_path(name))
+
+
+# ==========================================================
+# TRAINING
+# ==========================================================
+
+def update(name: str, texts: List[str], labels: List[int]) -> Dict[str, Any]:
+    """
+    Fold new (already normalized) samples into the checkpoint with
+    `partial_fit`. Returns the checkpoint state.
+    """
+    with _locked(name):
+        pipeline = joblib.load(checkpoint_path(name))
+        features = pipeline.named_steps['features'].transform(texts)
+        pipeline.named_steps['classifier'].partial_fit(features, labels, classes=CLASSES)
+
+        state = read_state(name)
+        state["samples"] += len(texts)
+        state["updates_since_refit"] += 1
+        _save(name, pipeline, state)
+
+    logger.info(f"Online {name} update: +{len(texts)} samples ({state['updates_since_refit']} since refit)")
+    return state
+
+
+def refit(
+    name: str,
+    texts: List[str],
+    labels: List[int],
+    source: Optional[str] = None,
+    since: int = 0,
+) -> Dict[str, Any]:
+    """
+    Fit a fresh model on the whole dataset and checkpoint it. With
+    `source`, the samples appended to it after position `since` (taken
+    before the dataset was read) are folded in with `partial_fit` before
+    the checkpoint is replaced, so online updates made while the fit ran
+    are not lost.
+    """
+    pipeline = build_pipeline()
+    pipeline.fit(texts, labels)
+
+    with _locked(name):
+        later = _catch_up(name, pipeline, source, since) if source is not None else 0
+        state = {"samples": len(texts) + later, "updates_since_refit": 0}
+        _save(name, pipeline, state)
+
+    logger.info(f"Online {name} refit on {len(texts)} samples, +{later} appended during the fit")
+    return state
+
+
+def _catch_up(name: str, pipeline: Pipeline, source: str, since: int) -> int:
+    from app.ml.preprocess import normalize_text
+    from app.ml.store import records_after
+
+    texts, labels = [], []
+    for record in records_after(source, name, since):
+        try:
+            labels.append(int(record["label"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+        texts.append(normalize_text(str(record["text"])))
+    if texts:
+        features = pipeline.named_steps['features'].transform(texts)
+        pipeline.named_steps['classifier'].partial_fit(features, labels, classes=CLASSES)
+    return len(texts)
+
+
+def needs_refit(name: str) -> bool:
+    return read_state(name)["updates_since_refit"] >= ML_ONLINE_REFIT_EVERY
+
+
+def main():
+    if len(sys.argv) < 4 or sys.argv[1] != "refit" or sys.argv[2] not in ONLINE_MODELS:
+        print(__doc__)
+        sys.exit(1)
+
+    from app.ml.preprocess import normalize_text
+    from app.ml.store import position, read_frame
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    # Taken before the read: a sample appended meanwhile is folded in twice
+    # at worst, never dropped
+    since = position(sys.argv[3], sys.argv[2])
+    df = read_frame(sys.argv[3], sys.argv[2])
+    if df.empty:
+        print(f"Error: {sys.argv[3]} is empty")
+        sys.exit(1)
+
+    texts = df['text'].astype(str).map(normalize_text).tolist()
+    labels = df['label'].astype(int).tolist()
+    state = refit(sys.argv[2], texts, labels, source=sys.argv[3], since=since)
+    print(json.dumps(state))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Email body normalization applied before inference.
+
+Bank emails arrive with HTML markup, footers, disclaimers and long legal
+text while the amount and merchant sit in one or two sentences. This stage:
+
+1. converts HTML to text (dropping <script>/<style>, block tags → newlines)
+2. collapses whitespace
+3. strips known boilerplate lines and everything after a disclaimer header
+4. caps the length
+
+Every character of the normalized text keeps the index of the character it
+came from in the original body, so NER spans found on the normalized text
+can be mapped back to the text the caller sent.
+
+Environment:
+    ML_NORMALIZE_INPUT  Set to 0 to feed raw bodies to the models (default: 1)
+    ML_MAX_INPUT_CHARS  Normalized text is truncated to this length (default: 4000)
+"""
+
+import os
+import re
+from array import array
+from html.parser import HTMLParser
+from html import unescape
+from typing import List, NamedTuple, Optional, Tuple
+
+ML_NORMALIZE_INPUT = os.getenv("ML_NORMALIZE_INPUT", "1") == "1"
+ML_MAX_INPUT_CHARS = int(os.getenv("ML_MAX_INPUT_CHARS", "4000"))
+
+_HTML_HINT = re.compile(r"<\s*(html|body|div|p|br|table|tr|td|span|a|font|b|strong)\b", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+_LINE = re.compile(r"[^\n]*\n?")
+
+# Lines that are pure boilerplate. Only dropped when they carry no amount.
+_BOILERPLATE_LINE = re.compile(
+    r"unsubscribe|do\s+not\s+reply|don'?t\s+reply|system[\s-]+generated|privacy\s+policy"
+    r"|all\s+rights\s+reserved|©|\(c\)\s*\d{4}|never\s+share\s+your"
+    r"|view\s+(this\s+e-?mail\s+)?in\s+(your\s+)?browser|terms\s+(and|&)\s+conditions\s+apply",
+    re.IGNORECASE,
+)
+# Headers after which the rest of the email is legal text.
+_BOILERPLATE_CUTOFF = re.compile(
+    r"^\s*(disclaimer|important\s+(notice|information)|confidentiality\s+notice"
+    r"|this\s+e-?mail\s+(and\s+any|is\s+confidential|message\s+is\s+intended))\b",
+    re.IGNORECASE,
+)
+_AMOUNT_HINT = re.compile(r"(rs\.?|inr|₹)\s*[\d,]+", re.IGNORECASE)
+_EMAIL_ADDRESS = re.compile(r"[\w.+-]+@([\w-]+(?:\.[\w-]+)+)")
+
+_BLOCK_TAGS = {
+    "br", "p", "div", "tr", "li", "ul", "ol", "table", "h1", "h2", "h3",
+    "h4", "h5", "h6", "hr", "section", "article", "header", "footer",
+}
+_SKIP_TAGS = {"script", "style", "head", "title"}
+
+
+class NormalizedText(NamedTuple):
+    text: str
+    offsets: array  # offsets[i] = index in the original body of text[i]
+
+    def to_original_span(self, start: int, end: int) -> Tuple[int, int]:
+        """Map a [start, end) span of the normalized text to the original body."""
+        return self.offsets[start], self.offsets[end - 1] + 1
+
+
+# A segment is (original_start, text, verbatim). Verbatim segments map
+# character by character; others (decoded entities, synthetic line breaks)
+# map every character to original_start.
+Segment = Tuple[int, str, bool]
+
+
+# ==========================================================
+# HTML → TEXT
+# ==========================================================
+
+class _HTMLSegmenter(HTMLParser):
+    def __init__(self, raw: str):
+        super().__init__(convert_charrefs=False)
+        self.segments: List[Segment] = []
+        self._skip_depth = 0
+        # Absolute offset of each line start, to turn getpos() into an index
+        self._line_starts = [0] + [m.end() for m in re.finditer("\n", raw)]
+
+    def _offset(self) -> int:
+        line, col = self.getpos()
+        return self._line_starts[line - 1] + col
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in _BLOCK_TAGS:
+            self.segments.append((self._offset(), "\n", False))
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in _BLOCK_TAGS:
+            self.segments.append((self._offset(), "\n", False))
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in _BLOCK_TAGS:
+            self.segments.append((self._offset(), "\n", False))
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.segments.append((self._offset(), data, True))
+
+    def handle_entityref(self, name):
+        if not self._skip_depth:
+            self.segments.append((self._offset(), unescape(f"&{name};"), False))
+
+    def handle_charref(self, name):
+        if not self._skip_depth:
+            self.segments.append((self._offset(), unescape(f"&#{name};"), False))
+
+
+def _html_segments(raw: str) -> List[Segment]:
+    parser = _HTMLSegmenter(raw)
+    parser.feed(raw)
+    parser.close()
+    return parser.segments
+
+
+# ==========================================================
+# WHITESPACE / BOILERPLATE / LENGTH
+# ==========================================================
+
+def _collapse_whitespace(segments: List[Segment]) -> Tuple[str, array]:
+    """
+    Runs of whitespace become a single space, or a single newline if the
+    run contained one. Leading whitespace is dropped.
+    """
+    parts: List[str] = []
+    offsets = array("l")
+    last = "\n"  # pretend we start after a newline so leading space is dropped
+
+    def emit(text: str, orig: int, verbatim: bool) -> None:
+        nonlocal last
+        parts.append(text)
+        if verbatim:
+            offsets.extend(range(orig, orig + len(text)))
+        else:
+            offsets.extend([orig] * len(text))
+        last = text[-1]
+
+    def emit_space(run: str, orig: int) -> None:
+        nonlocal last
+        if "\n" in run:
+            if last == " ":
+                # Replace the trailing space by the newline
+                parts[-1] = parts[-1][:-1]
+                offsets.pop()
+                last = ""
+            if last != "\n":
+                parts.append("\n")
+                offsets.append(orig)
+                last = "\n"
+        elif last not in (" ", "\n"):
+            parts.append(" ")
+            offsets.append(orig)
+            last = " "
+
+    for orig, text, verbatim in segments:
+        pos = 0
+        for m in _WHITESPACE.finditer(text):
+            if m.start() > pos:
+                emit(text[pos:m.start()], orig + pos if verbatim else orig, verbatim)
+            emit_space(m.group(), orig + m.start() if verbatim else orig)
+            pos = m.end()
+        if pos < len(text):
+            emit(text[pos:], orig + pos if verbatim else orig, verbatim)
+
+    text = "".join(parts)
+    stripped = text.rstrip()
+    return stripped, offsets[:len(stripped)]
+
+
+def _strip_boilerplate(text: str, offsets: array) -> Tuple[str, array]:
+    kept_text: List[str] = []
+    kept_offsets = array("l")
+
+    for m in _LINE.finditer(text):
+        line = m.group()
+        if not line:
+            break
+        if kept_text and _BOILERPLATE_CUTOFF.match(line):
+            break
+        if _BOILERPLATE_LINE.search(line) and not _AMOUNT_HINT.search(line):
+            continue
+        kept_text.append(line)
+        kept_offsets.extend(offsets[m.start():m.end()])
+
+    if not kept_text:
+        # Everything looked like boilerplate; better to keep the input
+        return text, offsets
+
+    result = "".join(kept_text).rstrip()
+    return result, kept_offsets[:len(result)]
+
+
+def normalize_email(raw: str, max_chars: int = ML_MAX_INPUT_CHARS) -> NormalizedText:
+    """Normalize an email body, keeping a char-offset map into `raw`."""
+    if _HTML_HINT.search(raw):
+        segments = _html_segments(raw)
+    else:
+        segments = [(0, raw, True)]
+
+    text, offsets = _collapse_whitespace(segments)
+    text, offsets = _strip_boilerplate(text, offsets)
+
+    if len(text) > max_chars:
+        text, offsets = text[:max_chars], offsets[:max_chars]
+
+    return NormalizedText(text, offsets)
+
+
+def prepare_input(raw: str) -> NormalizedText:
+    """Normalized text + offset map, or an identity map when disabled."""
+    if not ML_NORMALIZE_INPUT:
+        return NormalizedText(raw, array("l", range(len(raw))))
+    return normalize_email(raw)
+
+
+def normalize_text(raw: str) -> str:
+    """Normalized text only, for the classifiers (train and serve)."""
+    if not ML_NORMALIZE_INPUT:
+        return raw
+    return normalize_email(raw).text
+
+
+def sender_domain(from_email: Optional[str]) -> Optional[str]:
+    """
+    Sender key used to group emails: the lower-cased domain of a sender
+    address ("HDFC Bank <alerts@hdfcbank.net>" → "hdfcbank.net"). Values
+    that already are a bare domain are returned as-is.
+    """
+    if not from_email:
+        return None
+    value = from_email.strip().lower()
+    match = _EMAIL_ADDRESS.search(value)
+    if match:
+        return match.group(1)
+    if "." in value and " " not in value and value != "unknown":
+        return value
+    return None
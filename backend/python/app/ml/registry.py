@@ -0,0 +1,513 @@
+"""
+Versioned model registry with atomic hot-swap.
+
+Tracks every version of the NER model and both joblib classifiers in a
+manifest (`app/ml/models/manifest.json`). A version only becomes active once
+its artifacts are completely written and the new model has been loaded in
+memory; the swap itself is a single reference assignment, so in-flight
+requests keep using the model they started with. Request handlers call
+`get_model()` which never touches the filesystem after the initial load.
+
+Layout:
+    models/ner_vN/model-best/              (written by `spacy train`)
+    models/classifier_vN/email_classifier.joblib
+    models/type_classifier_vN/type_classifier.joblib
+    models/joint_classifier_vN/joint_classifier.joblib   (optional)
+    models/manifest.json
+
+Classifier versions may carry a compact NumPy export next to the joblib
+(`email_classifier.npz`, see `app/ml/compact.py`); it is preferred when
+present because it loads in milliseconds and does not import sklearn.
+Numeric arrays are memory-mapped from the artifacts, so worker processes
+started by `app/serve.py` share them through the page cache. Promotions made
+by one worker are picked up by the others through `sync()`.
+Allocating, registering and promoting versions take a file lock
+(`models/.registry.lock`), so workers can do it concurrently.
+
+Environment:
+    ML_MODEL_RETENTION     Number of versions kept per model (default: 3)
+    ML_CLASSIFIER_BACKEND  "compact" (default) or "sklearn" for the classifiers
+    ML_MMAP_MODELS         Set to 0 to read classifier arrays into private memory (default: 1)
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import fcntl
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = Path(__file__).parent / "models"
+MANIFEST_PATH = MODELS_DIR / "manifest.json"
+ML_MODEL_RETENTION = max(1, int(os.getenv("ML_MODEL_RETENTION", "3")))
+ML_CLASSIFIER_BACKEND = os.getenv("ML_CLASSIFIER_BACKEND", "compact")
+ML_MMAP_MODELS = os.getenv("ML_MMAP_MODELS", "1") == "1"
+
+# A registered version not promoted within this long is garbage to gc()
+_PENDING_GRACE_SECONDS = 600
+
+
+class LoadedModel(NamedTuple):
+    version: str
+    model: Any
+    load_ms: float = 0.0
+
+
+def _load_spacy(path: Path) -> Any:
+    import spacy
+    return spacy.load(path)
+
+
+def _load_joblib(path: Path) -> Any:
+    import joblib
+    # Arrays of uncompressed dumps are mapped instead of copied
+    return joblib.load(path, mmap_mode="r" if ML_MMAP_MODELS else None)
+
+
+def _load_classifier(path: Path) -> Any:
+    """Compact scorer from the sibling `.npz` if there is one, else the joblib pipeline."""
+    compact_path = path.with_suffix(".npz")
+    if ML_CLASSIFIER_BACKEND == "compact" and compact_path.exists():
+        from app.ml.compact import CompactScorer
+        try:
+            return CompactScorer.load(compact_path, mmap=ML_MMAP_MODELS)
+        except Exception as e:
+            logger.warning(f"Compact model {compact_path} unusable, loading joblib: {e}")
+    return _load_joblib(path)
+
+
+# Written last by `app/ml/ner_training.py`; a ner_vN directory without it is
+# still training or was left behind by a crashed run
+NER_COMPLETE_MARKER = "training_state.json"
+
+
+class ModelSpec(NamedTuple):
+    prefix: str  # version directory prefix, e.g. "ner_v"
+    artifact: str  # file/dir inside the version directory that gets loaded
+    loader: Callable[[Path], Any]
+    required: List[str]  # paths that must exist before a version is complete
+
+
+MODEL_SPECS: Dict[str, ModelSpec] = {
+    "ner": ModelSpec(
+        prefix="ner_v",
+        artifact="model-best",
+        loader=_load_spacy,
+        # spaCy rewrites model-best and model-last at every evaluation, so
+        # neither shows that training finished; `ner_training` writes the
+        # state file as its very last step.
+        required=["model-best/meta.json", "model-best/config.cfg", NER_COMPLETE_MARKER],
+    ),
+    "classifier": ModelSpec(
+        prefix="classifier_v",
+        artifact="email_classifier.joblib",
+        loader=_load_classifier,
+        required=["email_classifier.joblib"],
+    ),
+    "type_classifier": ModelSpec(
+        prefix="type_classifier_v",
+        artifact="type_classifier.joblib",
+        loader=_load_classifier,
+        required=["type_classifier.joblib"],
+    ),
+    # Optional single-pass replacement for the two classifiers above
+    "joint_classifier": ModelSpec(
+        prefix="joint_classifier_v",
+        artifact="joint_classifier.joblib",
+        loader=_load_classifier,
+        required=["joint_classifier.joblib"],
+    ),
+}
+
+# Sidecar files copied alongside a classifier artifact when it is registered
+_METADATA_FILES = {
+    "classifier": ["classifier_metadata.json", "email_classifier.npz", "classifier_search_report.json"],
+    "type_classifier": ["type_classifier_metadata.json", "type_classifier.npz", "type_classifier_search_report.json"],
+    "joint_classifier": ["joint_classifier_metadata.json", "joint_classifier.npz"],
+}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _version_number(name: str, version: str) -> int:
+    return int(version[len(MODEL_SPECS[name].prefix):])
+
+
+class ModelRegistry:
+    def __init__(self, models_dir: Path = MODELS_DIR, manifest_path: Path = MANIFEST_PATH):
+        self.models_dir = models_dir
+        self.manifest_path = manifest_path
+        self._lock = threading.RLock()
+        self._load_locks = {name: threading.Lock() for name in MODEL_SPECS}
+        self._lock_depth = 0
+        self._active: Dict[str, Optional[LoadedModel]] = {}
+        self._manifest: Optional[dict] = None
+        self._manifest_mtime: Optional[int] = None
+        # No manifest yet: models on disk predate the registry
+        self._pre_registry = not manifest_path.exists()
+
+    # ==========================================================
+    # MANIFEST
+    # ==========================================================
+
+    def _manifest_stat(self) -> Optional[int]:
+        try:
+            return self.manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_manifest(self) -> dict:
+        # Re-read when another worker process rewrote the manifest
+        mtime = self._manifest_stat()
+        if self._manifest is None or mtime != self._manifest_mtime:
+            if mtime is not None:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            else:
+                self._manifest = {}
+            self._manifest_mtime = mtime
+            for name in MODEL_SPECS:
+                self._manifest.setdefault(name, {"active": None, "history": [], "versions": {}})
+        return self._manifest
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """
+        Thread lock plus an flock on `models/.registry.lock`, held while
+        allocating a version, renaming it into place or updating the
+        manifest, so worker processes cannot pick the same vN or overwrite
+        each other's manifest changes. Reentrant within a thread; the
+        manifest is re-read once the flock is taken.
+        """
+        with self._lock:
+            if self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+
+            self.models_dir.mkdir(parents=True, exist_ok=True)
+            with open(self.models_dir / ".registry.lock", "w") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                self._lock_depth = 1
+                self._manifest = None
+                try:
+                    yield
+                finally:
+                    self._lock_depth = 0
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_manifest(self) -> None:
+        """Atomic write: temp file + rename."""
+        self.models_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = self._manifest_stat()
+
+    # ==========================================================
+    # VERSION DISCOVERY
+    # ==========================================================
+
+    def is_complete(self, name: str, version: str) -> bool:
+        version_dir = self.models_dir / version
+        return all((version_dir / p).exists() for p in MODEL_SPECS[name].required)
+
+    def _version_dirs(self, name: str) -> List[str]:
+        prefix = MODEL_SPECS[name].prefix
+        versions = []
+        for p in self.models_dir.glob(f"{prefix}*"):
+            try:
+                _version_number(name, p.name)
+            except ValueError:
+                continue
+            versions.append(p.name)
+        return sorted(versions, key=lambda v: _version_number(name, v))
+
+    def next_version_dir(self, name: str) -> Path:
+        """
+        Reserve the next version directory by creating it (empty), so two
+        trainers, in this process or another, never get the same one.
+        """
+        self.models_dir.mkdir(parents=True, exist_ok=True)
+        with self._exclusive():
+            existing = [_version_number(name, v) for v in self._version_dirs(name)]
+            number = max(existing, default=0) + 1
+            while True:
+                version_dir = self.models_dir / f"{MODEL_SPECS[name].prefix}{number}"
+                try:
+                    version_dir.mkdir(exist_ok=False)
+                    return version_dir
+                except FileExistsError:
+                    number += 1
+
+    # ==========================================================
+    # REGISTRATION / PROMOTION
+    # ==========================================================
+
+    def register_version(self, name: str, version: str) -> str:
+        """
+        Record an already-written version directory in the manifest.
+        Refuses versions whose artifacts are not completely written.
+        """
+        if not self.is_complete(name, version):
+            raise RuntimeError(f"{name} version {version} is incomplete, refusing to register")
+
+        with self._exclusive():
+            entry = self._read_manifest()[name]
+            entry["versions"].setdefault(version, {
+                "path": f"{version}/{MODEL_SPECS[name].artifact}",
+                "created_at": _now(),
+            })
+            self._write_manifest()
+        return version
+
+    def register_artifact(self, name: str, artifact_path: Path) -> str:
+        """
+        Copy a freshly trained single-file artifact into a new version
+        directory. Files are staged in a hidden directory and the directory
+        is renamed into place, so a version is either complete or absent.
+        """
+        if not artifact_path.exists():
+            raise FileNotFoundError(f"Artifact not found: {artifact_path}")
+
+        with self._exclusive():
+            version_dir = self.next_version_dir(name)
+            staging_dir = self.models_dir / f".staging-{version_dir.name}"
+            if staging_dir.exists():
+                shutil.rmtree(staging_dir)
+            staging_dir.mkdir(parents=True)
+
+            shutil.copy2(artifact_path, staging_dir / MODEL_SPECS[name].artifact)
+            for sidecar in _METADATA_FILES.get(name, []):
+                sidecar_path = artifact_path.parent / sidecar
+                if sidecar_path.exists():
+                    shutil.copy2(sidecar_path, staging_dir / sidecar)
+
+            # Replaces the empty directory reserved by next_version_dir()
+            os.rename(staging_dir, version_dir)
+            return self.register_version(name, version_dir.name)
+
+    def promote(self, name: str, version: str, _rollback: bool = False) -> LoadedModel:
+        """
+        Load `version` and make it the active model. Loading happens before
+        taking the lock, so requests keep being served by the current model
+        until the new one is ready.
+        """
+        if version not in self._read_manifest()[name]["versions"]:
+            self.register_version(name, version)
+
+        loaded = self._load_version(name, version)
+
+        with self._exclusive():
+            entry = self._read_manifest()[name]
+            self._active[name] = loaded
+            entry["active"] = version
+            entry["versions"][version]["promoted_at"] = _now()
+            if _rollback and version in entry["history"]:
+                del entry["history"][entry["history"].index(version) + 1:]
+            else:
+                if version in entry["history"]:
+                    entry["history"].remove(version)
+                entry["history"].append(version)
+            self._write_manifest()
+
+        logger.info(f"{name} model {version} is now active")
+        self.gc(name)
+        return loaded
+
+    def publish(self, name: str, version: str) -> LoadedModel:
+        """Register + promote. Used by retraining pipelines."""
+        self.register_version(name, version)
+        return self.promote(name, version)
+
+    def rollback(self, name: str) -> LoadedModel:
+        """Re-activate the version promoted before the current one."""
+        with self._exclusive():
+            history = self._read_manifest()[name]["history"]
+            if len(history) < 2:
+                raise ValueError(f"No previous {name} version to roll back to")
+            previous = history[-2]
+
+        return self.promote(name, previous, _rollback=True)
+
+    # ==========================================================
+    # RETENTION / GC
+    # ==========================================================
+
+    def gc(self, name: str) -> List[str]:
+        """
+        Delete versions beyond the retention window. The active version,
+        directories newer than it (e.g. a training run in progress) and
+        versions another worker registered but has not promoted yet are
+        never touched.
+        """
+        removed = []
+        with self._exclusive():
+            entry = self._read_manifest()[name]
+            active = entry["active"]
+            if active is None:
+                return removed
+
+            keep = set(entry["history"][-ML_MODEL_RETENTION:]) | {active}
+            active_number = _version_number(name, active)
+
+            for version in self._version_dirs(name):
+                if version in keep or _version_number(name, version) > active_number:
+                    continue
+                if self._pending(entry["versions"].get(version)):
+                    continue
+                shutil.rmtree(self.models_dir / version, ignore_errors=True)
+                entry["versions"].pop(version, None)
+                if version in entry["history"]:
+                    entry["history"].remove(version)
+                removed.append(version)
+
+            if removed:
+                self._write_manifest()
+                logger.info(f"Removed old {name} versions: {', '.join(removed)}")
+
+        return removed
+
+    @staticmethod
+    def _pending(info: Optional[dict]) -> bool:
+        """Registered, never promoted, and recent enough to still be loading."""
+        if not info or "promoted_at" in info:
+            return False
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(info["created_at"])
+        return age.total_seconds() < _PENDING_GRACE_SECONDS
+
+    # ==========================================================
+    # LOADING
+    # ==========================================================
+
+    def _load_version(self, name: str, version: str) -> LoadedModel:
+        model_path = self.models_dir / self._read_manifest()[name]["versions"][version]["path"]
+        logger.info(f"Loading {name} model → {version}")
+        start = time.perf_counter()
+        model = MODEL_SPECS[name].loader(model_path)
+        return LoadedModel(version, model, round((time.perf_counter() - start) * 1000, 1))
+
+    def _bootstrap(self, name: str) -> Optional[str]:
+        """
+        Pick up models trained before the registry existed: the newest
+        complete ner_vN directory, or a classifier artifact at the root of
+        the models directory.
+        """
+        if name == "ner":
+            complete = [v for v in self._version_dirs(name) if self.is_complete(name, v)]
+            if not complete and self._pre_registry:
+                complete = self._adopt_legacy_ner()
+            return self.register_version(name, complete[-1]) if complete else None
+
+        legacy_artifact = self.models_dir / MODEL_SPECS[name].artifact
+        if legacy_artifact.exists():
+            return self.register_artifact(name, legacy_artifact)
+        return None
+
+    def _adopt_legacy_ner(self) -> List[str]:
+        """
+        ner_vN directories written by `spacy train` before there was a
+        registry (or a completion marker): on the first start only, the
+        ones with a finished model-last get the marker.
+        """
+        adopted = []
+        for version in self._version_dirs("ner"):
+            version_dir = self.models_dir / version
+            if (version_dir / "model-last" / "meta.json").exists() and (version_dir / "model-best" / "meta.json").exists():
+                (version_dir / NER_COMPLETE_MARKER).write_text(json.dumps({"mode": "legacy"}), encoding="utf-8")
+                adopted.append(version)
+        if adopted:
+            logger.info(f"Adopted NER versions trained before the registry: {', '.join(adopted)}")
+        return adopted
+
+    def load_active(self, name: str) -> Optional[LoadedModel]:
+        """
+        Load the manifest's active version (startup path). The version is
+        resolved under the registry lock, but loaded outside it, so other
+        models keep being served and synced meanwhile. Threads asking for
+        the same model wait for the one loading it.
+        """
+        with self._load_locks[name]:
+            with self._lock:
+                if name in self._active:
+                    return self._active[name]
+
+                entry = self._read_manifest()[name]
+                version = entry["active"] or self._bootstrap(name)
+                if version is None:
+                    logger.warning(f"No trained {name} model found")
+                    self._active[name] = None
+                    return None
+                rollback = version in entry["history"]
+
+            try:
+                return self.promote(name, version, _rollback=rollback)
+            except Exception as e:
+                logger.error(f"Failed loading {name} model {version}: {e}")
+                with self._lock:
+                    self._active[name] = None
+                return None
+
+    def get_model(self, name: str) -> Optional[LoadedModel]:
+        """Request path: in-memory lookup only after the first load."""
+        if name in self._active:
+            return self._active[name]
+        return self.load_active(name)
+
+    def sync(self) -> List[str]:
+        """
+        Load active versions promoted by another worker process. Only
+        models this process has already loaded are followed.
+        """
+        with self._lock:
+            manifest = self._read_manifest()
+            stale = [
+                (name, manifest[name]["active"])
+                for name, loaded in self._active.items()
+                if manifest[name]["active"] and (loaded is None or loaded.version != manifest[name]["active"])
+            ]
+
+        synced = []
+        for name, version in stale:
+            try:
+                loaded = self._load_version(name, version)
+            except Exception as e:
+                logger.error(f"Failed syncing {name} model {version}: {e}")
+                continue
+            with self._lock:
+                self._active[name] = loaded
+            logger.info(f"{name} model {version} picked up from manifest")
+            synced.append(name)
+        return synced
+
+    def status(self) -> Dict[str, dict]:
+        with self._lock:
+            manifest = self._read_manifest()
+            return {
+                name: {
+                    "active": manifest[name]["active"],
+                    "loaded": (self._active.get(name) or LoadedModel(None, None)).version,
+                    "history": list(manifest[name]["history"]),
+                    "versions": sorted(manifest[name]["versions"], key=lambda v: _version_number(name, v)),
+                }
+                for name in MODEL_SPECS
+            }
+
+
+# Process-wide singleton
+registry = ModelRegistry()
@@ -0,0 +1,190 @@
+"""
+CPU resource policy for training jobs and serving workers.
+
+Training (`spacy train`, the classifier trainers, DocBin conversion) runs on
+the same machine as `/ml/*` inference. Left alone, thinc/BLAS/numpy spawn a
+thread per core and inference latency collapses while a job runs. Every
+training subprocess is therefore started:
+
+- with OMP/BLAS thread caps (ML_TRAIN_THREADS)
+- pinned to a reserved core set (ML_TRAIN_CPUS), which serving then avoids
+- at a lower priority (ML_TRAIN_NICE)
+- only when one of ML_TRAIN_MAX_JOBS slots is free; slots are lock files,
+  so the limit holds across all worker processes
+
+Serving processes cap their own BLAS threads (ML_SERVE_THREADS): inference
+parallelism comes from the worker pool, not from BLAS threads fighting over
+the same cores.
+
+Environment:
+    ML_TRAIN_THREADS   Threads per training job (default: a quarter of the CPUs, at least 1)
+    ML_TRAIN_CPUS      Cores reserved for training, e.g. "6-7" or "2,3" (default: none, no pinning)
+    ML_TRAIN_NICE      Nice increment for training jobs (default: 10)
+    ML_TRAIN_MAX_JOBS  Training jobs allowed to run at once (default: 1)
+    ML_SERVE_THREADS   BLAS/OpenMP threads per serving process (default: 1)
+"""
+
+import os
+import time
+import shutil
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Set
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_cpus(value: str) -> Set[int]:
+    """"0-3,6" → {0, 1, 2, 3, 6}"""
+    cpus: Set[int] = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+ML_TRAIN_THREADS = max(1, int(os.getenv("ML_TRAIN_THREADS", str((os.cpu_count() or 1) // 4))))
+ML_TRAIN_CPUS = _parse_cpus(os.getenv("ML_TRAIN_CPUS", ""))
+ML_TRAIN_NICE = int(os.getenv("ML_TRAIN_NICE", "10"))
+ML_TRAIN_MAX_JOBS = max(1, int(os.getenv("ML_TRAIN_MAX_JOBS", "1")))
+ML_SERVE_THREADS = max(1, int(os.getenv("ML_SERVE_THREADS", "1")))
+
+_missing_cpus = ML_TRAIN_CPUS - set(range(os.cpu_count() or 1))
+if _missing_cpus:
+    logger.warning(f"ML_TRAIN_CPUS lists CPUs this machine does not have: {sorted(_missing_cpus)}")
+    ML_TRAIN_CPUS -= _missing_cpus
+
+# coreutils / util-linux, used to apply the policy to training subprocesses
+_NICE = shutil.which("nice")
+_TASKSET = shutil.which("taskset")
+
+SLOTS_DIR = Path(__file__).parent / ".train_slots"
+_SLOT_POLL_SECONDS = 1.0
+
+# Read by OpenMP, OpenBLAS, MKL, BLIS (thinc), Accelerate and numexpr
+_THREAD_ENV_VARS = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+# ==========================================================
+# SERVING
+# ==========================================================
+
+def apply_serving_limits() -> None:
+    """
+    Cap BLAS/OpenMP threads and keep off the training cores. Must run
+    before numpy/spaCy are imported; explicit env settings win.
+    """
+    for name in _THREAD_ENV_VARS:
+        os.environ.setdefault(name, str(ML_SERVE_THREADS))
+
+    if ML_TRAIN_CPUS and hasattr(os, "sched_setaffinity"):
+        serving_cpus = os.sched_getaffinity(0) - ML_TRAIN_CPUS
+        if serving_cpus:
+            os.sched_setaffinity(0, serving_cpus)
+            logger.info(f"Serving pinned to CPUs {sorted(serving_cpus)}")
+        else:
+            logger.warning("ML_TRAIN_CPUS covers every CPU, serving is not pinned")
+
+
+def serving_cpu_count() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# ==========================================================
+# TRAINING
+# ==========================================================
+
+def training_env() -> Dict[str, str]:
+    """Environment for a training subprocess, with thread caps applied."""
+    env = dict(os.environ)
+    threads = str(ML_TRAIN_THREADS)
+    for name in _THREAD_ENV_VARS:
+        env[name] = threads
+    return env
+
+
+def training_command(command: List[str]) -> List[str]:
+    """
+    `command` prefixed with `nice` and `taskset`: lower priority and pinned
+    to the reserved cores, inherited by everything the job spawns (`uv run`
+    → python). Done with exec'd tools rather than a `preexec_fn`, which is
+    unsafe in a process with other threads running (the child can deadlock
+    before exec).
+    """
+    prefix: List[str] = []
+    if ML_TRAIN_NICE:
+        if _NICE:
+            prefix += [_NICE, "-n", str(ML_TRAIN_NICE)]
+        else:
+            logger.warning("nice not found, training runs at normal priority")
+    if ML_TRAIN_CPUS:
+        if _TASKSET:
+            prefix += [_TASKSET, "-c", ",".join(str(cpu) for cpu in sorted(ML_TRAIN_CPUS))]
+        else:
+            logger.warning("taskset not found, training is not pinned to ML_TRAIN_CPUS")
+    return prefix + list(command)
+
+
+def apply_thread_training_policy() -> None:
+    """
+    Same priority and pinning for training that runs on a thread of the
+    serving process; Linux applies both per thread. BLAS thread caps stay
+    at the serving setting.
+    """
+    if not hasattr(os, "sched_setaffinity"):
+        return
+    tid = threading.get_native_id()
+    if ML_TRAIN_NICE:
+        os.setpriority(os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + ML_TRAIN_NICE)
+    if ML_TRAIN_CPUS:
+        os.sched_setaffinity(tid, ML_TRAIN_CPUS)
+
+
+@contextmanager
+def training_slot() -> Iterator[int]:
+    """
+    Block until one of ML_TRAIN_MAX_JOBS slots is free. Slots are flock()ed
+    files, released automatically if the holding process dies.
+    """
+    SLOTS_DIR.mkdir(parents=True, exist_ok=True)
+    waited = False
+
+    while True:
+        for slot in range(ML_TRAIN_MAX_JOBS):
+            f = open(SLOTS_DIR / f"slot-{slot}.lock", "w")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+
+            try:
+                yield slot
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+            return
+
+        if not waited:
+            logger.info(f"⏳ Waiting for a training slot ({ML_TRAIN_MAX_JOBS} max)")
+            waited = True
+        time.sleep(_SLOT_POLL_SECONDS)
+
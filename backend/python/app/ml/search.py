@@ -0,0 +1,231 @@
+"""
+Hyperparameter search for the TF-IDF + LogisticRegression classifiers.
+
+Used by `train_classifier.py` and `train_type_classifier.py` when
+ML_CLASSIFIER_SEARCH is set: instead of the fixed settings, candidates
+over the vectorizer (n-grams, min_df, max_df, max_features) and the
+regularization strength C are scored with stratified k-fold on the
+training split, and the trainer fits the best one.
+
+Featurization is cached. Tokenizing into n-grams is the expensive part and
+is done once per n-gram range, as one count matrix over the whole training
+split. For each fold, the vocabulary limits and idf are then applied to
+that matrix using the fold's training rows only, exactly as TfidfVectorizer
+would fit them, and every C is fitted on the same fold features. Nothing
+is re-tokenized per fold or per candidate, and no statistic leaks from the
+validation rows. The (vectorizer settings, fold) tasks run in a process
+pool of ML_SEARCH_JOBS workers, which receive the cached matrices once.
+
+Environment:
+    ML_CLASSIFIER_SEARCH  "grid" or "random" to search before training (default: off)
+    ML_SEARCH_ITER        Candidates drawn by random search (default: 20)
+    ML_SEARCH_FOLDS       Stratified folds per candidate (default: 5)
+    ML_SEARCH_JOBS        Worker processes (default: ML_TRAIN_THREADS)
+"""
+
+import os
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn import metrics
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
+from sklearn.pipeline import Pipeline
+
+from app.ml.resources import ML_TRAIN_THREADS
+
+logger = logging.getLogger(__name__)
+
+ML_CLASSIFIER_SEARCH = os.getenv("ML_CLASSIFIER_SEARCH", "off").lower().replace("off", "")
+ML_SEARCH_ITER = int(os.getenv("ML_SEARCH_ITER", "20"))
+ML_SEARCH_FOLDS = int(os.getenv("ML_SEARCH_FOLDS", "5"))
+ML_SEARCH_JOBS = max(1, int(os.getenv("ML_SEARCH_JOBS", str(ML_TRAIN_THREADS))))
+
+# Search space; the trainers' fixed settings are one of the candidates
+VECTORIZER_GRID = {
+    "ngram_range": [(1, 1), (1, 2)],
+    "min_df": [1, 2],
+    "max_df": [0.8, 0.95],
+    "max_features": [2000, 5000, 20000],
+}
+C_GRID = [0.1, 0.3, 1.0, 3.0, 10.0]
+
+RANDOM_STATE = 42
+
+# Per-worker state: n-gram range → count matrix; labels; fold indices
+_counts: Dict[Tuple[int, int], sparse.csr_matrix] = {}
+_labels: Optional[np.ndarray] = None
+_folds: List[Tuple[np.ndarray, np.ndarray]] = []
+
+
+def build_pipeline(params: Dict[str, Any]) -> Pipeline:
+    """The trainers' pipeline with the given vectorizer settings and C."""
+    return Pipeline([
+        ('tfidf', TfidfVectorizer(
+            max_features=params["max_features"],
+            min_df=params["min_df"],
+            max_df=params["max_df"],
+            ngram_range=tuple(params["ngram_range"]),
+            stop_words='english'
+        )),
+        ('classifier', LogisticRegression(
+            C=params["C"],
+            max_iter=1000,
+            random_state=RANDOM_STATE,
+            class_weight='balanced'  # Handle imbalance
+        ))
+    ])
+
+
+# ==========================================================
+# CACHED FEATURIZATION
+# ==========================================================
+
+def _select_columns(counts: sparse.csr_matrix, settings: Dict[str, Any]) -> np.ndarray:
+    """
+    Columns TfidfVectorizer would keep if fitted on these rows: document
+    frequency within [min_df, max_df], then the max_features most frequent.
+    """
+    n_docs = counts.shape[0]
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    min_df = settings["min_df"] if isinstance(settings["min_df"], int) else settings["min_df"] * n_docs
+    max_df = settings["max_df"] if isinstance(settings["max_df"], int) else settings["max_df"] * n_docs
+    columns = np.flatnonzero((df >= max(min_df, 1)) & (df <= max_df))
+
+    if settings["max_features"] is not None and len(columns) > settings["max_features"]:
+        term_counts = np.asarray(counts[:, columns].sum(axis=0)).ravel()
+        top = np.argsort(-term_counts, kind="mergesort")[:settings["max_features"]]
+        columns = np.sort(columns[top])
+    return columns
+
+
+def _init_worker(counts, labels, folds) -> None:
+    global _counts, _labels, _folds
+    _counts, _labels, _folds = counts, labels, folds
+
+
+def _score_fold(settings: Dict[str, Any], fold: int, c_values: Sequence[float]) -> List[Dict[str, float]]:
+    """Fit the fold's features once, then one LogisticRegression per C."""
+    train_idx, val_idx = _folds[fold]
+    counts = _counts[tuple(settings["ngram_range"])]
+    train_counts = counts[train_idx]
+
+    columns = _select_columns(train_counts, settings)
+    tfidf = TfidfTransformer().fit(train_counts[:, columns])
+    X_train = tfidf.transform(train_counts[:, columns])
+    X_val = tfidf.transform(counts[val_idx][:, columns])
+    y_train, y_val = _labels[train_idx], _labels[val_idx]
+
+    scores = []
+    for c in c_values:
+        model = LogisticRegression(C=c, max_iter=1000, random_state=RANDOM_STATE, class_weight='balanced')
+        model.fit(X_train, y_train)
+        proba = model.predict_proba(X_val)[:, 1]
+        scores.append({
+            "f1": metrics.f1_score(y_val, (proba >= 0.5).astype(int), zero_division=0),
+            "roc_auc": metrics.roc_auc_score(y_val, proba) if len(np.unique(y_val)) > 1 else float("nan"),
+        })
+    return scores
+
+
+# ==========================================================
+# SEARCH
+# ==========================================================
+
+def _candidates(mode: str, n_iter: int) -> List[Dict[str, Any]]:
+    space = {**VECTORIZER_GRID, "C": C_GRID}
+    if mode == "grid":
+        return list(ParameterGrid(space))
+    if mode == "random":
+        return list(ParameterSampler(space, n_iter=n_iter, random_state=RANDOM_STATE))
+    raise ValueError(f"Unknown search mode: {mode} (expected grid or random)")
+
+
+def search(
+    texts: Sequence[str],
+    labels: Sequence[int],
+    mode: str = ML_CLASSIFIER_SEARCH or "grid",
+    n_iter: int = ML_SEARCH_ITER,
+    folds: int = ML_SEARCH_FOLDS,
+    jobs: int = ML_SEARCH_JOBS,
+) -> Optional[Dict[str, Any]]:
+    """
+    Score candidates with stratified k-fold on (already normalized) texts.
+    Returns the report: best params, and mean/std F1 and ROC-AUC of every
+    candidate, best first. Returns None when a class has fewer than two
+    samples, too few for even two stratified folds.
+    """
+    start = time.perf_counter()
+    y = np.asarray(labels, dtype=int)
+    smallest = int(np.bincount(y, minlength=2).min())
+    if smallest < 2:
+        logger.warning(f"Skipping the search: the smallest class has {smallest} sample(s), stratified k-fold needs at least 2")
+        return None
+    folds = min(folds, smallest)
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=RANDOM_STATE).split(np.zeros(len(y)), y))
+
+    candidates = _candidates(mode, n_iter)
+
+    # Tokenize once per n-gram range
+    counts = {}
+    for ngram_range in {tuple(c["ngram_range"]) for c in candidates}:
+        counts[ngram_range] = CountVectorizer(ngram_range=ngram_range, stop_words='english').fit_transform(texts).tocsr()
+    featurize_seconds = time.perf_counter() - start
+
+    # One task per (vectorizer settings, fold), covering every C of those settings
+    groups: Dict[str, Tuple[Dict[str, Any], List[float]]] = {}
+    for candidate in candidates:
+        settings = {k: v for k, v in candidate.items() if k != "C"}
+        key = json.dumps(settings, sort_keys=True)
+        groups.setdefault(key, (settings, []))[1].append(candidate["C"])
+
+    results: Dict[Tuple[str, float], List[Dict[str, float]]] = {}
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(counts, y, splits)) as pool:
+        futures = {
+            (key, fold): pool.submit(_score_fold, settings, fold, c_values)
+            for key, (settings, c_values) in groups.items()
+            for fold in range(folds)
+        }
+        for (key, fold), future in futures.items():
+            for c, score in zip(groups[key][1], future.result()):
+                results.setdefault((key, c), []).append(score)
+
+    ranking = []
+    for (key, c), scores in results.items():
+        f1 = [s["f1"] for s in scores]
+        auc = [s["roc_auc"] for s in scores]
+        ranking.append({
+            "params": {**groups[key][0], "ngram_range": list(groups[key][0]["ngram_range"]), "C": c},
+            "f1_mean": float(np.mean(f1)),
+            "f1_std": float(np.std(f1)),
+            "roc_auc_mean": float(np.nanmean(auc)) if not np.all(np.isnan(auc)) else None,
+        })
+    # Best mean F1, then the steadier one, then ROC-AUC
+    ranking.sort(key=lambda r: (-r["f1_mean"], r["f1_std"], -(r["roc_auc_mean"] or 0)))
+
+    return {
+        "mode": mode,
+        "folds": folds,
+        "candidates": len(candidates),
+        "vectorizer_settings": len(groups),
+        "tokenizations": len(counts),
+        "workers": jobs,
+        "samples": len(y),
+        "featurize_seconds": round(featurize_seconds, 2),
+        "seconds": round(time.perf_counter() - start, 2),
+        "best": ranking[0],
+        "ranking": ranking,
+    }
+
+
+def write_report(report: Dict[str, Any], path: Path) -> None:
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
@@ -1,21 +1,89 @@
 #!/usr/bin/env python3
-import random
-from spacy.tokens import DocBin
-import spacy
+"""
+Deterministic train/dev split by a stable hash of each sample's text.
 
-nlp = spacy.blank("en")
+A sample is in dev when blake2b(text) falls in the lowest ML_DEV_FRACTION
+of the hash space. The assignment depends on nothing but the text, so it
+is the same on every run and every machine, samples appended later never
+move existing ones, and duplicate texts always land on the same side.
+Scores of different `ner_vN` versions are therefore measured on the same
+dev samples (plus whatever new samples hashed into dev).
 
-doc_bin = DocBin().from_disk("app/ml/data/ner.spacy")
-docs = list(doc_bin.get_docs(nlp.vocab))
+JSONL is split line by line in constant memory. A DocBin is loaded whole
+and both output DocBins are built in memory, so large datasets should be
+split as JSONL.
+Training uses `is_dev()` directly on the corpus shards (app/ml/corpus.py).
 
-random.shuffle(docs)
+Usage:
+    uv run app/ml/split.py                                    (data/ner.spacy → data/train.spacy, data/dev.spacy)
+    uv run app/ml/split.py <input.spacy> <train.spacy> <dev.spacy>
+    uv run app/ml/split.py <input.jsonl> <train.jsonl> <dev.jsonl>
 
-split = int(len(docs) * 0.8)
+Environment:
+    ML_DEV_FRACTION  Share of samples assigned to dev (default: 0.2)
+"""
 
-train_docs = docs[:split]
-dev_docs = docs[split:]
+import os
+import sys
+import json
+import hashlib
+from pathlib import Path
+from typing import Tuple
 
-DocBin(docs=train_docs).to_disk("app/ml/data/train.spacy")
-DocBin(docs=dev_docs).to_disk("app/ml/data/dev.spacy")
+ML_DEV_FRACTION = float(os.getenv("ML_DEV_FRACTION", "0.2"))
 
-print("Split complete")
+DATA_DIR = Path("app/ml/data")
+
+_HASH_SPACE = 2 ** 64
+
+
+def is_dev(text: str, dev_fraction: float = ML_DEV_FRACTION) -> bool:
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") < dev_fraction * _HASH_SPACE
+
+
+def split_jsonl(input_path: Path, train_path: Path, dev_path: Path) -> Tuple[int, int]:
+    """Split a JSONL file line by line. Returns (train, dev) counts."""
+    counts = [0, 0]
+    with open(input_path, "r", encoding="utf-8") as src, \
+            open(train_path, "w", encoding="utf-8") as train, \
+            open(dev_path, "w", encoding="utf-8") as dev:
+        for line in src:
+            if not line.strip():
+                continue
+            to_dev = is_dev(json.loads(line).get("text", ""))
+            (dev if to_dev else train).write(line if line.endswith("\n") else line + "\n")
+            counts[to_dev] += 1
+    return counts[0], counts[1]
+
+
+def split_docbin(input_path: Path, train_path: Path, dev_path: Path) -> Tuple[int, int]:
+    """Split a DocBin in memory. Returns (train, dev) counts."""
+    import spacy
+    from spacy.tokens import DocBin
+
+    vocab = spacy.blank("en").vocab
+    train, dev = DocBin(), DocBin()
+    for doc in DocBin().from_disk(input_path).get_docs(vocab):
+        (dev if is_dev(doc.text) else train).add(doc)
+    train.to_disk(train_path)
+    dev.to_disk(dev_path)
+    return len(train), len(dev)
+
+
+def main():
+    if len(sys.argv) == 1:
+        paths = [DATA_DIR / "ner.spacy", DATA_DIR / "train.spacy", DATA_DIR / "dev.spacy"]
+    elif len(sys.argv) == 4:
+        paths = [Path(arg) for arg in sys.argv[1:]]
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+    split = split_jsonl if paths[0].suffix == ".jsonl" else split_docbin
+    n_train, n_dev = split(*paths)
+    print(f"Split complete: {n_train} train, {n_dev} dev")
+
+
+if __name__ == "__main__":
+    main()
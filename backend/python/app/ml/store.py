@@ -0,0 +1,483 @@
+"""
+Training data: append-only files, or a SQLite store.
+
+By default samples live in `ner_spacy.jsonl`, `classifier_data.csv` and
+`type_classifier_data.csv` (deduplicated on append, see `app/ml/dedup.py`).
+With ML_TRAINING_STORE=sqlite they live in one SQLite database in WAL mode
+instead:
+
+- a retrain request is one transaction with one batched insert, instead
+  of a flushed write per row
+- rows are indexed on label, source domain and insertion time, and the
+  text hash used for dedup
+- trainers read rows in chunks of ML_STORE_CHUNK_ROWS (`iter_chunks`), so
+  they can stream or pick a subset (`label`, `source_domain`, `since`,
+  `sample()`) without parsing everything
+
+Everything that reads training data takes a "source" path: a data file,
+or the store database (`.sqlite3` / `.db`). `training_source(dataset)` is
+the configured one. The NER corpus converts rows by id instead of by byte
+offset; the store's generation changes whenever rows are deleted, which
+makes the corpus rebuild.
+
+Usage:
+    python -m app.ml.store import [<dataset> [<file>]]   (files → store, deduplicated)
+    python -m app.ml.store export <dataset> <file>       (store → file in the dataset's format)
+    python -m app.ml.store compact [<dataset> ...]       (drop rows superseded by corrections)
+    python -m app.ml.store stats
+
+Environment:
+    ML_TRAINING_STORE     "files" (default) or "sqlite"
+    ML_TRAINING_DB        Store database (default: app/ml/data/training.sqlite3)
+    ML_STORE_CHUNK_ROWS   Rows per chunk when reading or importing (default: 5000)
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import random
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from app.ml import dedup
+
+logger = logging.getLogger(__name__)
+
+ML_TRAINING_STORE = os.getenv("ML_TRAINING_STORE", "files")
+ML_TRAINING_DB = Path(os.getenv("ML_TRAINING_DB", "app/ml/data/training.sqlite3"))
+ML_STORE_CHUNK_ROWS = max(1, int(os.getenv("ML_STORE_CHUNK_ROWS", "5000")))
+
+DATASETS = tuple(dedup.DATASETS)
+
+# Fields of a record, in file column order
+COLUMNS: Dict[str, List[str]] = {
+    "ner": ["text", "entities", "source_domain"],
+    "classifier": ["text", "label", "source_domain"],
+    "type_classifier": ["text", "label", "source_domain", "type"],
+}
+
+_STORE_SUFFIXES = (".sqlite3", ".db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    dataset       TEXT    NOT NULL,
+    key           BLOB    NOT NULL,
+    content       BLOB    NOT NULL,
+    text          TEXT    NOT NULL,
+    label         INTEGER,
+    type          TEXT,
+    entities      TEXT,
+    source_domain TEXT,
+    created_at    TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS samples_key ON samples (dataset, key);
+CREATE INDEX IF NOT EXISTS samples_label ON samples (dataset, label);
+CREATE INDEX IF NOT EXISTS samples_source_domain ON samples (dataset, source_domain);
+CREATE INDEX IF NOT EXISTS samples_created_at ON samples (dataset, created_at);
+CREATE TABLE IF NOT EXISTS generations (
+    dataset    TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+"""
+
+Source = Union[str, Path]
+
+
+def is_store(source: Source) -> bool:
+    return Path(source).suffix in _STORE_SUFFIXES
+
+
+def training_source(dataset: str) -> Path:
+    """Where `dataset` is read from and appended to in this deployment."""
+    return ML_TRAINING_DB if ML_TRAINING_STORE == "sqlite" else dedup.DATASETS[dataset].path
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class TrainingStore:
+    def __init__(self, path: Source = ML_TRAINING_DB):
+        self.path = Path(path)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL: commits survive a process crash, only an OS crash can lose the last ones
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    # ==========================================================
+    # WRITES
+    # ==========================================================
+
+    def insert(self, dataset: str, records: List[Dict[str, Any]]) -> List[bool]:
+        """
+        Insert a batch in one transaction, with the same dedup rules as the
+        files (skip unchanged samples, append corrections). Returns, per
+        record, whether it was inserted.
+        """
+        now = _now()
+        keep: List[bool] = []
+        rows = []
+        batch: Dict[bytes, bytes] = {}
+
+        with self._transaction() as conn:
+            for record in records:
+                key = dedup.sample_key(record["text"])
+                content = dedup.content_hash(dataset, record)
+                if key in batch:
+                    known = batch[key]
+                else:
+                    found = conn.execute(
+                        "SELECT content FROM samples WHERE dataset = ? AND key = ? ORDER BY id DESC LIMIT 1",
+                        (dataset, key),
+                    ).fetchone()
+                    known = found[0] if found else None
+                batch[key] = content
+                keep.append(known != content)
+                if known == content:
+                    continue
+
+                entities = record.get("entities")
+                label = record.get("label")
+                rows.append((
+                    dataset, key, content, record["text"],
+                    int(label) if label not in (None, "") else None,
+                    record.get("type") or None,
+                    json.dumps([list(ent) for ent in entities]) if entities is not None else None,
+                    record.get("source_domain") or None,
+                    now,
+                ))
+
+            conn.executemany(
+                "INSERT INTO samples (dataset, key, content, text, label, type, entities, source_domain, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return keep
+
+    def compact(self, dataset: str) -> Dict[str, int]:
+        """Delete rows superseded by a later row with the same text."""
+        with self._transaction() as conn:
+            before = conn.execute("SELECT COUNT(*) FROM samples WHERE dataset = ?", (dataset,)).fetchone()[0]
+            deleted = conn.execute(
+                "DELETE FROM samples WHERE dataset = ? AND id NOT IN ("
+                "SELECT MAX(id) FROM samples WHERE dataset = ? GROUP BY key)",
+                (dataset, dataset),
+            ).rowcount
+            if deleted:
+                self._bump_generation(conn, dataset)
+        logger.info(f"Training store {dataset}: {before} → {before - deleted} rows")
+        return {"before": before, "after": before - deleted}
+
+    def _bump_generation(self, conn: sqlite3.Connection, dataset: str) -> None:
+        conn.execute(
+            "INSERT INTO generations (dataset, generation) VALUES (?, 1) "
+            "ON CONFLICT (dataset) DO UPDATE SET generation = generation + 1",
+            (dataset,),
+        )
+
+    # ==========================================================
+    # READS
+    # ==========================================================
+
+    def generation(self, dataset: str) -> int:
+        with self._connect() as conn:
+            row = conn.execute("SELECT generation FROM generations WHERE dataset = ?", (dataset,)).fetchone()
+        return row[0] if row else 0
+
+    def last_id(self, dataset: str) -> int:
+        with self._connect() as conn:
+            row = conn.execute("SELECT MAX(id) FROM samples WHERE dataset = ?", (dataset,)).fetchone()
+        return row[0] or 0
+
+    def count(self, dataset: str) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM samples WHERE dataset = ?", (dataset,)).fetchone()[0]
+
+    def iter_chunks(
+        self,
+        dataset: str,
+        chunk_rows: int = ML_STORE_CHUNK_ROWS,
+        after_id: int = 0,
+        label: Optional[int] = None,
+        source_domain: Optional[str] = None,
+        since: Optional[str] = None,
+        latest: bool = False,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Records in insertion order, `chunk_rows` at a time. Each record
+        carries its `id`; `after_id` resumes after a known row. `since` is
+        an ISO timestamp. With `latest`, rows superseded by a later row
+        with the same text (corrections) are left out.
+        """
+        where = ["dataset = ?", "id > ?"]
+        params: List[Any] = [dataset]
+        for column, value in (("label", label), ("source_domain", source_domain), ("created_at", since)):
+            if value is not None:
+                where.append(f"{column} {'>=' if column == 'created_at' else '='} ?")
+                params.append(value)
+        if latest:
+            # One lookup per row on the (dataset, key) index
+            where.append(
+                "NOT EXISTS (SELECT 1 FROM samples AS later WHERE later.dataset = samples.dataset "
+                "AND later.key = samples.key AND later.id > samples.id)"
+            )
+        columns = ", ".join(["id", *COLUMNS[dataset]])
+        query = f"SELECT {columns} FROM samples WHERE {' AND '.join(where)} ORDER BY id LIMIT ?"
+
+        last = after_id
+        while True:
+            # Short reads: no transaction is held between chunks
+            with self._connect() as conn:
+                rows = conn.execute(query, (params[0], last, *params[1:], chunk_rows)).fetchall()
+            if not rows:
+                return
+            last = rows[-1]["id"]
+            yield [_row_to_record(row) for row in rows]
+
+    def iter_records(self, dataset: str, **filters) -> Iterator[Dict[str, Any]]:
+        for chunk in self.iter_chunks(dataset, **filters):
+            yield from chunk
+
+    def sample(self, dataset: str, n: int, seed: int = 0, **filters) -> List[Dict[str, Any]]:
+        """Uniform sample of `n` records (reservoir, one chunk in memory)."""
+        rng = random.Random(seed)
+        picked: List[Dict[str, Any]] = []
+        for seen, record in enumerate(self.iter_records(dataset, **filters)):
+            if len(picked) < n:
+                picked.append(record)
+            else:
+                slot = rng.randrange(seen + 1)
+                if slot < n:
+                    picked[slot] = record
+        return picked
+
+    # ==========================================================
+    # IMPORT / EXPORT
+    # ==========================================================
+
+    def import_file(self, dataset: str, path: Optional[Source] = None) -> Dict[str, int]:
+        """Insert every record of a data file, in chunks. Duplicates are skipped."""
+        read = inserted = 0
+        chunk: List[Dict[str, Any]] = []
+        for record in dedup.read_records(dataset, path):
+            chunk.append(record)
+            if len(chunk) >= ML_STORE_CHUNK_ROWS:
+                inserted += sum(self.insert(dataset, chunk))
+                read += len(chunk)
+                chunk = []
+        if chunk:
+            inserted += sum(self.insert(dataset, chunk))
+            read += len(chunk)
+        logger.info(f"Imported {dataset}: {inserted} of {read} records")
+        return {"read": read, "inserted": inserted}
+
+    def export_file(self, dataset: str, path: Source) -> int:
+        """Write all records to `path` in the dataset's file format."""
+        path = Path(path)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        count = 0
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if dedup.DATASETS[dataset].format == "csv":
+                writer.writerow(COLUMNS[dataset])
+            for chunk in self.iter_chunks(dataset):
+                _write_records(f, writer, dataset, chunk)
+                count += len(chunk)
+        tmp.replace(path)
+        return count
+
+
+def _row_to_record(row: sqlite3.Row) -> Dict[str, Any]:
+    record = dict(row)
+    if "entities" in record:
+        record["entities"] = json.loads(record["entities"] or "[]")
+    return record
+
+
+def _write_records(f, writer, dataset: str, records: List[Dict[str, Any]]) -> None:
+    if dedup.DATASETS[dataset].format == "jsonl":
+        for record in records:
+            line = {"text": record["text"], "entities": record["entities"]}
+            if record.get("source_domain"):
+                line["source_domain"] = record["source_domain"]
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    else:
+        writer.writerows([record.get(column) for column in COLUMNS[dataset]] for record in records)
+
+
+# ==========================================================
+# SOURCE-AGNOSTIC ACCESS
+# ==========================================================
+
+_stores: Dict[Path, TrainingStore] = {}
+
+
+def get_store(path: Source = ML_TRAINING_DB) -> TrainingStore:
+    path = Path(path)
+    if path not in _stores:
+        _stores[path] = TrainingStore(path)
+    return _stores[path]
+
+
+def append(dataset: str, records: List[Dict[str, Any]]) -> List[bool]:
+    """
+    Append a batch to the configured training data, skipping duplicates.
+    Returns, per record, whether it was written.
+    """
+    if ML_TRAINING_STORE == "sqlite":
+        return get_store().insert(dataset, records)
+
+    path = dedup.DATASETS[dataset].path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with dedup.admit(dataset, records) as keep:
+        new = [record for record, ok in zip(records, keep) if ok]
+        file_has_header = path.exists() and path.stat().st_size > 0
+        with open(path, "a", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            if dedup.DATASETS[dataset].format == "csv" and not file_has_header:
+                writer.writerow(COLUMNS[dataset])
+            _write_records(f, writer, dataset, new)
+    return keep
+
+
+def iter_records(source: Source, dataset: str) -> Iterator[Dict[str, Any]]:
+    """Records of a data file or of the store, streamed; the last row per text only."""
+    if is_store(source):
+        yield from get_store(source).iter_records(dataset, latest=True)
+    else:
+        yield from dedup.read_records(dataset, source)
+
+
+def read_frame(source: Source, dataset: str):
+    """
+    pandas DataFrame of a data file or of the store (built chunk by chunk),
+    with the last row per text only, so corrections replace what they
+    correct.
+    """
+    import pandas as pd
+
+    if not is_store(source):
+        df = pd.read_csv(source)
+        superseded = df['text'].astype(str).map(dedup.sample_key).duplicated(keep="last")
+        return df[~superseded].reset_index(drop=True)
+    frames = [
+        pd.DataFrame.from_records(chunk, columns=["id", *COLUMNS[dataset]])
+        for chunk in get_store(source).iter_chunks(dataset, latest=True)
+    ]
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS[dataset])
+    return pd.concat(frames, ignore_index=True).drop(columns="id")
+
+
+def position(source: Source, dataset: str) -> int:
+    """End of the data written so far: the last row id of the store, or the file size."""
+    if is_store(source):
+        return get_store(source).last_id(dataset)
+    try:
+        return Path(source).stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def records_after(source: Source, dataset: str, after: int) -> List[Dict[str, Any]]:
+    """
+    Records written after a `position()`. A file that is now shorter was
+    rewritten (compaction) and yields nothing; a row still being written
+    at the end is left out.
+    """
+    if is_store(source):
+        return list(get_store(source).iter_records(dataset, after_id=after))
+
+    path = Path(source)
+    if not path.exists() or path.stat().st_size < after:
+        return []
+    is_csv = dedup.DATASETS[dataset].format == "csv"
+    with open(path, "rb") as f:
+        header = f.readline() if is_csv else b""
+        f.seek(max(after, len(header)))
+        chunk = f.read()
+    chunk = chunk[:chunk.rfind(b"\n") + 1].decode("utf-8")
+    if not is_csv:
+        return [json.loads(line) for line in chunk.splitlines() if line.strip()]
+    fieldnames = next(csv.reader([header.decode("utf-8")]))
+    return list(csv.DictReader(io.StringIO(chunk, newline=""), fieldnames=fieldnames))
+
+
+def change_token(dataset: str) -> Any:
+    """Changes whenever the configured training data of `dataset` changes."""
+    source = training_source(dataset)
+    if is_store(source):
+        if not source.exists():
+            return None
+        store = get_store(source)
+        return store.generation(dataset), store.last_id(dataset)
+    try:
+        return source.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    args = sys.argv[2:]
+    valid = {
+        "import": len(args) <= 2 and all(name in DATASETS for name in args[:1]),
+        "export": len(args) == 2 and args[0] in DATASETS,
+        "compact": all(name in DATASETS for name in args),
+        "stats": not args,
+    }
+    if not valid.get(command):
+        print(__doc__)
+        sys.exit(1)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    store = get_store()
+
+    if command == "import":
+        path = args[1] if len(args) > 1 else None
+        for dataset in args[:1] or DATASETS:
+            print(json.dumps({"dataset": dataset, **store.import_file(dataset, path)}))
+    elif command == "export":
+        print(json.dumps({"dataset": args[0], "records": store.export_file(args[0], args[1])}))
+    elif command == "compact":
+        for dataset in args or DATASETS:
+            print(json.dumps({"dataset": dataset, **store.compact(dataset)}))
+    else:
+        for dataset in DATASETS:
+            print(json.dumps({
+                "dataset": dataset,
+                "records": store.count(dataset),
+                "generation": store.generation(dataset),
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+Per-sender template learning and template-matched extraction.
+
+Each bank sender sends a handful of fixed templates with the amount and
+merchant in the same slots. Templates are learned from the NER training
+data (records carrying a `source_domain`):
+
+1. every record is normalized and split into literal text and entity slots
+2. digit runs in literals are masked, so reference numbers/dates/account
+   numbers do not create new templates
+3. records of the same sender whose skeletons line up token by token are
+   merged; tokens that differ become wildcards
+4. templates seen at least ML_TEMPLATE_MIN_SUPPORT times are compiled into
+   a single anchored regex with one group per slot
+
+At inference an email is matched against its sender's templates and the
+entities are read straight out of the regex groups. Unmatched emails fall
+back to spaCy.
+
+Environment:
+    ML_NER_TEMPLATES          Set to 0 to disable template matching (default: 1)
+    ML_TEMPLATE_MIN_SUPPORT   Samples needed before a template is used (default: 2)
+    ML_TEMPLATE_MAX_WILDCARD  Max fraction of differing tokens when merging (default: 0.2)
+"""
+
+import os
+import re
+import logging
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.ml import metrics, store
+from app.ml.preprocess import prepare_input, sender_domain
+
+logger = logging.getLogger(__name__)
+
+ML_NER_TEMPLATES = os.getenv("ML_NER_TEMPLATES", "1") == "1"
+ML_TEMPLATE_MIN_SUPPORT = int(os.getenv("ML_TEMPLATE_MIN_SUPPORT", "2"))
+ML_TEMPLATE_MAX_WILDCARD = float(os.getenv("ML_TEMPLATE_MAX_WILDCARD", "0.2"))
+
+_TOKEN = re.compile(r"\s+|[^\s]+")
+_DIGITS = re.compile(r"\d+")
+_WILDCARD = r"\S+?"
+_WHITESPACE = r"\s+"
+
+# (start_char, end_char, label)
+Span = Tuple[int, int, str]
+
+
+class Template(NamedTuple):
+    labels: Tuple[str, ...]
+    # One token-pattern list per literal; len(literals) == len(labels) + 1
+    literals: List[List[str]]
+    support: int
+
+
+class CompiledTemplate(NamedTuple):
+    labels: Tuple[str, ...]
+    pattern: re.Pattern
+    support: int
+
+
+# ==========================================================
+# LEARNING
+# ==========================================================
+
+def _token_pattern(token: str) -> str:
+    if token.isspace():
+        return _WHITESPACE
+    parts = []
+    pos = 0
+    for m in _DIGITS.finditer(token):
+        parts.append(re.escape(token[pos:m.start()]))
+        parts.append(r"\d+")
+        pos = m.end()
+    parts.append(re.escape(token[pos:]))
+    return "".join(parts)
+
+
+def _literal_tokens(text: str) -> List[str]:
+    return [_token_pattern(t) for t in _TOKEN.findall(text)]
+
+
+def _to_normalized_spans(normalized, entities: List[Span]) -> Optional[List[Span]]:
+    """Map training spans (original offsets) into normalized text offsets."""
+    index = {orig: i for i, orig in enumerate(normalized.offsets)}
+    spans = []
+    for start, end, label in entities:
+        if start not in index or (end - 1) not in index:
+            return None  # entity was stripped as boilerplate / truncated
+        spans.append((index[start], index[end - 1] + 1, label))
+    return spans
+
+
+def _skeleton(text: str, spans: List[Span]) -> Optional[Template]:
+    spans = sorted(spans)
+    literals = []
+    pos = 0
+    for start, end, _ in spans:
+        if start < pos:
+            return None  # overlapping entities
+        literals.append(_literal_tokens(text[pos:start]))
+        pos = end
+    literals.append(_literal_tokens(text[pos:]))
+    return Template(tuple(label for _, _, label in spans), literals, 1)
+
+
+def _merge(template: Template, other: Template) -> Optional[Template]:
+    """Align two skeletons token by token; differing tokens become wildcards."""
+    if template.labels != other.labels:
+        return None
+    if [len(lit) for lit in template.literals] != [len(lit) for lit in other.literals]:
+        return None
+
+    total = sum(len(lit) for lit in template.literals)
+    merged = []
+    differing = 0
+    for lit_a, lit_b in zip(template.literals, other.literals):
+        tokens = []
+        for a, b in zip(lit_a, lit_b):
+            if a == b:
+                tokens.append(a)
+            elif _WHITESPACE in (a, b):
+                return None  # token boundaries do not line up
+            else:
+                differing += 1
+                tokens.append(_WILDCARD)
+        merged.append(tokens)
+
+    if total and differing / total > ML_TEMPLATE_MAX_WILDCARD:
+        return None
+    return Template(template.labels, merged, template.support + other.support)
+
+
+def _compile(template: Template) -> CompiledTemplate:
+    parts = ["".join(template.literals[0])]
+    for i, literal in enumerate(template.literals[1:]):
+        parts.append(f"(?P<s{i}>[^\\n]+?)")
+        parts.append("".join(literal))
+    return CompiledTemplate(template.labels, re.compile("".join(parts)), template.support)
+
+
+def learn_templates(records) -> Dict[str, List[CompiledTemplate]]:
+    """
+    records: iterable of dicts with `text`, `entities` and `source_domain`.
+    Returns compiled templates per sender domain, most supported first.
+    """
+    clusters: Dict[str, List[Template]] = {}
+
+    for record in records:
+        domain = sender_domain(record.get("source_domain"))
+        if not domain or not record.get("entities"):
+            continue
+
+        normalized = prepare_input(record["text"])
+        spans = _to_normalized_spans(normalized, [tuple(e) for e in record["entities"]])
+        skeleton = _skeleton(normalized.text, spans) if spans else None
+        if skeleton is None:
+            continue
+
+        sender_templates = clusters.setdefault(domain, [])
+        for i, template in enumerate(sender_templates):
+            merged = _merge(template, skeleton)
+            if merged is not None:
+                sender_templates[i] = merged
+                break
+        else:
+            sender_templates.append(skeleton)
+
+    index = {}
+    for domain, templates in clusters.items():
+        kept = [t for t in templates if t.support >= ML_TEMPLATE_MIN_SUPPORT]
+        if kept:
+            index[domain] = [_compile(t) for t in sorted(kept, key=lambda t: -t.support)]
+    return index
+
+
+# ==========================================================
+# INDEX (PROCESS-WIDE)
+# ==========================================================
+
+_index: Dict[str, List[CompiledTemplate]] = {}
+
+
+def rebuild_index(source: Optional[Path] = None) -> int:
+    """Re-learn templates from the NER training data and swap them in."""
+    global _index
+
+    source = source or store.training_source("ner")
+    if not ML_NER_TEMPLATES or not source.exists():
+        return 0
+
+    index = learn_templates(store.iter_records(source, "ner"))
+    _index = index
+    count = sum(len(t) for t in index.values())
+    logger.info(f"Learned {count} templates for {len(index)} senders")
+    return count
+
+
+def match_template(text: str, from_email: Optional[str]) -> Optional[List[Span]]:
+    """
+    Match normalized `text` against the sender's templates. Returns the
+    slot spans, or None when no template matches (caller falls back to NER).
+    """
+    domain = sender_domain(from_email)
+    templates = _index.get(domain) if domain else None
+    if not templates:
+        return None
+
+    for template in templates:
+        m = template.pattern.fullmatch(text)
+        if m is not None:
+            metrics.increment("ner.template.hit")
+            return [
+                (m.start(f"s{i}"), m.end(f"s{i}"), label)
+                for i, label in enumerate(template.labels)
+            ]
+
+    metrics.increment("ner.template.fallback")
+    return None
+
+
+def get_stats() -> dict:
+    return {
+        "senders": len(_index),
+        "templates": sum(len(t) for t in _index.values()),
+    }
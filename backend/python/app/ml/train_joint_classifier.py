@@ -0,0 +1,204 @@
+"""
+Train a joint 3-class classifier: non-transaction / credit / debit.
+
+Replaces the two-stage email classifier → type classifier call with a single
+TF-IDF featurization and one multinomial Logistic Regression. Transaction
+and type probabilities are derived from the three class probabilities:
+    P(transaction) = P(credit) + P(debit)
+    P(debit | transaction) = P(debit) / P(transaction)
+
+This script:
+1. Loads both CSVs: non-transaction rows (label 0) of the classifier data,
+   credit/debit rows of the type classifier data
+2. Splits into train/test
+3. Trains a TF-IDF + Logistic Regression pipeline
+4. Evaluates and prints metrics
+5. Saves the model, its compact NumPy export and metadata
+
+Transaction rows of the classifier CSV carry no type and are only used
+through the type classifier CSV.
+
+Usage:
+    python train_joint_classifier.py ../data/classifier_data.csv ../data/type_classifier_data.csv
+    python train_joint_classifier.py ../data/training.sqlite3 ../data/training.sqlite3   (training store, see app/ml/store.py)
+"""
+
+import os
+import sys
+import json
+from pathlib import Path
+import pandas as pd
+import joblib
+from sklearn.model_selection import train_test_split
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn import metrics
+
+# Allow running as a script (`uv run app/ml/train_joint_classifier.py`)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.ml.preprocess import normalize_text
+from app.ml.store import read_frame
+from app.ml.compact import CompactScorer, PARITY_TOLERANCE, export_compact, verify_parity
+
+# Joint label ids; order matches the probability columns
+CLASSES = ['non_transaction', 'credit', 'debit']
+NON_TRANSACTION, CREDIT, DEBIT = range(3)
+
+
+def load_joint_data(classifier_csv: Path, type_csv: Path) -> pd.DataFrame:
+    # CSVs, or the training store (.sqlite3) for both
+    emails = read_frame(classifier_csv, 'classifier')
+    types = read_frame(type_csv, 'type_classifier')
+
+    for df, path in ((emails, classifier_csv), (types, type_csv)):
+        if 'text' not in df.columns or 'label' not in df.columns:
+            print(f"Error: {path} must have 'text' and 'label' columns")
+            sys.exit(1)
+
+    non_txn = emails[emails['label'].astype(int) == 0][['text']].assign(label=NON_TRANSACTION)
+    txn = types[['text']].assign(label=types['label'].astype(int).map({0: CREDIT, 1: DEBIT}))
+
+    df = pd.concat([non_txn, txn], ignore_index=True).dropna()
+    # The same email labelled in both files would only add duplicate rows
+    return df.drop_duplicates(subset='text', keep='last')
+
+
+def main():
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    classifier_csv, type_csv = Path(sys.argv[1]), Path(sys.argv[2])
+
+    for path in (classifier_csv, type_csv):
+        if not path.exists():
+            print(f"Error: {path} not found")
+            sys.exit(1)
+
+    # Load data
+    print(f"Loading data from {classifier_csv} and {type_csv}...")
+    df = load_joint_data(classifier_csv, type_csv)
+
+    if df.empty:
+        print("Error: no usable rows")
+        sys.exit(1)
+
+    # Print dataset info
+    print(f"\n{'='*70}")
+    print("JOINT CLASSIFIER DATASET SUMMARY")
+    print(f"{'='*70}")
+    print(f"Total records: {len(df)}")
+    print(f"Class distribution:\n{df['label'].map(dict(enumerate(CLASSES))).value_counts()}")
+
+    # Prepare data
+    X = df['text'].astype(str).map(normalize_text)  # Same normalization as serving
+    y = df['label'].astype(int)
+
+    # Train/test split (80/20)
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y,
+        test_size=0.2,
+        random_state=42,
+        stratify=y  # Keep label balance
+    )
+
+    print(f"\nTrain set: {len(X_train)} | Test set: {len(X_test)}")
+
+    # Build pipeline: one TF-IDF + multinomial Logistic Regression
+    print(f"\n{'='*70}")
+    print("TRAINING JOINT CLASSIFIER")
+    print(f"{'='*70}")
+
+    pipeline = Pipeline([
+        ('tfidf', TfidfVectorizer(
+            max_features=5000,
+            min_df=2,
+            max_df=0.8,
+            ngram_range=(1, 2),
+            stop_words='english'
+        )),
+        ('classifier', LogisticRegression(
+            max_iter=1000,
+            random_state=42,
+            class_weight='balanced'  # Handle imbalance
+        ))
+    ])
+
+    # Train
+    pipeline.fit(X_train, y_train)
+    print("✓ Model trained")
+
+    # Evaluate the joint labels and both derived tasks
+    y_pred = pipeline.predict(X_test)
+
+    print(f"\n{'='*70}")
+    print("EVALUATION METRICS")
+    print(f"{'='*70}")
+
+    accuracy = metrics.accuracy_score(y_test, y_pred)
+    macro_f1 = metrics.f1_score(y_test, y_pred, average='macro', zero_division=0)
+    txn_accuracy = metrics.accuracy_score(y_test != NON_TRANSACTION, y_pred != NON_TRANSACTION)
+    txn_mask = (y_test != NON_TRANSACTION).to_numpy() & (y_pred != NON_TRANSACTION)
+    type_accuracy = (
+        metrics.accuracy_score(y_test[txn_mask], y_pred[txn_mask]) if txn_mask.any() else 0.0
+    )
+
+    print(f"Accuracy:             {accuracy:.4f}")
+    print(f"Macro F1:             {macro_f1:.4f}")
+    print(f"Transaction accuracy: {txn_accuracy:.4f}")
+    print(f"Type accuracy:        {type_accuracy:.4f}  (on predicted transactions)")
+
+    # Confusion matrix
+    cm = metrics.confusion_matrix(y_test, y_pred, labels=list(range(len(CLASSES))))
+    print(f"\nConfusion Matrix (rows = true, cols = predicted; {', '.join(CLASSES)}):")
+    for name, row in zip(CLASSES, cm):
+        print(f"  {name:<16} {row.tolist()}")
+
+    # Classification report
+    print(f"\n{metrics.classification_report(y_test, y_pred, labels=list(range(len(CLASSES))), target_names=CLASSES, zero_division=0)}")
+
+    # Save model
+    model_dir = Path(__file__).parent / 'models'
+    model_dir.mkdir(exist_ok=True)
+
+    # Write to a temp file and rename so readers never see a partial model
+    model_path = model_dir / 'joint_classifier.joblib'
+    tmp_path = model_dir / 'joint_classifier.joblib.tmp'
+    joblib.dump(pipeline, tmp_path)
+    os.replace(tmp_path, model_path)
+    print(f"\n✓ Model saved to {model_path}")
+
+    # Compact export used for serving; drop it if it does not match the pipeline
+    compact_path = export_compact(pipeline, model_dir / 'joint_classifier.npz')
+    parity = verify_parity(pipeline, CompactScorer.load(compact_path), X_test)
+    if parity > PARITY_TOLERANCE:
+        compact_path.unlink()
+        print(f"✗ Compact export differs from pipeline (max |Δp|={parity:.2e}), not saved")
+    else:
+        print(f"✓ Compact model saved to {compact_path} (max |Δp|={parity:.2e})")
+
+    # Save metadata
+    metadata = {
+        'model_type': 'LogisticRegression + TF-IDF (Joint Classifier)',
+        'classes': CLASSES,
+        'accuracy': float(accuracy),
+        'macro_f1': float(macro_f1),
+        'transaction_accuracy': float(txn_accuracy),
+        'type_accuracy': float(type_accuracy),
+        'train_size': len(X_train),
+        'test_size': len(X_test),
+        'total_size': len(df),
+        'label_distribution': {CLASSES[k]: int(v) for k, v in df['label'].value_counts().items()},
+    }
+
+    metadata_path = model_dir / 'joint_classifier_metadata.json'
+    with open(metadata_path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"✓ Metadata saved to {metadata_path}")
+
+    print(f"\n{'='*70}\n")
+
+
+if __name__ == '__main__':
+    main()
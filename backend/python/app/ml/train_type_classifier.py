@@ -4,18 +4,22 @@ Train a binary type classifier to distinguish debit from credit transactions.
 This script:
 1. Loads the CSV data (text, label, source_domain, type)
 2. Splits into train/test
-3. Trains a TF-IDF + Logistic Regression pipeline
+3. Trains a TF-IDF + Logistic Regression pipeline (optionally with the
+   settings picked by a cross-validated search, see app/ml/search.py)
 4. Evaluates and prints metrics
 5. Saves the model and vectorizer for inference
+6. Exports the compact NumPy scorer and checks it matches the pipeline
 
 Usage:
     python train_type_classifier.py ../data/type_classifier_data.csv
+    python train_type_classifier.py ../data/training.sqlite3   (training store, see app/ml/store.py)
+    ML_CLASSIFIER_SEARCH=grid python train_type_classifier.py ../data/type_classifier_data.csv
 """
 
+import os
 import sys
 import json
 from pathlib import Path
-import pandas as pd
 import joblib
 from sklearn.model_selection import train_test_split
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -23,6 +27,13 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.pipeline import Pipeline
 from sklearn import metrics
 
+# Allow running as a script (`uv run app/ml/train_type_classifier.py`)
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from app.ml.preprocess import normalize_text
+from app.ml.store import read_frame
+from app.ml.compact import CompactScorer, PARITY_TOLERANCE, export_compact, verify_parity
+from app.ml.search import ML_CLASSIFIER_SEARCH, build_pipeline, search, write_report
+
 
 def main():
     if len(sys.argv) < 2:
@@ -38,7 +49,7 @@ def main():
     
     # Load data
     print(f"Loading data from {csv_file}...")
-    df = pd.read_csv(csv_path)
+    df = read_frame(csv_path, 'type_classifier')  # CSV, or the training store (.sqlite3)
     
     # Basic checks
     if df.empty:
@@ -59,7 +70,7 @@ def main():
     print(f"Text length stats:\n{df['text'].str.len().describe()}")
     
     # Prepare data
-    X = df['text'].astype(str)  # Ensure strings
+    X = df['text'].astype(str).map(normalize_text)  # Same normalization as serving
     y = df['label'].astype(int)
     
     # Train/test split (80/20)
@@ -77,20 +88,31 @@ def main():
     print("TRAINING TYPE CLASSIFIER")
     print(f"{'='*70}")
     
-    pipeline = Pipeline([
-        ('tfidf', TfidfVectorizer(
-            max_features=5000,
-            min_df=2,
-            max_df=0.8,
-            ngram_range=(1, 2),
-            stop_words='english'
-        )),
-        ('classifier', LogisticRegression(
-            max_iter=1000,
-            random_state=42,
-            class_weight='balanced'  # Handle imbalance
-        ))
-    ])
+    # Cross-validated search on the training split; the test split stays held out
+    search_report = search(X_train.tolist(), y_train.tolist()) if ML_CLASSIFIER_SEARCH else None
+    if ML_CLASSIFIER_SEARCH and search_report is None:
+        print("⚠ Search skipped (too few samples per class), training with the fixed settings")
+    if search_report is not None:
+        best = search_report['best']
+        print(f"✓ Searched {search_report['candidates']} candidates x {search_report['folds']} folds "
+              f"in {search_report['seconds']}s ({search_report['workers']} workers)")
+        print(f"  Best: {best['params']} (CV F1 {best['f1_mean']:.4f} ± {best['f1_std']:.4f})")
+        pipeline = build_pipeline(best['params'])
+    else:
+        pipeline = Pipeline([
+            ('tfidf', TfidfVectorizer(
+                max_features=5000,
+                min_df=2,
+                max_df=0.8,
+                ngram_range=(1, 2),
+                stop_words='english'
+            )),
+            ('classifier', LogisticRegression(
+                max_iter=1000,
+                random_state=42,
+                class_weight='balanced'  # Handle imbalance
+            ))
+        ])
     
     # Train
     pipeline.fit(X_train, y_train)
@@ -129,10 +151,22 @@ def main():
     model_dir = Path(__file__).parent / 'models'
     model_dir.mkdir(exist_ok=True)
     
+    # Write to a temp file and rename so readers never see a partial model
     model_path = model_dir / 'type_classifier.joblib'
-    joblib.dump(pipeline, model_path)
+    tmp_path = model_dir / 'type_classifier.joblib.tmp'
+    joblib.dump(pipeline, tmp_path)
+    os.replace(tmp_path, model_path)
     print(f"\n✓ Model saved to {model_path}")
     
+    # Compact export used for serving; drop it if it does not match the pipeline
+    compact_path = export_compact(pipeline, model_dir / 'type_classifier.npz')
+    parity = verify_parity(pipeline, CompactScorer.load(compact_path), X_test)
+    if parity > PARITY_TOLERANCE:
+        compact_path.unlink()
+        print(f"✗ Compact export differs from pipeline (max |Δp|={parity:.2e}), not saved")
+    else:
+        print(f"✓ Compact model saved to {compact_path} (max |Δp|={parity:.2e})")
+    
     # Save metadata
     metadata = {
         'model_type': 'LogisticRegression + TF-IDF (Type Classifier)',
@@ -148,6 +182,15 @@ def main():
         'label_distribution': df['label'].value_counts().to_dict(),
     }
     
+    # Search report, versioned with the model; drop a stale one from an earlier search
+    report_path = model_dir / 'type_classifier_search_report.json'
+    if search_report is not None:
+        write_report(search_report, report_path)
+        metadata['search'] = {'mode': search_report['mode'], 'params': search_report['best']['params']}
+        print(f"✓ Search report saved to {report_path}")
+    elif report_path.exists():
+        report_path.unlink()
+    
     metadata_path = model_dir / 'type_classifier_metadata.json'
     with open(metadata_path, 'w') as f:
         json.dump(metadata, f, indent=2)
@@ -3,63 +3,57 @@ Type classifier utility to load and use the trained type classifier model.
 Classifies transactions as debit (1) or credit (0).
 """
 
-import joblib
-from pathlib import Path
 import logging
+from typing import Optional
 
-logger = logging.getLogger(__name__)
+from app.ml import domain_prior
+from app.ml.registry import registry
+from app.ml.preprocess import normalize_text
 
-# Singleton model instance
-_type_classifier_model = None
-_model_loaded = False
+logger = logging.getLogger(__name__)
 
 
 def load_type_classifier_model():
-    """Load the trained type classifier model. Cached after first load."""
-    global _type_classifier_model, _model_loaded
-    
-    if _model_loaded:
-        return _type_classifier_model
-    
-    model_path = Path(__file__).parent / 'models' / 'type_classifier.joblib'
-    
-    if not model_path.exists():
-        logger.warning(f"Type classifier model not found at {model_path}")
-        return None
-    
-    try:
-        _type_classifier_model = joblib.load(model_path)
-        _model_loaded = True
-        logger.info(f"Type classifier model loaded from {model_path}")
-        return _type_classifier_model
-    except Exception as e:
-        logger.error(f"Error loading type classifier model: {e}")
-        return None
+    """Return the active type classifier model from the registry."""
+    loaded = registry.get_model("type_classifier")
+    return loaded.model if loaded else None
 
 
-def reload_type_classifier_model():
-    """Force reload the trained type classifier model."""
-    global _type_classifier_model, _model_loaded
-    _type_classifier_model = None
-    _model_loaded = False
-    return load_type_classifier_model()
+def _build_result(label: int, proba, source: str) -> dict:
+    return {
+        'label': label,
+        'type': 'debit' if label == 1 else 'credit',
+        'confidence': float(max(proba)),
+        'probabilities': {
+            'credit': float(proba[0]),
+            'debit': float(proba[1])
+        },
+        'source': source,
+    }
 
 
-def classify_transaction_type(email_body: str) -> dict:
+def classify_transaction_type(email_body: str, from_email: Optional[str] = None) -> dict:
     """
     Classify a transaction email as debit (1) or credit (0).
     
     Args:
         email_body: Raw transaction email text
+        from_email: Optional sender; enables the sender-domain prior
     
     Returns:
         {
             'label': 0 or 1,
             'type': 'credit' or 'debit',
             'confidence': float (0.0-1.0),
-            'probabilities': {'credit': float, 'debit': float}
+            'probabilities': {'credit': float, 'debit': float},
+            'source': 'model', 'domain_prior' or 'model+prior'
         }
     """
+    # Senders that only ever produced one type skip the model
+    prior = domain_prior.shortcut("type_classifier", from_email)
+    if prior is not None:
+        return _build_result(prior[0], prior[1], 'domain_prior')
+
     model = load_type_classifier_model()
     if model is None:
         return {
@@ -71,20 +65,13 @@ def classify_transaction_type(email_body: str) -> dict:
         }
     
     try:
-        # Predict label and probabilities
-        label = int(model.predict([email_body])[0])
-        proba = model.predict_proba([email_body])[0]
-        confidence = float(max(proba))
+        # Predict probabilities on the normalized body, biased for sparse senders
+        text = normalize_text(email_body)
+        proba = [float(p) for p in model.predict_proba([text])[0]]
+        proba, biased = domain_prior.bias("type_classifier", from_email, proba)
+        label = int(proba[1] > proba[0])
         
-        return {
-            'label': label,
-            'type': 'debit' if label == 1 else 'credit',
-            'confidence': confidence,
-            'probabilities': {
-                'credit': float(proba[0]),
-                'debit': float(proba[1])
-            }
-        }
+        return _build_result(label, proba, 'model+prior' if biased else 'model')
     except Exception as e:
         logger.error(f"Error classifying transaction type: {e}")
         return {
@@ -0,0 +1,112 @@
+"""
+Startup preload and warm-up for the ML models.
+
+Runs once per worker process from the FastAPI lifespan hook: loads every
+model through the registry, then pushes a few representative emails
+through each of them so lazily-allocated buffers and caches are populated
+before real traffic arrives. `/ready` reports not-ready until this has
+succeeded; after a failure it stays not-ready (with the error) until a
+later call succeeds.
+
+Environment:
+    ML_WARMUP_ROUNDS  Warm-up passes over the sample emails (default: 2)
+"""
+
+import os
+import time
+import logging
+
+from app.ml import templates, domain_prior
+from app.ml.registry import registry, MODEL_SPECS
+
+logger = logging.getLogger(__name__)
+
+ML_WARMUP_ROUNDS = int(os.getenv("ML_WARMUP_ROUNDS", "2"))
+
+WARMUP_EMAILS = [
+    "Dear Customer, Rs.1082.00 has been debited from account **1234 to VPA blinkit@ybl "
+    "Blinkit on 18-01-26. Your UPI transaction reference number is 601812345678.",
+    "INR 25,000.00 has been credited to your account XX5678 on 02-02-26 by NEFT from "
+    "ACME PAYROLL. Available balance: INR 1,12,345.67",
+    "Your weekly newsletter is here: top stories, new offers and more. Unsubscribe anytime.",
+]
+
+_PROCESS_STARTED_AT = time.time()
+
+_state = {
+    "ready": False,
+    "started_at": None,
+    "finished_at": None,
+    "models": {},
+    "warmup_ms": None,
+    "error": None,
+}
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def preload_and_warm() -> dict:
+    """
+    Load all models and run warm-up inference. Safe to call more than once;
+    already-loaded models are not reloaded, and a worker forked after a
+    successful preload (app/serve.py) returns straight away.
+    """
+    from app.ml.classifier import classify_email_func
+    from app.ml.type_classifier import classify_transaction_type
+    from app.ml.joint_classifier import classify_joint
+    from app.ml.ner import extract_entities
+
+    if _state["ready"] and not _state["error"]:
+        return get_readiness()
+
+    _state["started_at"] = time.time()
+    _state["ready"] = False
+    _state["error"] = None
+
+    try:
+        for name in MODEL_SPECS:
+            loaded = registry.load_active(name)
+            _state["models"][name] = {
+                "version": loaded.version if loaded else None,
+                "load_ms": loaded.load_ms if loaded else 0.0,
+            }
+            logger.info(f"Preloaded {name} ({_state['models'][name]['load_ms']} ms)")
+
+        start = time.perf_counter()
+        templates.rebuild_index()
+        domain_prior.rebuild_all()
+        _state["models"]["indexes"] = {"version": None, "load_ms": _elapsed_ms(start)}
+
+        start = time.perf_counter()
+        for _ in range(ML_WARMUP_ROUNDS):
+            for email in WARMUP_EMAILS:
+                classify_email_func(email)
+                classify_transaction_type(email)
+                classify_joint(email)
+                extract_entities(email)
+        _state["warmup_ms"] = _elapsed_ms(start)
+        logger.info(f"ML warm-up finished ({_state['warmup_ms']} ms)")
+        _state["ready"] = True
+
+    except Exception as e:
+        # Requests are still answered, but /ready keeps traffic away
+        logger.exception(f"ML preload failed: {e}")
+        _state["error"] = str(e)
+
+    _state["finished_at"] = time.time()
+    return get_readiness()
+
+
+def get_readiness() -> dict:
+    return {
+        "ready": _state["ready"] and not _state["error"],
+        "models": dict(_state["models"]),
+        "warmup_ms": _state["warmup_ms"],
+        "error": _state["error"],
+    }
+
+
+def get_uptime_seconds() -> float:
+    return round(time.time() - _PROCESS_STARTED_AT, 1)
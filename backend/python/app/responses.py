@@ -0,0 +1,54 @@
+"""
+Response helpers for the ML endpoints: lean mode and direct JSON rendering.
+
+Lean mode (`?lean=1` or `X-Response-Mode: lean`) drops what the caller
+already has or does not need: the echoed email `text`, per-class
+`probabilities` (the `confidence` of the chosen label stays) and null
+fields. Which fields go is declared per schema in `LEAN_EXCLUDE`.
+
+`ModelJSONResponse` renders the already-validated response model with
+pydantic-core's JSON serializer in one step, instead of FastAPI validating
+the returned model again against `response_model` before encoding it.
+
+Responses larger than ML_GZIP_MIN_BYTES are gzipped for clients that send
+`Accept-Encoding: gzip` (batch and NDJSON results compress well; a single
+classification does not reach the threshold).
+
+Environment:
+    ML_GZIP_MIN_BYTES  Smallest response body that gets compressed (default: 1024)
+    ML_GZIP_LEVEL      gzip level 1-9, 0 disables compression (default: 5)
+"""
+
+import os
+from typing import Optional
+
+from fastapi import Header, Query
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+ML_GZIP_MIN_BYTES = int(os.getenv("ML_GZIP_MIN_BYTES", "1024"))
+ML_GZIP_LEVEL = int(os.getenv("ML_GZIP_LEVEL", "5"))
+
+
+def lean_response(
+    lean: bool = Query(False, description="Omit echoed text, probabilities and null fields"),
+    x_response_mode: Optional[str] = Header(None),
+) -> bool:
+    """Dependency: whether the caller asked for a lean response."""
+    return lean or (x_response_mode or "").strip().lower() == "lean"
+
+
+class ModelJSONResponse(Response):
+    media_type = "application/json"
+
+    def __init__(self, content: BaseModel, lean: bool = False, **kwargs):
+        self.lean = lean
+        super().__init__(content, **kwargs)
+
+    def render(self, content: BaseModel) -> bytes:
+        if not self.lean:
+            return content.model_dump_json().encode("utf-8")
+        return content.model_dump_json(
+            exclude=getattr(content, "LEAN_EXCLUDE", None),
+            exclude_none=True,
+        ).encode("utf-8")
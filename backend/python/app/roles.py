@@ -0,0 +1,64 @@
+"""
+Service roles: which routers a process mounts.
+
+The optimizer and the ML endpoints pull in very different libraries
+(yfinance / PyPortfolioOpt / cvxpy vs spaCy / sklearn). A deployment that
+only serves one side sets SERVICE_ROLES and never imports the other one.
+Routers are imported only for enabled roles; the import time of each is
+logged at startup and reported by `/health`.
+
+Environment:
+    SERVICE_ROLES  Comma-separated roles to serve: ml, optimize (default: ml,optimize)
+"""
+
+import os
+import time
+import logging
+import importlib
+from typing import Dict, List
+
+from fastapi import APIRouter
+
+logger = logging.getLogger(__name__)
+
+# role → router module, imported only when the role is enabled
+ROLE_ROUTERS = {
+    "ml": "app.routers.ml",
+    "optimize": "app.routers.optimize",
+}
+
+SERVICE_ROLES = [
+    role.strip().lower()
+    for role in os.getenv("SERVICE_ROLES", ",".join(ROLE_ROUTERS)).split(",")
+    if role.strip()
+]
+
+_import_ms: Dict[str, float] = {}
+
+
+def has_role(role: str) -> bool:
+    return role in SERVICE_ROLES
+
+
+def load_routers() -> List[APIRouter]:
+    """Import the routers of the enabled roles, timing each import."""
+    unknown = [role for role in SERVICE_ROLES if role not in ROLE_ROUTERS]
+    if unknown:
+        raise ValueError(
+            f"Unknown SERVICE_ROLES: {', '.join(unknown)} (expected: {', '.join(ROLE_ROUTERS)})"
+        )
+
+    routers = []
+    for role in SERVICE_ROLES:
+        start = time.perf_counter()
+        module = importlib.import_module(ROLE_ROUTERS[role])
+        _import_ms[role] = round((time.perf_counter() - start) * 1000, 1)
+        routers.append(module.router)
+
+    report = ", ".join(f"{role}={ms} ms" for role, ms in _import_ms.items())
+    logger.info(f"Service roles: {', '.join(SERVICE_ROLES)} (router imports: {report})")
+    return routers
+
+
+def get_import_report() -> Dict[str, float]:
+    return dict(_import_ms)
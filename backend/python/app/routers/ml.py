@@ -2,34 +2,63 @@
 ML router for classifier, type classifier, and NER endpoints.
 """
 
-from fastapi import APIRouter
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from app.schemas import (
     ClassifyEmailRequest, ClassifyEmailResponse,
-    ClassifyTransactionTypeRequest, ClassifyTransactionTypeResponse,
+    ClassifyTransactionTypeRequest, ClassifyTransactionTypeResponse, ClassifyJointResponse,
     ExtractEntitiesRequest, ExtractEntitiesResponse, RetrainNerRequest, RetrainNerResponse,
     RetrainClassifierRequest, RetrainClassifierResponse,
     RetrainTypeClassifierRequest, RetrainTypeClassifierResponse,
+    ModelStatusResponse, RollbackModelResponse, MetricsResponse,
+    RetrainJobStatus, RetrainJobListResponse,
 )
 from app.controllers.ml import (
     classify_email,
     classify_txn_type,
+    classify_joint_email,
+    process_email_stream,
     extract_ner_entities,
     retrain_ner_model,
+    rebuild_ner_model,
     retrain_classifier_model,
     retrain_type_classifier_model,
+    get_job_status,
+    list_retraining_jobs,
+    get_model_status,
+    rollback_model,
+    get_metrics,
 )
+from app.ml.executor import run_inference
+from app.responses import ModelJSONResponse, lean_response
 
 router = APIRouter(prefix="/ml", tags=["ml"])
 
 
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that does not listen for disconnects on `receive`:
+    the request body is still being read from it while results stream
+    out. A disconnect surfaces through the body reader instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
 @router.post("/classify-email", response_model=ClassifyEmailResponse)
-async def classify_email_endpoint(request: ClassifyEmailRequest) -> ClassifyEmailResponse:
+async def classify_email_endpoint(
+    request: ClassifyEmailRequest, lean: bool = Depends(lean_response)
+) -> ModelJSONResponse:
     """
     Classify an email as transaction or non-transaction.
     
     Request:
         {
-            "email_body": "Rs.1082.00 has been debited..."
+            "email_body": "Rs.1082.00 has been debited...",
+            "from_email": "alerts@hdfcbank.net"  // optional, enables the domain prior
         }
     
     Response:
@@ -40,21 +69,25 @@ async def classify_email_endpoint(request: ClassifyEmailRequest) -> ClassifyEmai
             "probabilities": {
                 "non_transaction": 0.0477,
                 "transaction": 0.9523
-            }
+            },
+            "source": "model"
         }
     """
-    result = classify_email(request.email_body)
-    return ClassifyEmailResponse(**result)
+    result = await run_inference(classify_email, request.email_body, request.from_email)
+    return ModelJSONResponse(ClassifyEmailResponse(**result), lean=lean)
 
 
 @router.post("/classify-txn-type", response_model=ClassifyTransactionTypeResponse)
-async def classify_txn_type_endpoint(request: ClassifyTransactionTypeRequest) -> ClassifyTransactionTypeResponse:
+async def classify_txn_type_endpoint(
+    request: ClassifyTransactionTypeRequest, lean: bool = Depends(lean_response)
+) -> ModelJSONResponse:
     """
     Classify a transaction email as debit or credit.
     
     Request:
         {
-            "email_body": "Rs.1082.00 has been debited to account..."
+            "email_body": "Rs.1082.00 has been debited to account...",
+            "from_email": "alerts@hdfcbank.net"  // optional, enables the domain prior
         }
     
     Response:
@@ -65,21 +98,88 @@ async def classify_txn_type_endpoint(request: ClassifyTransactionTypeRequest) ->
             "probabilities": {
                 "credit": 0.0766,
                 "debit": 0.9234
-            }
+            },
+            "source": "model"
         }
     """
-    result = classify_txn_type(request.email_body)
-    return ClassifyTransactionTypeResponse(**result)
+    result = await run_inference(classify_txn_type, request.email_body, request.from_email)
+    return ModelJSONResponse(ClassifyTransactionTypeResponse(**result), lean=lean)
+
+
+@router.post("/classify-joint", response_model=ClassifyJointResponse)
+async def classify_joint_endpoint(
+    request: ClassifyEmailRequest, lean: bool = Depends(lean_response)
+) -> ModelJSONResponse:
+    """
+    Transaction-or-not and debit-or-credit in one model call (requires a
+    trained joint classifier, see train_joint_classifier.py).
+    
+    Request:
+        {
+            "email_body": "Rs.1082.00 has been debited...",
+            "from_email": "alerts@hdfcbank.net"  // optional, enables the domain prior
+        }
+    
+    Response:
+        {
+            "transaction": {
+                "label": 1,
+                "is_transaction": true,
+                "confidence": 0.9523,
+                "probabilities": {"non_transaction": 0.0477, "transaction": 0.9523},
+                "source": "model"
+            },
+            "type": {
+                "label": 1,
+                "type": "debit",
+                "confidence": 0.9234,
+                "probabilities": {"credit": 0.0766, "debit": 0.9234},
+                "source": "model"
+            },
+            "model_version": "joint_classifier_v1"
+        }
+    """
+    result = await run_inference(classify_joint_email, request.email_body, request.from_email)
+    return ModelJSONResponse(ClassifyJointResponse(**result), lean=lean)
+
+
+@router.post("/process-stream")
+async def process_stream_endpoint(
+    request: Request, lean: bool = Depends(lean_response)
+) -> StreamingResponse:
+    """
+    Bulk classify + type + NER for mailbox backfills. The body is NDJSON,
+    one email per line; results stream back as NDJSON in input order while
+    the upload is still in progress.
+    
+    Request (Content-Type: application/x-ndjson):
+        {"id": "msg-1", "email_body": "Rs.1082.00 has been debited...", "from_email": "alerts@hdfcbank.net"}
+        {"id": "msg-2", "email_body": "Your weekly newsletter..."}
+    
+    Response (application/x-ndjson):
+        {"index": 0, "id": "msg-1", "classification": {...}, "type": {...}, "entities": [...], "path": "model", "model_version": "ner_v3"}
+        {"index": 1, "id": "msg-2", "classification": {...}, "type": null, "entities": null, ...}
+    
+    Lines that cannot be processed get {"index": n, "id": ..., "error": "..."}.
+    With ?lean=1 results carry no probabilities or null fields.
+    """
+    return _DuplexStreamingResponse(
+        process_email_stream(request.stream(), lean), media_type="application/x-ndjson"
+    )
 
 
 @router.post("/extract-entities", response_model=ExtractEntitiesResponse)
-async def extract_entities_endpoint(request: ExtractEntitiesRequest) -> ExtractEntitiesResponse:
+async def extract_entities_endpoint(
+    request: ExtractEntitiesRequest, lean: bool = Depends(lean_response)
+) -> ModelJSONResponse:
     """
     Extract named entities (AMOUNT, MERCHANT) from an email.
     
     Request:
         {
-            "email_body": "Dear Customer, Rs.500.00 has been debited from account to Blinkit on 18-01-26..."
+            "email_body": "Dear Customer, Rs.500.00 has been debited from account to Blinkit on 18-01-26...",
+            "labels": ["AMOUNT", "MERCHANT"],  // optional, default: all
+            "from_email": "alerts@hdfcbank.net"  // optional, enables template matching
         }
     
     Response:
@@ -90,7 +190,8 @@ async def extract_entities_endpoint(request: ExtractEntitiesRequest) -> ExtractE
                     "text": "500.00",
                     "label": "AMOUNT",
                     "start": 25,
-                    "end": 31
+                    "end": 31,
+                    "value": 500.0
                 },
                 {
                     "text": "Blinkit",
@@ -98,38 +199,104 @@ async def extract_entities_endpoint(request: ExtractEntitiesRequest) -> ExtractE
                     "start": 87,
                     "end": 94
                 }
-            ]
+            ],
+            "model_version": "ner_v3",
+            "path": "model"
         }
     """
-    result = extract_ner_entities(request.email_body)
-    return ExtractEntitiesResponse(**result)
+    result = await run_inference(
+        extract_ner_entities, request.email_body, request.labels, request.from_email
+    )
+    return ModelJSONResponse(ExtractEntitiesResponse(**result), lean=lean)
 
 @router.post("/retrain", response_model=RetrainNerResponse)
-async def retrain_endpoint(request: RetrainNerRequest) -> RetrainNerResponse:
+def retrain_endpoint(request: RetrainNerRequest) -> RetrainNerResponse:
     """
-    Append new NER samples and retrain spaCy model.
+    Append new NER samples and queue a fine-tune of the active spaCy model.
+    Requests made while a retrain is waiting share its job.
     """
     result = retrain_ner_model(request.samples)
     return RetrainNerResponse(**result)
 
 
+@router.post("/rebuild-ner", response_model=RetrainNerResponse)
+def rebuild_ner_endpoint() -> RetrainNerResponse:
+    """
+    Retrain NER from scratch on the whole corpus. `/ml/retrain` fine-tunes
+    the active model; call this on a schedule (e.g. nightly) to rebuild it.
+    """
+    result = rebuild_ner_model()
+    return RetrainNerResponse(**result)
+
+
 @router.post("/retrain-classifier", response_model=RetrainClassifierResponse)
-async def retrain_classifier_endpoint(
+def retrain_classifier_endpoint(
     request: RetrainClassifierRequest,
 ) -> RetrainClassifierResponse:
     """
-    Append new classifier samples and retrain email classifier.
+    Append new classifier samples and queue an email classifier retrain.
+    With ML_CLASSIFIER_FAMILY=online, small batches are applied with
+    partial_fit before the response (hence a sync endpoint, run in the threadpool).
     """
     result = retrain_classifier_model(request.samples)
     return RetrainClassifierResponse(**result)
 
 
 @router.post("/retrain-txn-type", response_model=RetrainTypeClassifierResponse)
-async def retrain_type_classifier_endpoint(
+def retrain_type_classifier_endpoint(
     request: RetrainTypeClassifierRequest,
 ) -> RetrainTypeClassifierResponse:
     """
-    Append new type classifier samples and retrain transaction type classifier.
+    Append new type classifier samples and queue a transaction type classifier retrain.
+    With ML_CLASSIFIER_FAMILY=online, small batches are applied with
+    partial_fit before the response.
     """
     result = retrain_type_classifier_model(request.samples)
     return RetrainTypeClassifierResponse(**result)
+
+
+@router.get("/jobs", response_model=RetrainJobListResponse)
+def list_jobs_endpoint(
+    model: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+) -> RetrainJobListResponse:
+    """
+    Most recent retraining jobs, optionally for one model.
+    """
+    return RetrainJobListResponse(**list_retraining_jobs(model, limit))
+
+
+@router.get("/jobs/{job_id}", response_model=RetrainJobStatus)
+def job_status_endpoint(job_id: int) -> RetrainJobStatus:
+    """
+    Status of a retraining job (`job_id` from a retrain response), with the
+    latest training progress event and the version it promoted.
+    """
+    return RetrainJobStatus(**get_job_status(job_id))
+
+
+@router.get("/models", response_model=ModelStatusResponse)
+async def model_status_endpoint() -> ModelStatusResponse:
+    """
+    Active, loaded and retained versions for every model in the registry.
+    """
+    return ModelStatusResponse(**get_model_status())
+
+
+@router.post("/models/{name}/rollback", response_model=RollbackModelResponse)
+async def rollback_model_endpoint(name: str) -> RollbackModelResponse:
+    """
+    Re-activate the previously promoted version of `ner`, `classifier`,
+    `type_classifier` or `joint_classifier`.
+    """
+    result = rollback_model(name)
+    return RollbackModelResponse(**result)
+
+
+@router.get("/metrics", response_model=MetricsResponse)
+async def metrics_endpoint() -> MetricsResponse:
+    """
+    Serving-path counters (which NER path answered, template hits and
+    fallbacks) and the size of the learned template index.
+    """
+    return MetricsResponse(**get_metrics())
@@ -1,4 +1,4 @@
-from typing import List, Dict, Optional, Tuple
+from typing import Any, ClassVar, List, Dict, Optional, Tuple
 
 from pydantic import BaseModel
 
@@ -17,6 +17,7 @@ class OptimizeResponse(BaseModel):
 class ClassifyEmailRequest(BaseModel):
     """Request body for email classification."""
     email_body: str
+    from_email: Optional[str] = None  # sender, enables the domain prior
 
 
 class ClassifyEmailResponse(BaseModel):
@@ -24,13 +25,17 @@ class ClassifyEmailResponse(BaseModel):
     label: Optional[int]  # 0 = non-transaction, 1 = transaction
     is_transaction: Optional[bool]
     confidence: float
-    probabilities: Dict
+    probabilities: Dict[str, float]
+    source: Optional[str] = None  # 'model', 'domain_prior' or 'model+prior'
     error: Optional[str] = None
 
+    LEAN_EXCLUDE: ClassVar[Any] = {"probabilities"}  # dropped in lean mode, see app/responses.py
+
 
 class ClassifyTransactionTypeRequest(BaseModel):
     """Request body for transaction type classification."""
     email_body: str
+    from_email: Optional[str] = None  # sender, enables the domain prior
 
 
 class ClassifyTransactionTypeResponse(BaseModel):
@@ -38,9 +43,21 @@ class ClassifyTransactionTypeResponse(BaseModel):
     label: Optional[int]  # 0 = credit, 1 = debit
     type: Optional[str]  # 'credit' or 'debit'
     confidence: float
-    probabilities: Dict
+    probabilities: Dict[str, float]
+    source: Optional[str] = None  # 'model', 'domain_prior' or 'model+prior'
     error: Optional[str] = None
 
+    LEAN_EXCLUDE: ClassVar[Any] = {"probabilities"}
+
+
+class ClassifyJointResponse(BaseModel):
+    """Response for single-pass transaction + type classification."""
+    transaction: ClassifyEmailResponse
+    type: ClassifyTransactionTypeResponse  # conditional on being a transaction
+    model_version: Optional[str] = None
+
+    LEAN_EXCLUDE: ClassVar[Any] = {"transaction": {"probabilities"}, "type": {"probabilities"}}
+
 
 class EntityData(BaseModel):
     """Single extracted entity."""
@@ -48,11 +65,14 @@ class EntityData(BaseModel):
     label: str  # 'AMOUNT' or 'MERCHANT'
     start: int
     end: int
+    value: Optional[float] = None  # parsed amount for AMOUNT entities
 
 
 class ExtractEntitiesRequest(BaseModel):
     """Request body for NER entity extraction."""
     email_body: str
+    labels: Optional[List[str]] = None  # entities the caller needs (default: all)
+    from_email: Optional[str] = None  # sender, enables template matching
 
 
 class ExtractEntitiesResponse(BaseModel):
@@ -60,12 +80,16 @@ class ExtractEntitiesResponse(BaseModel):
     text: str
     entities: List[EntityData]
     model_version: Optional[str] = None
+    path: Optional[str] = None  # 'template', 'rules', 'model' or 'model+rules'
     error: Optional[str] = None
 
+    LEAN_EXCLUDE: ClassVar[Any] = {"text"}  # the caller sent the text
+
 # schemas for retraining.
 class NerTrainingSample(BaseModel):
     text: str
     entities: List[Tuple[int, int, str]]
+    source_domain: Optional[str] = None  # sender, used for template learning
 
 class RetrainNerRequest(BaseModel):
     samples: List[NerTrainingSample]
@@ -74,6 +98,7 @@ class RetrainNerResponse(BaseModel):
     success: bool
     samples_added: int
     message: str
+    job_id: Optional[int] = None  # queued retraining job, see /ml/jobs/{job_id}
 
 # schemas for classifier retraining.
 class ClassifierTrainingSample(BaseModel):
@@ -94,6 +119,7 @@ class RetrainClassifierResponse(BaseModel):
     success: bool
     samples_added: int
     message: str
+    job_id: Optional[int] = None  # queued retraining job, see /ml/jobs/{job_id}
 
 class RetrainTypeClassifierRequest(BaseModel):
     samples: List[TypeClassifierTrainingSample]
@@ -102,3 +128,69 @@ class RetrainTypeClassifierResponse(BaseModel):
     success: bool
     samples_added: int
     message: str
+    job_id: Optional[int] = None  # queued retraining job, see /ml/jobs/{job_id}
+
+# schemas for the retraining job queue.
+class RetrainJobStatus(BaseModel):
+    id: int
+    queue: str  # model the job retrains
+    mode: Optional[str]
+    status: str  # queued, running, succeeded, failed
+    requests: int  # retrain requests coalesced into this job
+    samples: int
+    attempts: int
+    created_at: str
+    started_at: Optional[str]
+    heartbeat_at: Optional[str]
+    finished_at: Optional[str]
+    version: Optional[str]  # version promoted by the job
+    error: Optional[str]
+    progress: Optional[Dict[str, Any]]  # last NER training progress event
+
+class RetrainJobListResponse(BaseModel):
+    jobs: List[RetrainJobStatus]
+
+# schemas for the model registry.
+class ModelVersionStatus(BaseModel):
+    active: Optional[str]
+    loaded: Optional[str]
+    history: List[str]
+    versions: List[str]
+
+class ModelStatusResponse(BaseModel):
+    models: Dict[str, ModelVersionStatus]
+
+class RollbackModelResponse(BaseModel):
+    success: bool
+    model: str
+    target_version: str
+    message: str
+
+# schemas for health / readiness.
+class InferencePoolStats(BaseModel):
+    workers: int
+    max_queue: int
+    in_flight: int
+    timeout_seconds: float
+
+class HealthResponse(BaseModel):
+    status: str
+    uptime_seconds: float
+    inference: InferencePoolStats
+    roles: List[str]  # enabled SERVICE_ROLES
+    import_ms: Dict[str, float]  # router import time per role
+
+class ModelLoadTiming(BaseModel):
+    version: Optional[str]
+    load_ms: float
+
+class ReadinessResponse(BaseModel):
+    ready: bool
+    models: Dict[str, ModelLoadTiming]
+    warmup_ms: Optional[float] = None
+    error: Optional[str] = None
+
+class MetricsResponse(BaseModel):
+    counters: Dict[str, int]
+    templates: Dict[str, int]
+    domain_prior: Dict[str, int]  # senders indexed per classifier
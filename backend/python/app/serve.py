@@ -0,0 +1,162 @@
+"""
+Pre-fork server for running several uvicorn workers per container.
+
+The parent process loads and warms up every model once, freezes the heap
+(`gc.freeze()`) and then forks the workers. Workers share the model pages
+copy-on-write with the parent, and the classifier arrays are memory-mapped
+from their artifacts (see `app/ml/registry.py`), so each extra worker only
+costs its own interpreter state and request buffers instead of a full copy
+of every model.
+
+All workers accept on one listening socket bound by the parent. A worker
+that dies is replaced; SIGTERM/SIGINT stop all of them.
+
+Each worker polls the model manifest and the training data files, so a
+model promoted or samples appended through one worker reach the others.
+
+Usage:
+    python -m app.serve
+
+Environment:
+    WEB_CONCURRENCY          Number of worker processes (default: 1)
+    HOST                     Bind address (default: 0.0.0.0)
+    PORT                     Bind port (default: 8000)
+    ML_SYNC_INTERVAL_SECONDS How often workers check for updates from other workers (default: 5)
+"""
+
+import os
+import gc
+import time
+import signal
+import socket
+import logging
+import threading
+
+import uvicorn
+
+from app.roles import has_role
+
+logger = logging.getLogger("app.serve")
+
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+ML_SYNC_INTERVAL_SECONDS = float(os.getenv("ML_SYNC_INTERVAL_SECONDS", "5"))
+
+
+# ==========================================================
+# WORKER
+# ==========================================================
+
+def _follow_updates():
+    """Pick up models and training data written by other workers."""
+    from app.ml import templates, domain_prior, store
+    from app.ml.registry import registry
+
+    seen = {dataset: store.change_token(dataset) for dataset in store.DATASETS}
+
+    while True:
+        time.sleep(ML_SYNC_INTERVAL_SECONDS)
+        try:
+            registry.sync()
+            for dataset in store.DATASETS:
+                token = store.change_token(dataset)
+                if token == seen[dataset]:
+                    continue
+                seen[dataset] = token
+                if dataset == "ner":
+                    templates.rebuild_index()
+                else:
+                    domain_prior.rebuild(dataset)
+        except Exception as e:
+            logger.error(f"Worker {os.getpid()} sync failed: {e}")
+
+
+def _run_worker(app, sock: socket.socket) -> None:
+    # The parent's handlers must not run in the worker; uvicorn installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    if WEB_CONCURRENCY > 1 and has_role("ml"):
+        threading.Thread(target=_follow_updates, daemon=True).start()
+
+    config = uvicorn.Config(app, lifespan="on", log_level="info")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(app, sock: socket.socket) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(app, sock)
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    logger.info(f"Started worker {pid}")
+    return pid
+
+
+# ==========================================================
+# PARENT
+# ==========================================================
+
+def _bind() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(message)s")
+
+    from app.main import app
+    from app.ml.warmup import preload_and_warm
+
+    # Load + warm up once, before forking, so workers share the pages
+    if has_role("ml"):
+        readiness = preload_and_warm()
+        logger.info(f"Models preloaded: {readiness['models']}")
+
+    # Keep the collector from touching (and so copying) the preloaded objects
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind()
+    logger.info(f"Listening on http://{HOST}:{PORT} with {WEB_CONCURRENCY} workers")
+
+    workers = {_spawn(app, sock) for _ in range(WEB_CONCURRENCY)}
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not stopping:
+            logger.warning(f"Worker {pid} exited ({status}), restarting")
+            workers.add(_spawn(app, sock))
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,12 @@ Create a spaCy DocBin (.spacy) from a JSONL where each line is:
 
 Usage:
   python scripts/create_docbin_from_jsonl.py input.jsonl output.spacy
+  python scripts/create_docbin_from_jsonl.py input.jsonl output_dir/ --workers 8 [--shard-docs 5000]
+
+With --workers the JSONL is converted in parallel (app/ml/docbin.py) into
+sharded DocBins output_dir/shard-NNNNN.spacy, plus output_dir/report.json
+listing the misaligned spans of each shard. spaCy reads the directory as
+one corpus (e.g. `spacy train --paths.train output_dir`).
 """
 import json
 import sys
@@ -17,12 +23,32 @@ except Exception as e:
     print("ERROR: spaCy import failed:", e)
     sys.exit(2)
 
-if len(sys.argv) < 3:
-    print("Usage: create_docbin_from_jsonl.py input.jsonl output.spacy")
+args = sys.argv[1:]
+options = {}
+for flag in ("--workers", "--shard-docs"):
+    if flag in args:
+        i = args.index(flag)
+        if i + 1 >= len(args) or not args[i + 1].isdigit() or int(args[i + 1]) < 1:
+            print(f"ERROR: {flag} needs a positive number")
+            sys.exit(1)
+        options[flag] = int(args[i + 1])
+        del args[i:i + 2]
+
+if len(args) != 2 or ("--shard-docs" in options and "--workers" not in options):
+    print(__doc__)
     sys.exit(1)
 
-in_path = Path(sys.argv[1])
-out_path = Path(sys.argv[2])
+in_path = Path(args[0])
+out_path = Path(args[1])
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from app.ml.docbin import convert_jsonl, record_to_doc
+
+if "--workers" in options:
+    report = convert_jsonl(in_path, out_path, workers=options["--workers"], shard_docs=options.get("--shard-docs", 5000))
+    print(f"Saved {report['docs']} docs to {len(report['shards'])} shards in {out_path}; "
+          f"{report['misaligned']} spans could not be aligned exactly (see {out_path / 'report.json'})")
+    sys.exit(0)
 
 nlp = spacy.blank("en")
 docbin = DocBin()
@@ -31,24 +57,8 @@ warn = 0
 
 with in_path.open('r') as f:
     for line in f:
-        obj = json.loads(line)
-        text = obj.get('text', '')
-        entities = obj.get('entities', [])
-        doc = nlp.make_doc(text)
-        spans = []
-        for ent in entities:
-            if len(ent) < 3:
-                continue
-            start, end, label = ent[0], ent[1], ent[2]
-            span = doc.char_span(start, end, label=label, alignment_mode='contract')
-            if span is None:
-                span = doc.char_span(start, end, label=label, alignment_mode='expand')
-            if span is None:
-                warn += 1
-            else:
-                spans.append(span)
-        if spans:
-            doc.ents = tuple(spans)
+        doc, misaligned = record_to_doc(nlp, json.loads(line))
+        warn += misaligned
         docbin.add(doc)
         count += 1
 
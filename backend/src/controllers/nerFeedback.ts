@@ -19,6 +19,7 @@ export const saveNerFeedback = async (
       modelEntities,
       correctedEntities,
       nerModelVersion,
+      sourceDomain,
     } = req.body;
 
     if (!transactionId || !emailText || !correctedEntities) {
@@ -34,6 +35,7 @@ export const saveNerFeedback = async (
         modelEntities,
         correctedEntities,
         nerModelVersion,
+        sourceDomain,
       },
       {
         new: true,
@@ -94,6 +96,8 @@ export const retrainNerModel = async (
             [amount.start, amount.end, amount.label],
             [merchant.start, merchant.end, merchant.label],
           ],
+          // Python learns sender templates from samples with a domain
+          ...(sample.sourceDomain ? { source_domain: sample.sourceDomain } : {}),
         };
       })
       .filter(Boolean);
@@ -250,7 +250,10 @@ export const syncAccountTransactions = async (
               `RAW TEXT:\n${content.substring(0, 200)}...\n------------------`,
             );
 
-            const result = await processEmailWithPython(content);
+            const result = await processEmailWithPython(
+              content,
+              domain.fromEmail,
+            );
 
             if (result.status === "unavailable") {
               // Store raw email for later processing when Python is available
@@ -339,7 +342,10 @@ export const syncAccountTransactions = async (
             continue;
           }
 
-          const result = await processEmailWithPython(pending.emailBody);
+          const result = await processEmailWithPython(
+            pending.emailBody,
+            domain.fromEmail,
+          );
 
           if (result.status === "unavailable") {
             continue;
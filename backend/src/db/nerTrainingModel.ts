@@ -19,6 +19,8 @@ const NerTrainingSchema = new mongoose.Schema({
 
   nerModelVersion: { type: String }, // model used at time
 
+  sourceDomain: { type: String }, // sender, used for per-sender templates
+
   source: {
     type: String,
     enum: ['user_feedback', 'manual_seed'],
@@ -2,7 +2,7 @@ export interface ClassifyEmailResponse {
   label?: number | null; // 0 = non-transaction, 1 = transaction
   is_transaction?: boolean | null;
   confidence: number;
-  probabilities: Record<string, number>;
+  probabilities?: Record<string, number>; // omitted in lean mode
   error?: string | null;
 }
 
@@ -10,7 +10,7 @@ export interface ClassifyTransactionTypeResponse {
   label?: number | null; // 0 = credit, 1 = debit
   type?: "credit" | "debit" | null;
   confidence: number;
-  probabilities: Record<string, number>;
+  probabilities?: Record<string, number>; // omitted in lean mode
   error?: string | null;
 }
 
@@ -19,12 +19,14 @@ export interface EntityData {
   label: string; // 'AMOUNT' or 'MERCHANT'
   start: number;
   end: number;
+  value?: number | null; // parsed amount for AMOUNT entities
 }
 
 export interface ExtractEntitiesResponse {
-  text: string;
+  text?: string; // omitted in lean mode
   entities: EntityData[];
   model_version?: string;
+  path?: "template" | "rules" | "model" | "model+rules";
   error?: string | null;
 }
 
@@ -35,14 +37,14 @@ export interface TestResultEntry {
     label?: number | null;
     isTransaction?: boolean | null;
     confidence: number;
-    probabilities: Record<string, number>;
+    probabilities?: Record<string, number>;
   };
   typeClassification?:
     | {
         label?: number | null;
         type?: "credit" | "debit" | null;
         confidence: number;
-        probabilities: Record<string, number>;
+        probabilities?: Record<string, number>;
       }
     | { error: string };
   entities?: EntityData[] | { error: string };
@@ -25,11 +25,12 @@ const pythonApiUrl = process.env.PYTHON_API_URL || "http://localhost:8000";
 
 export const processEmailWithPython = async (
   content: string,
+  fromEmail?: string,
 ): Promise<ProcessEmailResult> => {
   // 1. Classify whether this is a transaction email
   let classificationResult: ClassifyEmailResponse | null = null;
   try {
-    const resp = await fetch(`${pythonApiUrl}/ml/classify-email`, {
+    const resp = await fetch(`${pythonApiUrl}/ml/classify-email?lean=1`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ email_body: content }),
@@ -53,7 +54,7 @@ export const processEmailWithPython = async (
   let txnType: "debit" | "credit" = "debit";
   let typeConfidence: number | undefined = undefined;
   try {
-    const resp = await fetch(`${pythonApiUrl}/ml/classify-txn-type`, {
+    const resp = await fetch(`${pythonApiUrl}/ml/classify-txn-type?lean=1`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({ email_body: content }),
@@ -74,10 +75,11 @@ export const processEmailWithPython = async (
   let processedEntities: EntityData[] = [];
   let nerModelName: string | undefined = undefined;
   try {
-    const resp = await fetch(`${pythonApiUrl}/ml/extract-entities`, {
+    const resp = await fetch(`${pythonApiUrl}/ml/extract-entities?lean=1`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ email_body: content }),
+      // from_email lets Python answer from the sender's learned templates
+      body: JSON.stringify({ email_body: content, from_email: fromEmail }),
     });
     if (resp.ok) {
       const ner = (await resp.json()) as ExtractEntitiesResponse;
@@ -98,7 +100,11 @@ export const processEmailWithPython = async (
     const amtEntity = processedEntities.find((e) =>
       /AMOUNT/i.test(e.label || ""),
     ) as EntityData | undefined;
-    if (amtEntity?.text) {
+    if (typeof amtEntity?.value === "number") {
+      // Parsed by Python from the AMOUNT span, whether the rules or the
+      // model found it
+      originalAmount = amtEntity.value;
+    } else if (amtEntity?.text) {
       const raw = amtEntity.text;
 
       let cleaned = raw
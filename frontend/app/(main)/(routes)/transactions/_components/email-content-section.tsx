@@ -270,6 +270,7 @@ export const EmailContentSection = ({
           text,
         })),
         nerModelVersion,
+        sourceDomain,
       }).unwrap()
       toast.success('Feedback successfully saved!', { position: "bottom-center" })
     } catch {
@@ -18,6 +18,7 @@ export interface NerFeedbackPayload {
   correctedEntities: NerEntity[]
 
   nerModelVersion?: string
+  sourceDomain?: string
 }
 
 export interface NerFeedbackResponse {